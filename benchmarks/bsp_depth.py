@@ -0,0 +1,113 @@
+"""
+Throughput of the BSP traversals on very deep trees.
+
+A stack of parallel squares, each one in front of the previous one, produces a
+BSP tree whose depth equals the number of squares. The explicit-stack
+traversals of `BSPNode` are compared with the recursive formulation pycsg used
+to have, which needed a raised recursion limit (and a big enough C stack) to
+get through trees like these.
+
+    $ python benchmarks/bsp_depth.py
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from csg.geom import BSPNode, Polygon, Vertex
+
+def squares(n, z0=0.):
+    polygons = []
+    for i in range(n):
+        z = z0 + i
+        polygons.append(Polygon([Vertex([0., 0., z]), Vertex([1., 0., z]),
+                                 Vertex([1., 1., z]), Vertex([0., 1., z])]))
+    return polygons
+
+# recursive reference implementations
+def buildRecursive(node, polygons):
+    if not node.plane:
+        node.plane = polygons[0].plane.clone()
+    node.polygons.append(polygons[0])
+    front = []
+    back = []
+    node.plane.splitPolygons(polygons[1:], node.polygons, node.polygons,
+                             front, back)
+    if front:
+        if not node.front:
+            node.front = BSPNode()
+        buildRecursive(node.front, front)
+    if back:
+        if not node.back:
+            node.back = BSPNode()
+        buildRecursive(node.back, back)
+
+def clipPolygonsRecursive(node, polygons):
+    if not node.plane:
+        return polygons[:]
+    if not polygons:
+        return []
+    front = []
+    back = []
+    node.plane.splitPolygons(polygons, front, back, front, back)
+    if node.front:
+        front = clipPolygonsRecursive(node.front, front)
+    if node.back:
+        back = clipPolygonsRecursive(node.back, back)
+    else:
+        back = []
+    return front + back
+
+def allPolygonsRecursive(node):
+    polygons = node.polygons[:]
+    if node.front:
+        polygons.extend(allPolygonsRecursive(node.front))
+    if node.back:
+        polygons.extend(allPolygonsRecursive(node.back))
+    return polygons
+
+def invertRecursive(node):
+    node.polygons = [poly.flipped() for poly in node.polygons]
+    node.plane = node.plane.flipped()
+    if node.front:
+        invertRecursive(node.front)
+    if node.back:
+        invertRecursive(node.back)
+    node.front, node.back = node.back, node.front
+
+def timeit(func, *args):
+    t = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - t
+
+def run(depths):
+    print('%8s %-14s %12s %12s %8s' % ('depth', 'traversal', 'iterative', 'recursive', 'ratio'))
+    for depth in depths:
+        polygons = squares(depth)
+        clip = squares(depth, 0.5)
+
+        results = []
+        tree = BSPNode()
+        ref = BSPNode()
+        results.append(('build', timeit(tree.build, polygons),
+                        timeit(buildRecursive, ref, polygons)))
+        results.append(('clipPolygons', timeit(tree.clipPolygons, clip),
+                        timeit(clipPolygonsRecursive, ref, clip)))
+        results.append(('allPolygons', timeit(tree.allPolygons),
+                        timeit(allPolygonsRecursive, ref)))
+        results.append(('invert', timeit(tree.invert),
+                        timeit(invertRecursive, ref)))
+        for name, iterative, recursive in results:
+            print('%8d %-14s %11.4fs %11.4fs %7.2fx' % (
+                depth, name, iterative, recursive, recursive / iterative))
+
+if __name__ == '__main__':
+    depths = [int(d) for d in sys.argv[1:]] or [500, 2000, 4000]
+    # the recursive reference needs room on both the Python and the C stack
+    sys.setrecursionlimit(10 * max(depths) + 1000)
+    threading.stack_size(512 * 1024 * 1024)
+    thread = threading.Thread(target=run, args=(depths,))
+    thread.start()
+    thread.join()
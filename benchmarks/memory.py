@@ -0,0 +1,111 @@
+"""
+Memory use and object churn of the boolean operations.
+
+For each workload the two operands are built and one boolean operation is run
+under `tracemalloc`. The table reports:
+
+    polygons: number of polygons in the result
+    time:     wall time of the operation (without tracing)
+    peak:     peak traced memory during the operation, operands excluded
+    B/poly:   traced memory held by the result per result polygon
+    B/input:  traced memory of the operands per operand polygon
+    followed by the number of Vector, Vertex, Plane, Polygon and BSPNode
+    objects created by the operation.
+
+    $ python benchmarks/memory.py
+    $ python benchmarks/memory.py sphere-cylinder
+"""
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from csg.core import CSG
+from csg.geom import BSPNode, Plane, Polygon, Vector, Vertex
+
+CLASSES = (Vector, Vertex, Plane, Polygon, BSPNode)
+
+WORKLOADS = [
+    ('cube-cube', 'subtract',
+     lambda: (CSG.cube(), CSG.cube(center=[0.5, 0.5, 0.]))),
+    ('sphere-cylinder', 'subtract',
+     lambda: (CSG.sphere(slices=32, stacks=16),
+              CSG.cylinder(start=[0., -2., 0.], end=[0., 2., 0.],
+                           radius=0.4, slices=32))),
+    ('sphere*cube', 'intersect',
+     lambda: (CSG.sphere(slices=32, stacks=16),
+              CSG.cube(center=[0.5, 0.5, 0.5], radius=0.8))),
+    ('sphere+sphere', 'union',
+     lambda: (CSG.sphere(slices=32, stacks=16),
+              CSG.sphere(center=[1.2, 0., 0.], slices=32, stacks=16))),
+    ('cylinder+cone', 'union',
+     lambda: (CSG.cylinder(slices=48),
+              CSG.cone(start=[0., 0., 0.], end=[1., 2., 0.], slices=48))),
+]
+
+def countObjects(func):
+    """
+    Call `func()` and return the number of instances of each class in
+    `CLASSES` created meanwhile.
+    """
+    counts = dict((cls, 0) for cls in CLASSES)
+    originals = dict((cls, cls.__init__) for cls in CLASSES)
+
+    def counting(cls, init):
+        def __init__(self, *args, **kwargs):
+            if type(self) is cls:
+                counts[cls] += 1
+            init(self, *args, **kwargs)
+        return __init__
+
+    for cls in CLASSES:
+        cls.__init__ = counting(cls, originals[cls])
+    try:
+        func()
+    finally:
+        for cls in CLASSES:
+            cls.__init__ = originals[cls]
+    return [counts[cls] for cls in CLASSES]
+
+def measure(make, op):
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    a, b = make()
+    inputBytes = tracemalloc.get_traced_memory()[0] - base
+    numInput = len(a.polygons) + len(b.polygons)
+
+    gc.collect()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    result = getattr(a, op)(b)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    t = time.perf_counter()
+    getattr(a, op)(b)
+    elapsed = time.perf_counter() - t
+
+    objects = countObjects(lambda: getattr(a, op)(b))
+    numPolygons = len(result.polygons)
+    return ([numPolygons, elapsed, peak - base,
+             (current - base) / max(numPolygons, 1), inputBytes / numInput]
+            + objects)
+
+def run(names):
+    header = ('%-16s %8s %9s %10s %7s %8s' + ' %8s' * len(CLASSES)) % (
+        ('workload', 'polygons', 'time', 'peak', 'B/poly', 'B/input') +
+        tuple(cls.__name__ for cls in CLASSES))
+    print(header)
+    for name, op, make in WORKLOADS:
+        if names and name not in names:
+            continue
+        row = measure(make, op)
+        print(('%-16s %8d %8.3fs %9.0fK %7.0f %8.0f' + ' %8d' * len(CLASSES)) % (
+            tuple([name] + row[:2] + [row[2] / 1024.] + row[3:])))
+
+if __name__ == '__main__':
+    run(sys.argv[1:])
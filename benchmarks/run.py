@@ -0,0 +1,215 @@
+"""
+Benchmark suite for primitives, boolean operations, refine and export.
+
+Every case is run a few times and reports:
+
+    time:     best wall time of the runs
+    peak:     peak memory traced by `tracemalloc` during one run
+    polygons: number of polygons of the result
+    depth:    depth of the BSP tree built from the result
+
+Results can be stored as a baseline and later runs compared against it::
+
+    $ python benchmarks/run.py --save baseline.json
+    ... change something ...
+    $ python benchmarks/run.py --compare baseline.json
+    $ python benchmarks/run.py -k sphere --repeat 5
+    $ python benchmarks/run.py --slow
+
+With `--compare` a case counts as a regression if its time or peak memory
+grew by more than `--threshold` (20% by default) or if its polygon count or
+BSP depth changed, and the script exits with status 1 if there is any.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from csg.core import CSG
+from csg.geom import BSPNode
+
+def sphere(slices):
+    return CSG.sphere(slices=slices, stacks=slices // 2)
+
+def sphereCylinder():
+    return (sphere(32), CSG.cylinder(start=[0.2, -2., 0.1], end=[0.3, 2., 0.2],
+                                     radius=0.5, slices=32))
+
+def plateAndHoles():
+    holes = [CSG.cylinder(start=[x, -2., z], end=[x, 2., z], radius=0.3,
+                          slices=16)
+             for x in (-3., -1., 1., 3.) for z in (-2., 0., 2.)]
+    return CSG.cube(radius=[4., 1., 3.]), holes
+
+def chain(plate, holes):
+    for hole in holes:
+        plate = plate - hole
+    return plate
+
+def subtracted():
+    a, b = sphereCylinder()
+    return (a - b,)
+
+def transformChain(csg):
+    csg = CSG.fromPolygons(csg.polygons)
+    for i in range(5):
+        csg.translate([0.1, 0.2, 0.3])
+        csg.rotate([1., 1., 0.], 10.)
+    return CSG.fromPolygons(csg.polygons)
+
+def bolts():
+    bolt = CSG.cylinder(radius=0.2, slices=16) + \
+        CSG.cube(center=[0., 1., 0.], radius=0.3)
+    return bolt, [[[1., 0., 0., x], [0., 1., 0., 0.], [0., 0., 1., z]]
+                  for x in range(0, 40, 2) for z in range(0, 100, 2)]
+
+def saveVTK(csg):
+    fd, path = tempfile.mkstemp(suffix='.vtk')
+    os.close(fd)
+    try:
+        csg.saveVTK(path)
+    finally:
+        os.remove(path)
+
+# name, setup returning the arguments, function timed on them
+CASES = [
+    ('cube', lambda: (), lambda: CSG.cube()),
+    ('sphere-16', lambda: (16,), sphere),
+    ('sphere-64', lambda: (64,), sphere),
+    ('sphere-128', lambda: (128,), sphere),
+    ('cylinder-16', lambda: (), lambda: CSG.cylinder(slices=16)),
+    ('cylinder-256', lambda: (), lambda: CSG.cylinder(slices=256)),
+    ('cone-16', lambda: (), lambda: CSG.cone(slices=16)),
+    ('cone-256', lambda: (), lambda: CSG.cone(slices=256)),
+    ('union-sphere-cylinder', sphereCylinder, lambda a, b: a.union(b)),
+    ('subtract-sphere-cylinder', sphereCylinder, lambda a, b: a.subtract(b)),
+    ('intersect-sphere-cylinder', sphereCylinder, lambda a, b: a.intersect(b)),
+    ('union-sphere-32', lambda: (sphere(32), CSG.sphere(center=[1., 0.2, 0.],
+                                                        slices=32, stacks=16)),
+     lambda a, b: a.union(b)),
+    ('union-sphere-64', lambda: (sphere(64), CSG.sphere(center=[1., 0.2, 0.],
+                                                        slices=64, stacks=32)),
+     lambda a, b: a.union(b)),
+    ('chain-subtract-12', plateAndHoles, chain),
+    ('subtractAll-12', plateAndHoles, lambda plate, holes: plate.subtractAll(holes)),
+    ('unionAll-instances-1000', bolts, lambda bolt, placements: CSG.unionAll(
+        [bolt.instance(m) for m in placements])),
+    ('simplify', lambda: (chain(*plateAndHoles()),), lambda a: a.simplify()),
+    ('transform-chain-10', lambda: (sphere(64),), transformChain),
+    ('refine-sphere-32', lambda: (sphere(32),), lambda a: a.refine()),
+    ('refine-cube-3x', lambda: (CSG.cube(),),
+     lambda a: a.refine().refine().refine()),
+    ('refine-sphere-32-levels-3', lambda: (sphere(32),),
+     lambda a: a.refine(levels=3)),
+    ('toVerticesAndPolygons', subtracted,
+     lambda a: a.toVerticesAndPolygons()),
+    ('saveVTK', subtracted, saveVTK),
+]
+
+# cases that take minutes and only run with --slow
+SLOW = set(['sphere-128', 'union-sphere-64'])
+
+def bspDepth(polygons):
+    """ Return the depth of the BSP tree built from `polygons`. """
+    if not polygons:
+        return 0
+    return BSPNode(polygons).stats()['depth']
+
+def numPolygons(result):
+    if isinstance(result, CSG):
+        return len(result.polygons)
+    if isinstance(result, tuple):
+        # vertices and polygons
+        return len(result[1])
+    return None
+
+def measure(setup, func, repeat):
+    args = setup()
+    times = []
+    for i in range(repeat):
+        gc.collect()
+        t = time.perf_counter()
+        result = func(*args)
+        times.append(time.perf_counter() - t)
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return {'time': min(times), 'peak': peak,
+            'polygons': numPolygons(result),
+            'depth': bspDepth(result.polygons) if isinstance(result, CSG) else None}
+
+def compare(row, ref, threshold):
+    """
+    Return a list of the metrics of `row` that regressed against `ref`.
+    """
+    regressions = []
+    for key in ('time', 'peak'):
+        if ref.get(key) and row[key] > ref[key] * (1. + threshold):
+            regressions.append(key)
+    for key in ('polygons', 'depth'):
+        if key in ref and row[key] != ref[key]:
+            regressions.append(key)
+    return regressions
+
+def run(args):
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['cases']
+    results = {}
+    failed = []
+    print('%-26s %9s %10s %9s %6s' % ('case', 'time', 'peak', 'polygons', 'depth')
+          + ('  %7s %7s' % ('time', 'peak') if baseline else ''))
+    for name, setup, func in CASES:
+        if args.k and args.k not in name or name in SLOW and not args.slow:
+            continue
+        row = measure(setup, func, args.repeat)
+        results[name] = row
+        line = '%-26s %8.4fs %9.0fK %9s %6s' % (
+            name, row['time'], row['peak'] / 1024.,
+            '-' if row['polygons'] is None else row['polygons'],
+            '-' if row['depth'] is None else row['depth'])
+        if baseline and name in baseline:
+            ref = baseline[name]
+            line += '  %6.2fx %6.2fx' % (row['time'] / ref['time'],
+                                         row['peak'] / max(ref['peak'], 1))
+            regressions = compare(row, ref, args.threshold)
+            if regressions:
+                line += '  REGRESSION: ' + ', '.join(regressions)
+                failed.append(name)
+        print(line)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': platform.python_version(),
+                       'machine': platform.machine(),
+                       'cases': results}, f, indent=1, sort_keys=True)
+    return 1 if failed else 0
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='pycsg benchmark suite')
+    parser.add_argument('-k', help='only run cases whose name contains K')
+    parser.add_argument('--slow', action='store_true',
+                        help='also run the cases that take minutes')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of timed runs per case (default 3)')
+    parser.add_argument('--save', metavar='FILE',
+                        help='store the results as a baseline in FILE')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare the results with the baseline in FILE')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative time and memory growth counted as a '
+                        'regression (default 0.2)')
+    return run(parser.parse_args(argv))
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,67 @@
+"""
+Polygon count and timing of `CSG.simplify()`.
+
+Each workload is a chain of boolean operations that fragments flat faces. The
+table reports the number of polygons of the result before and after
+`simplify()`, the time `simplify()` takes, and the time of one more boolean
+operation on the raw and on the simplified result.
+
+    $ python benchmarks/simplify.py
+    $ python benchmarks/simplify.py slots
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from csg.core import CSG
+
+def slots():
+    a = CSG.cube(radius=[4., 1., 4.])
+    for i in range(8):
+        x = i - 3.5
+        a = a - CSG.cube(center=[x, 1., 0.], radius=[0.2, 0.5, 3.])
+    return a
+
+def steps():
+    return CSG.unionAll([CSG.cube(center=[0.5 * i, 0.25 * i, 0.], radius=1.)
+                         for i in range(12)])
+
+def sphereCylinder():
+    a = CSG.sphere(slices=32, stacks=16)
+    for axis in ([1., 0., 0.], [0., 1., 0.], [0., 0., 1.]):
+        a = a - CSG.cylinder(start=[-2. * c for c in axis], end=[2. * c for c in axis],
+                             radius=0.3, slices=32)
+    return a
+
+WORKLOADS = [
+    ('refined-cube', lambda: CSG.cube().refine().refine().refine()),
+    ('slots', slots),
+    ('steps', steps),
+    ('sphere-cylinders', sphereCylinder),
+]
+
+def timed(func):
+    t = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - t
+
+def run(names):
+    print('%-18s %8s %8s %10s %10s %10s' % (
+        'workload', 'polygons', 'merged', 'simplify', 'next op', 'simplified'))
+    tool = CSG.cylinder(start=[0.3, -3., 0.2], end=[0.3, 3., 0.2], radius=0.45,
+                        slices=24)
+    for name, make in WORKLOADS:
+        if names and name not in names:
+            continue
+        a = make()
+        b, simplifyTime = timed(a.simplify)
+        rawTime = timed(lambda: a - tool)[1]
+        simplifiedTime = timed(lambda: b - tool)[1]
+        print('%-18s %8d %8d %9.3fs %9.3fs %9.3fs' % (
+            name, len(a.polygons), len(b.polygons), simplifyTime, rawTime,
+            simplifiedTime))
+
+if __name__ == '__main__':
+    run(sys.argv[1:])
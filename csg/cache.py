@@ -0,0 +1,226 @@
+"""
+Persistent on-disk cache of boolean operation results.
+
+The cache is opt-in. Once enabled, `CSG.union()`, `subtract()` and
+`intersect()` look up their result before doing any BSP work and store it
+afterwards::
+
+    from csg import cache
+    cache.enable('/var/cache/pycsg', maxBytes=512 * 1024 * 1024)
+    ...
+    print(cache.current().stats())
+    cache.disable()
+
+Results are keyed by a hash of the operation, the split strategy,
+`Plane.EPSILON` and the content of both operands (see `CSG.digest()`). Each
+result is stored as one file holding the raw arrays of its `Mesh` and its
+`shared` values as JSON, so only results whose `shared` values are None,
+booleans, numbers or strings are cached. Reading an entry never runs code, but
+anyone who can write to the directory can still make the cache return wrong
+geometry, so use a directory only trusted users can write to.
+When the directory grows beyond `maxBytes`, the least recently used files are
+removed.
+"""
+import hashlib
+import json
+import os
+import struct
+import sys
+import tempfile
+from array import array
+
+from csg.core import CSG
+from csg.geom import Plane
+from csg.mesh import Mesh
+
+class ResultCache(object):
+    """
+    class ResultCache
+
+    Size-bounded LRU cache of CSG results in a local `directory`.
+    """
+
+    # file header: magic, format version, number of values in each array and
+    # number of bytes of the JSON encoded `shared` values
+    MAGIC = b'PCSG'
+    VERSION = 2
+    HEADER = struct.Struct('<4sI6Q')
+    SUFFIX = '.pcsg'
+
+    def __init__(self, directory, maxBytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, op, a, b, splitStrategy=None):
+        """
+        Return the cache key of the boolean operation `op` on the solids `a`
+        and `b`.
+        """
+        h = hashlib.sha256(repr((ResultCache.VERSION, op, splitStrategy,
+                                 Plane.EPSILON)).encode('utf-8'))
+        for csg in (a, b):
+            h.update(csg.digest().encode('ascii'))
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ResultCache.SUFFIX)
+
+    def get(self, key):
+        """
+        Return the CSG solid stored under `key`, or None.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            mesh = ResultCache.decode(data)
+        except (IOError, OSError, ValueError):
+            self.misses += 1
+            return None
+        try:
+            # mark as recently used
+            os.utime(path, None)
+        except OSError:
+            pass
+        self.hits += 1
+        return CSG.fromMesh(mesh)
+
+    def put(self, key, csg):
+        """
+        Store the CSG solid `csg` under `key` and evict old entries if the
+        cache has grown too large. Solids with `shared` values other than
+        None, booleans, numbers and strings are not stored.
+        """
+        try:
+            data = ResultCache.encode(csg.toMesh())
+        except TypeError:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, self._path(key))
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        self.writes += 1
+        self._evict()
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(ResultCache.SUFFIX):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        size = sum(e[1] for e in entries)
+        if size <= self.maxBytes:
+            return
+        entries.sort()
+        for mtime, nbytes, path in entries:
+            if size <= self.maxBytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= nbytes
+            self.evictions += 1
+
+    def size(self):
+        """ Return the number of bytes used by the cache files. """
+        return sum(e[1] for e in self._entries())
+
+    def clear(self):
+        for mtime, nbytes, path in self._entries():
+            os.remove(path)
+
+    def stats(self):
+        """ Return a dict with hit/miss statistics. """
+        return {'hits': self.hits, 'misses': self.misses,
+                'writes': self.writes, 'evictions': self.evictions,
+                'entries': len(self._entries()), 'bytes': self.size()}
+
+    @staticmethod
+    def encode(mesh):
+        """ Return the binary representation of `mesh`. """
+        shared = b''
+        if any(s is not None for s in mesh.shared):
+            for s in mesh.shared:
+                if not (s is None or isinstance(s, (bool, int, float, str))):
+                    raise TypeError('cannot cache shared value %r' % (s,))
+            shared = json.dumps(mesh.shared).encode('utf-8')
+        arrays = (mesh.positions, mesh.normals, mesh.offsets, mesh.indices,
+                  mesh.planes)
+        parts = [ResultCache.HEADER.pack(ResultCache.MAGIC, ResultCache.VERSION,
+                                         *([len(a) for a in arrays] + [len(shared)]))]
+        for a in arrays:
+            if sys.byteorder != 'little':
+                a = array(a.typecode, a)
+                a.byteswap()
+            parts.append(a.tobytes())
+        parts.append(shared)
+        return b''.join(parts)
+
+    @staticmethod
+    def decode(data):
+        """ Return the `Mesh` stored in `data`. """
+        header = ResultCache.HEADER
+        if len(data) < header.size:
+            raise ValueError('truncated cache entry')
+        values = header.unpack_from(data)
+        if values[0] != ResultCache.MAGIC or values[1] != ResultCache.VERSION:
+            raise ValueError('not a pycsg cache entry')
+        mesh = Mesh()
+        offset = header.size
+        for name, count in zip(('positions', 'normals', 'offsets', 'indices',
+                                'planes'), values[2:7]):
+            a = getattr(mesh, name)
+            del a[:]
+            nbytes = count * a.itemsize
+            if offset + nbytes > len(data):
+                raise ValueError('truncated cache entry')
+            a.frombytes(data[offset:offset + nbytes])
+            if sys.byteorder != 'little':
+                a.byteswap()
+            offset += nbytes
+        if values[7]:
+            shared = data[offset:offset + values[7]]
+            if len(shared) != values[7]:
+                raise ValueError('truncated cache entry')
+            mesh.shared = json.loads(shared.decode('utf-8'))
+            if not isinstance(mesh.shared, list) or \
+               len(mesh.shared) != mesh.numPolygons():
+                raise ValueError('corrupt cache entry')
+        else:
+            mesh.shared = [None] * mesh.numPolygons()
+        return mesh
+
+def enable(directory, maxBytes=256 * 1024 * 1024):
+    """
+    Make the boolean operations use a `ResultCache` in `directory` and return
+    it.
+    """
+    CSG.resultCache = ResultCache(directory, maxBytes)
+    return CSG.resultCache
+
+def disable():
+    """ Stop caching boolean operation results. """
+    CSG.resultCache = None
+
+def current():
+    """ Return the `ResultCache` in use, or None. """
+    return CSG.resultCache
@@ -1,7 +1,15 @@
+import hashlib
 import math
-import operator
+import sys
+import time
+from array import array
+from collections import OrderedDict
 from csg.geom import *
-from functools import reduce
+from csg.mesh import Mesh
+from csg.monitor import Monitor
+
+# first three rows of the identity matrix, see `CSG.transform()`
+_IDENTITY = (1., 0., 0., 0., 0., 1., 0., 0., 0., 0., 1., 0.)
 
 class CSG(object):
     """
@@ -47,6 +55,17 @@ class CSG(object):
     Subtraction and intersection naturally follow from set operations. If
     union is `A | B`, subtraction is `A - B = ~(~A | B)` and intersection is
     `A & B = ~(~A | ~B)` where `~` is the complement operator.
+
+    Before any BSP work the bounding boxes of both solids are compared. Disjoint
+    solids are combined directly, and otherwise only polygons that intersect
+    the overlap of both boxes are clipped. Everything outside that box is known
+    to be outside the other solid and is kept or dropped without a BSP query.
+
+    The operations never modify polygons or vertices: inverting a BSP tree
+    replaces its polygons with flipped copies, and results share the vertices
+    of their operands instead of copying them. `transform()` and the
+    `translate()`, `rotate()`, `scale()` and `mirror()` shortcuts replace the
+    polygons of a solid, so they do not affect other solids either. Code that modifies vertices in place should work on a `clone()`.
     
     ## License
     
@@ -55,71 +74,490 @@ class CSG(object):
     Python port Copyright (c) 2012 Tim Knip (http://www.floorplanner.com), under the MIT license.
     Additions by Alex Pletzer (Pennsylvania State University)
     """
+    # `csg.cache.ResultCache` consulted by the boolean operations, or None
+    resultCache = None
+    # `csg.instrument.Profiler` recording the boolean operations, or None
+    profiler = None
+
+    # unit primitives by kind and resolution, least recently used first,
+    # see `_template()`
+    _templates = OrderedDict()
+    TEMPLATE_CACHE_SIZE = 64
+
     def __init__(self):
+        # list of (polygons, matrix) pairs that make up `polygons`, see the
+        # `polygons` property
         self.polygons = []
+        # BSP tree of `polygons` kept by a boolean operation with `retainTree`
+        self._tree = None
+        self._treePolygons = None
     
     @classmethod
     def fromPolygons(cls, polygons):
+        if isinstance(polygons, Mesh):
+            polygons = polygons.toPolygons()
         csg = CSG()
         csg.polygons = polygons
         return csg
+
+    @classmethod
+    def load(cls, filename, asMesh=False):
+        """
+        Read an STL, PLY or OBJ file, see `csg.formats.load()`.
+        """
+        from csg import formats
+        return formats.load(filename, asMesh)
+
+    @classmethod
+    def fromMesh(cls, mesh):
+        """
+        Return a new CSG solid built from the array-backed `mesh`.
+        """
+        return CSG.fromPolygons(mesh.toPolygons())
+
+    @classmethod
+    def _toCSG(cls, obj):
+        # booleans accept both CSG solids and array-backed meshes
+        if isinstance(obj, Mesh):
+            return CSG.fromMesh(obj)
+        return obj
     
     def clone(self):
         csg = CSG()
         csg.polygons = list(map(lambda p: p.clone(), self.polygons))
         return csg
+
+    def _sharedPolygons(self):
+        """
+        Return new polygons for the operands of a CSG operation. They share the
+        vertices of this solid, but their planes are computed again from the
+        vertices, which may have been moved in place after `clone()`. Polygons
+        whose first vertices are collinear, for instance after `simplify()`,
+        get their plane from all of their vertices (see `Plane.fromVertices()`).
+        """
+        return [Polygon(p.vertices, p.shared) for p in self.polygons]
         
     def toPolygons(self):
         return self.polygons
 
-    def refine(self):
+    def lazy(self):
         """
-        Return a refined CSG. To each polygon, a middle point is added to each edge and to the center 
-        of the polygon
+        Return a `csg.lazy.LazyCSG` wrapping this solid, on which booleans and
+        transforms build an expression graph that is evaluated on demand.
         """
-        newCSG = CSG()
+        from csg.lazy import LazyCSG
+        return LazyCSG(self)
+
+    def getBounds(self):
+        """
+        Return the axis-aligned bounding box of this solid as a pair of lists
+        with the minimum and maximum [x, y, z] corner, or None if the solid has
+        no polygons. Parts of the solid still to be transformed (see the
+        `polygons` property) are not copied for this.
+        """
+        lo = hi = None
+        for polygons, matrix in self._parts:
+            if not polygons:
+                continue
+            if matrix is None or matrix == _IDENTITY:
+                bounds = CSG._bounds(polygons)
+            else:
+                bounds = CSG._transformedBounds(polygons, matrix)
+            if lo is None:
+                lo, hi = bounds
+            else:
+                lo = [min(a, b) for a, b in zip(lo, bounds[0])]
+                hi = [max(a, b) for a, b in zip(hi, bounds[1])]
+        if lo is None:
+            return None
+        return lo, hi
+
+    @staticmethod
+    def _bounds(polygons):
+        p = polygons[0].vertices[0].pos
+        minX = maxX = p.x
+        minY = maxY = p.y
+        minZ = maxZ = p.z
+        for poly in polygons:
+            for v in poly.vertices:
+                p = v.pos
+                if p.x < minX: minX = p.x
+                elif p.x > maxX: maxX = p.x
+                if p.y < minY: minY = p.y
+                elif p.y > maxY: maxY = p.y
+                if p.z < minZ: minZ = p.z
+                elif p.z > maxZ: maxZ = p.z
+        return [minX, minY, minZ], [maxX, maxY, maxZ]
+
+    @staticmethod
+    def _transformedBounds(polygons, matrix):
+        m00, m01, m02, m03, m10, m11, m12, m13, m20, m21, m22, m23 = matrix
+        if (m00, m01, m02, m10, m11, m12, m20, m21, m22) == \
+           (1., 0., 0., 0., 1., 0., 0., 0., 1.):
+            # a translation
+            lo, hi = CSG._bounds(polygons)
+            d = (m03, m13, m23)
+            return ([a + b for a, b in zip(lo, d)],
+                    [a + b for a, b in zip(hi, d)])
+        minX = minY = minZ = float('inf')
+        maxX = maxY = maxZ = -float('inf')
+        for poly in polygons:
+            for v in poly.vertices:
+                p = v.pos
+                x = m00 * p.x + m01 * p.y + m02 * p.z + m03
+                y = m10 * p.x + m11 * p.y + m12 * p.z + m13
+                z = m20 * p.x + m21 * p.y + m22 * p.z + m23
+                if x < minX: minX = x
+                if x > maxX: maxX = x
+                if y < minY: minY = y
+                if y > maxY: maxY = y
+                if z < minZ: minZ = z
+                if z > maxZ: maxZ = z
+        return [minX, minY, minZ], [maxX, maxY, maxZ]
+
+    def _overlap(self, csg):
+        """
+        Return the intersection of the bounding boxes of this solid and `csg`,
+        grown by `Plane.EPSILON`, or None if the boxes are disjoint.
+        """
+        a = self.getBounds()
+        b = csg.getBounds()
+        if a is None or b is None:
+            return None
+        lo = [max(a[0][i], b[0][i]) - Plane.EPSILON for i in range(3)]
+        hi = [min(a[1][i], b[1][i]) + Plane.EPSILON for i in range(3)]
+        for i in range(3):
+            if lo[i] > hi[i]:
+                return None
+        return lo, hi
+
+    def toMesh(self, tolerance=None):
+        """
+        Return the polygons of this solid as an array-backed `Mesh`, with
+        vertices welded if `tolerance` is given (see `Mesh.weld()`).
+        """
+        return Mesh.fromPolygons(self.polygons, tolerance)
+
+    def digest(self):
+        """
+        Return a hex digest of the content of this solid: the vertex positions
+        and normals of each polygon in order and the `shared` values. It does
+        not depend on how vertices and planes are shared between the polygon
+        objects, so a solid and its `clone()` have the same digest. The planes
+        are left out: they follow from the vertices, and boolean operations
+        compute them again for their operands (see `_sharedPolygons()`).
+        """
+        noNormal = float('nan')
+        counts = array('i', [len(self.polygons)])
+        coords = array('d')
+        normals = array('d')
+        shared = []
         for poly in self.polygons:
+            counts.append(len(poly.vertices))
+            for v in poly.vertices:
+                pos = v.pos
+                # adding 0. turns -0. into 0.
+                coords.extend((pos.x + 0., pos.y + 0., pos.z + 0.))
+                n = v.normal
+                if n is None:
+                    normals.extend((noNormal, noNormal, noNormal))
+                else:
+                    normals.extend((n.x + 0., n.y + 0., n.z + 0.))
+            shared.append(poly.shared)
+        if sys.byteorder != 'little':
+            counts.byteswap()
+            coords.byteswap()
+            normals.byteswap()
+        h = hashlib.sha256(counts.tobytes())
+        h.update(coords.tobytes())
+        h.update(normals.tobytes())
+        if any(s is not None for s in shared):
+            h.update(repr(shared).encode('utf-8'))
+        return h.hexdigest()
 
+    def refine(self, levels=1):
+        """
+        Return a refined CSG. To each polygon, a middle point is added to each edge and to the center 
+        of the polygon. With `levels` > 1, the polygons are refined that many times in one pass over
+        an array-backed `Mesh` (see `Mesh.refine()`), and the polygons on both sides of an edge share
+        its middle point. Custom vertex classes are refined with their own `interpolate()` instead.
+        """
+        polygons = self.polygons
+        if all(type(v) is Vertex for poly in polygons for v in poly.vertices):
+            mesh = Mesh.fromPolygons(polygons).refine(levels)
+            return CSG.fromPolygons(mesh.toPolygons(share=True))
+        for level in range(levels):
+            polygons = CSG._refinePolygons(polygons)
+        return CSG.fromPolygons(list(polygons))
+
+    @staticmethod
+    def _refinePolygons(polygons):
+        """
+        Split each of `polygons` into quads once, see `refine()`, using the
+        `interpolate()` method of the vertices.
+        """
+        middles = {} # ids of the ends of an edge -> middle point
+        result = []
+        for poly in polygons:
             verts = poly.vertices
             numVerts = len(verts)
-
             if numVerts == 0:
                 continue
+            mids = []
+            for i in range(numVerts):
+                a, b = verts[i], verts[(i + 1) % numVerts]
+                if id(a) > id(b):
+                    a, b = b, a
+                key = (id(a), id(b))
+                mid = middles.get(key)
+                if mid is None:
+                    mid = middles[key] = a.interpolate(b, 0.5)
+                mids.append(mid)
+            # the average of all vertices, by interpolating them one by one
+            center = verts[0].interpolate(verts[1 % numVerts], 0.5)
+            for i in range(2, numVerts):
+                center = center.interpolate(verts[i], 1. / (i + 1))
+            if getattr(verts[0], 'normal', None) is not None:
+                center.normal = poly.plane.normal.clone()
+            for i in range(numVerts):
+                result.append(Polygon([verts[i], mids[i], center, mids[i - 1]],
+                                      poly.shared))
+        return result
 
-            midPos = reduce(operator.add, [v.pos for v in verts]) / float(numVerts)
-            midNormal = None
-            if verts[0].normal is not None:
-                midNormal = poly.plane.normal
-            midVert = Vertex(midPos, midNormal)
-
-            newVerts = verts + \
-                       [verts[i].interpolate(verts[(i + 1)%numVerts], 0.5) for i in range(numVerts)] + \
-                       [midVert]
-
-            i = 0
-            vs = [newVerts[i], newVerts[i+numVerts], newVerts[2*numVerts], newVerts[2*numVerts-1]]
-            newPoly = Polygon(vs, poly.shared)
-            newPoly.shared = poly.shared
-            newPoly.plane = poly.plane
-            newCSG.polygons.append(newPoly)
-
-            for i in range(1, numVerts):
-                vs = [newVerts[i], newVerts[numVerts+i], newVerts[2*numVerts], newVerts[numVerts+i-1]]
-                newPoly = Polygon(vs, poly.shared)
-                newCSG.polygons.append(newPoly)
-                
-        return newCSG
+    def simplify(self, tolerance=None):
+        """
+        Return a new CSG solid in which adjacent coplanar polygons with the
+        same `shared` value are merged into larger convex polygons. This undoes
+        most of the fragmentation that chained boolean operations leave on flat
+        faces::
+
+            plate = plate.subtract(hole).subtract(slot).simplify()
+
+        Vertices closer than `tolerance` are treated as one (see `Mesh.weld()`)
+        when looking for shared edges. Two polygons are merged across a shared
+        edge if the result is still convex. Vertices left on a straight edge
+        are removed only where every polygon using them has been merged and has
+        them on a straight edge, so no new T-junctions are introduced. Polygons
+        that are not merged are kept as they are. This solid is not modified.
+        """
+        if tolerance is None:
+            tolerance = Mesh.WELD_TOLERANCE
+        polygons = self.polygons
+        mesh = Mesh.fromPolygons(polygons, tolerance)
+        positions = mesh.positions
+        loops = []
+        vertexOf = {} # vertex index -> Vertex
+        groups = {}
+        for i, poly in enumerate(polygons):
+            loop = []
+            for index, v in zip(mesh.polygonIndices(i), poly.vertices):
+                if not loop or loop[-1] != index:
+                    loop.append(index)
+                vertexOf.setdefault(index, v)
+            if len(loop) > 1 and loop[0] == loop[-1]:
+                loop.pop()
+            loops.append(loop)
+            shared = poly.shared
+            try:
+                hash(shared)
+            except TypeError:
+                shared = ('id', id(shared))
+            n = poly.plane.normal
+            key = (shared, round(n.x, 6), round(n.y, 6), round(n.z, 6),
+                   round(poly.plane.w, 6))
+            groups.setdefault(key, []).append(i)
+
+        merged = {} # polygon index -> merged loop, None if merged away
+        for members in groups.values():
+            if len(members) > 1:
+                CSG._mergeLoops(members, loops, merged, positions,
+                                polygons[members[0]].plane.normal)
+
+        CSG._dropCollinear(loops, merged, positions)
+
+        result = []
+        for i, poly in enumerate(polygons):
+            if i not in merged:
+                result.append(poly)
+            elif merged[i] is not None:
+                loop = CSG._startAtCorner(merged[i], positions)
+                result.append(Polygon([vertexOf[index] for index in loop],
+                                      poly.shared, poly.plane))
+        return CSG.fromPolygons(result)
+
+    @staticmethod
+    def _startAtCorner(loop, positions):
+        # rotate the loop so that its first three vertices span the plane best,
+        # since that is where `Polygon` takes the plane from
+        best = 0
+        area = -1.
+        n = len(loop)
+        for k in range(n):
+            a = 3 * loop[k - 1]
+            b = 3 * loop[k]
+            c = 3 * loop[(k + 1) % n]
+            ux = positions[b] - positions[a]
+            uy = positions[b + 1] - positions[a + 1]
+            uz = positions[b + 2] - positions[a + 2]
+            vx = positions[c] - positions[b]
+            vy = positions[c + 1] - positions[b + 1]
+            vz = positions[c + 2] - positions[b + 2]
+            cx = uy * vz - uz * vy
+            cy = uz * vx - ux * vz
+            cz = ux * vy - uy * vx
+            if cx * cx + cy * cy + cz * cz > area:
+                best = k
+                area = cx * cx + cy * cy + cz * cz
+        return loop[best - 1:] + loop[:best - 1] if best else loop[-1:] + loop[:-1]
+
+    @staticmethod
+    def _mergeLoops(members, loops, merged, positions, normal):
+        """
+        Greedily merge the vertex index loops of the coplanar polygons
+        `members` across shared edges as long as the result is convex. Merged
+        loops are stored in `merged` under the index of the polygon that
+        absorbed the others, which get None.
+        """
+        current = dict((i, loops[i]) for i in members)
+        owner = {} # directed edge (a, b) -> polygon index
+        for i in members:
+            loop = current[i]
+            for k in range(len(loop)):
+                owner[(loop[k], loop[(k + 1) % len(loop)])] = i
+        stack = list(reversed(members))
+        while stack:
+            i = stack.pop()
+            loop = current.get(i)
+            if loop is None:
+                continue
+            for k in range(len(loop)):
+                a = loop[k]
+                b = loop[(k + 1) % len(loop)]
+                j = owner.get((b, a))
+                if j is None or j == i or current.get(j) is None:
+                    continue
+                other = current[j]
+                # this loop from b round to a, then the other one from a to b
+                m = other.index(a)
+                joined = loop[k + 1:] + loop[:k + 1] + \
+                         (other[m:] + other[:m])[1:-1]
+                # fold away further edges the two have in common
+                e = 0
+                while len(joined) > 3 and e < len(joined):
+                    if joined[e - 1] == joined[(e + 1) % len(joined)]:
+                        del joined[e]
+                        del joined[e % len(joined)]
+                        e = 0
+                    else:
+                        e += 1
+                if len(set(joined)) != len(joined) or \
+                   not CSG._isConvex(joined, positions, normal):
+                    continue
+                for loopOf in (loop, other):
+                    for e in range(len(loopOf)):
+                        edge = (loopOf[e], loopOf[(e + 1) % len(loopOf)])
+                        if owner.get(edge) in (i, j):
+                            del owner[edge]
+                for e in range(len(joined)):
+                    owner[(joined[e], joined[(e + 1) % len(joined)])] = i
+                current[i] = joined
+                current[j] = None
+                merged[i] = joined
+                merged[j] = None
+                stack.append(i)
+                break
+
+    @staticmethod
+    def _isConvex(loop, positions, normal):
+        # the loop must turn the same way round the normal at every vertex,
+        # without doubling back, and go round exactly once
+        nx, ny, nz = normal.x, normal.y, normal.z
+        eps = Plane.EPSILON
+        total = 0.
+        n = len(loop)
+        for k in range(n):
+            a = 3 * loop[k - 1]
+            b = 3 * loop[k]
+            c = 3 * loop[(k + 1) % n]
+            ux = positions[b] - positions[a]
+            uy = positions[b + 1] - positions[a + 1]
+            uz = positions[b + 2] - positions[a + 2]
+            vx = positions[c] - positions[b]
+            vy = positions[c + 1] - positions[b + 1]
+            vz = positions[c + 2] - positions[b + 2]
+            turn = math.atan2(nx * (uy * vz - uz * vy) + ny * (uz * vx - ux * vz) +
+                              nz * (ux * vy - uy * vx),
+                              ux * vx + uy * vy + uz * vz)
+            if turn < -eps or turn > math.pi - eps:
+                return False
+            total += turn
+        return abs(total - 2. * math.pi) < 1.e-6
+
+    @staticmethod
+    def _dropCollinear(loops, merged, positions):
+        """
+        Remove the vertices of the merged loops that lie on a straight line
+        between their neighbours. A vertex is only removed if every polygon
+        using it is a merged one in which it is collinear between the same two
+        neighbours, so the surface stays as connected as before.
+        """
+        eps = Plane.EPSILON
+        while True:
+            users = {}
+            candidates = {} # vertex index -> [neighbour pair, count]
+            for i, loop in enumerate(loops):
+                loop = merged.get(i, loop)
+                if loop is None:
+                    continue
+                for index in loop:
+                    users[index] = users.get(index, 0) + 1
+                if i not in merged or len(loop) <= 3:
+                    continue
+                n = len(loop)
+                for k in range(n):
+                    a = 3 * loop[k - 1]
+                    b = 3 * loop[k]
+                    c = 3 * loop[(k + 1) % n]
+                    ux = positions[b] - positions[a]
+                    uy = positions[b + 1] - positions[a + 1]
+                    uz = positions[b + 2] - positions[a + 2]
+                    vx = positions[c] - positions[b]
+                    vy = positions[c + 1] - positions[b + 1]
+                    vz = positions[c + 2] - positions[b + 2]
+                    cx = uy * vz - uz * vy
+                    cy = uz * vx - ux * vz
+                    cz = ux * vy - uy * vx
+                    if ux * vx + uy * vy + uz * vz <= 0. or \
+                       cx * cx + cy * cy + cz * cz > eps * eps * \
+                       (ux * ux + uy * uy + uz * uz) * (vx * vx + vy * vy + vz * vz):
+                        continue
+                    pair = frozenset((loop[k - 1], loop[(k + 1) % n]))
+                    entry = candidates.setdefault(loop[k], [pair, 0])
+                    if entry[0] == pair:
+                        entry[1] += 1
+                    else:
+                        entry[1] = -len(loops)
+            removed = set()
+            for index in sorted(candidates):
+                pair, count = candidates[index]
+                if count == users[index] and not (pair & removed):
+                    removed.add(index)
+            if not removed:
+                return
+            for i in merged:
+                loop = merged[i]
+                if loop is not None and removed.intersection(loop):
+                    loop = [index for index in loop if index not in removed]
+                    merged[i] = loop if len(loop) >= 3 else merged[i]
 
     def translate(self, disp):
         """
         Translate Geometry.
            disp: displacement (array of floats)
         """
-        d = Vector(disp[0], disp[1], disp[2])
-        for poly in self.polygons:
-            for v in poly.vertices:
-                v.pos = v.pos.plus(d)
-                # no change to the normals
+        self.transform([[1., 0., 0., disp[0]],
+                        [0., 1., 0., disp[1]],
+                        [0., 0., 1., disp[2]]])
 
     def rotate(self, axis, angleDeg):
         """
@@ -128,94 +566,407 @@ class CSG(object):
            angleDeg: rotation angle in degrees
         """
         ax = Vector(axis[0], axis[1], axis[2]).unit()
-        cosAngle = math.cos(math.pi * angleDeg / 180.)
-        sinAngle = math.sin(math.pi * angleDeg / 180.)
-
-        def newVector(v):
-            vA = v.dot(ax)
-            vPerp = v.minus(ax.times(vA))
-            vPerpLen = vPerp.length()
-            if vPerpLen == 0:
-                # vector is parallel to axis, no need to rotate
-                return v
-            u1 = vPerp.unit()
-            u2 = u1.cross(ax)
-            vCosA = vPerpLen*cosAngle
-            vSinA = vPerpLen*sinAngle
-            return ax.times(vA).plus(u1.times(vCosA).plus(u2.times(vSinA)))
+        x, y, z = ax.x, ax.y, ax.z
+        c = math.cos(math.pi * angleDeg / 180.)
+        # clockwise when looking along the axis
+        s = -math.sin(math.pi * angleDeg / 180.)
+        t = 1. - c
+        self.transform([[t*x*x + c, t*x*y - s*z, t*x*z + s*y, 0.],
+                        [t*x*y + s*z, t*y*y + c, t*y*z - s*x, 0.],
+                        [t*x*z - s*y, t*y*z + s*x, t*z*z + c, 0.]])
 
-        for poly in self.polygons:
-            for vert in poly.vertices:
-                vert.pos = newVector(vert.pos)
-                normal = vert.normal
-                if normal.length() > 0:
-                    vert.normal = newVector(vert.normal)
-    
-    def toVerticesAndPolygons(self):
+    def scale(self, factor):
+        """
+        Scale geometry about the origin.
+           factor: scale factor, a float or one per axis (array of floats)
+        """
+        try:
+            sx, sy, sz = factor
+        except TypeError:
+            sx = sy = sz = factor
+        self.transform([[sx, 0., 0., 0.],
+                        [0., sy, 0., 0.],
+                        [0., 0., sz, 0.]])
+
+    def mirror(self, normal, point=None):
+        """
+        Mirror geometry in a plane.
+           normal: normal of the plane (array of floats)
+           point: point on the plane (array of floats), the origin by default
+        """
+        n = Vector(normal[0], normal[1], normal[2]).unit()
+        w = 0. if point is None else n.dot(Vector(point[0], point[1], point[2]))
+        x, y, z = n.x, n.y, n.z
+        self.transform([[1. - 2.*x*x, -2.*x*y, -2.*x*z, 2.*x*w],
+                        [-2.*x*y, 1. - 2.*y*y, -2.*y*z, 2.*y*w],
+                        [-2.*x*z, -2.*y*z, 1. - 2.*z*z, 2.*z*w]])
+
+    def transform(self, matrix):
+        """
+        Transform geometry by an affine transformation.
+           matrix: 4x4 matrix (rows of floats) applied to column vectors, whose
+                   last row is [0, 0, 0, 1] and may be left out
+
+        Positions, vertex normals and polygon planes are transformed. A matrix
+        that mirrors (negative determinant) also reverses the vertices of every
+        polygon, so polygons keep facing out of the solid.
+
+        The work is deferred until `polygons` is read next: consecutive
+        transforms are multiplied into one matrix, so a chain of them costs a
+        single pass over the vertices and planes. Vertices and planes shared
+        by several polygons are transformed once and stay shared.
+        """
+        m = CSG._affine(matrix)
+        self._tree = None
+        self._parts = [(polygons, m if pending is None
+                        else CSG._compose(m, pending))
+                       for polygons, pending in self._parts]
+
+    def instance(self, matrix=None):
+        """
+        Return a new solid with the polygons of this one, transformed by the
+        affine `matrix` if given (see `transform()`), without copying them::
+
+            bolts = CSG.unionAll([bolt.instance(placement) for placement in ...])
+
+        The instance refers to the polygons of this solid until its own
+        polygons are read, for instance by a boolean operation that has to
+        clip them. Only then are the transformed copies made. Its bounding box
+        is computed without copying anything. The union of solids whose
+        bounding boxes do not overlap keeps referring to the polygons of all of
+        them, so many instances of one part can be assembled without copying.
+        """
+        csg = CSG()
+        # copies of the lists, so that changing the lists of this solid later
+        # does not change the instance
+        csg._parts = [(list(polygons), _IDENTITY if pending is None else pending)
+                      for polygons, pending in self._parts]
+        if matrix is not None:
+            csg.transform(matrix)
+        return csg
+
+    @classmethod
+    def _assemble(cls, csgs):
+        # new solid made of the polygons of all `csgs`, without copying them;
+        # only the lists are copied, like in `instance()`
+        csg = CSG()
+        parts = []
+        for other in csgs:
+            parts.extend((list(polygons), matrix)
+                         for polygons, matrix in other._parts)
+        if parts:
+            csg._parts = parts
+        return csg
+
+    @staticmethod
+    def _affine(matrix):
+        # the first three rows of `matrix` as a tuple of 12 floats
+        rows = [list(map(float, row)) for row in matrix]
+        if len(rows) not in (3, 4) or any(len(row) != 4 for row in rows):
+            raise ValueError('transform needs a 4x4 matrix')
+        if len(rows) == 4 and rows[3] != [0., 0., 0., 1.]:
+            raise ValueError('transform needs an affine matrix, the last row '
+                             'must be [0, 0, 0, 1]')
+        m = tuple(rows[0] + rows[1] + rows[2])
+        if CSG._determinant(m) == 0.:
+            raise ValueError('transform needs an invertible matrix')
+        return m
+
+    @staticmethod
+    def _determinant(m):
+        return (m[0] * (m[5] * m[10] - m[6] * m[9]) -
+                m[1] * (m[4] * m[10] - m[6] * m[8]) +
+                m[2] * (m[4] * m[9] - m[5] * m[8]))
+
+    @staticmethod
+    def _compose(a, b):
+        # the affine matrix applying `b` first and then `a`
+        result = []
+        for i in (0, 4, 8):
+            a0, a1, a2, a3 = a[i:i + 4]
+            for j in range(4):
+                result.append(a0 * b[j] + a1 * b[4 + j] + a2 * b[8 + j] +
+                              (a3 if j == 3 else 0.))
+        return tuple(result)
+
+    @property
+    def polygons(self):
+        """
+        The list of polygons of this solid. Until it is read, a solid may
+        consist of several parts, each a list of polygons of another solid and
+        an affine transform still to be applied to them (None for polygons
+        that are used as they are), see `transform()` and `instance()`.
+        Reading `polygons` replaces the parts with one list of new polygons.
+        """
+        parts = self._parts
+        if len(parts) != 1 or parts[0][1] is not None:
+            polygons = []
+            for part, matrix in parts:
+                if matrix is None or matrix == _IDENTITY:
+                    polygons.extend(Polygon(p.vertices, p.shared, p.plane)
+                                    for p in part)
+                else:
+                    polygons.extend(CSG._transformed(part, matrix))
+            self._parts = parts = [(polygons, None)]
+        return parts[0][0]
+
+    @polygons.setter
+    def polygons(self, polygons):
+        self._parts = [(polygons, None)]
+
+    @staticmethod
+    def _transformed(polygons, matrix):
+        """
+        Return copies of `polygons` transformed by the affine `matrix`.
+        """
+        m00, m01, m02, m03, m10, m11, m12, m13, m20, m21, m22, m23 = matrix
+        det = CSG._determinant(matrix)
+        # normals transform with the inverse transpose of the linear part,
+        # here the cofactor matrix, which differs from it by the factor det
+        sign = 1. if det > 0. else -1.
+        c00 = sign * (m11 * m22 - m12 * m21)
+        c01 = sign * (m12 * m20 - m10 * m22)
+        c02 = sign * (m10 * m21 - m11 * m20)
+        c10 = sign * (m21 * m02 - m22 * m01)
+        c11 = sign * (m22 * m00 - m20 * m02)
+        c12 = sign * (m20 * m01 - m21 * m00)
+        c20 = sign * (m01 * m12 - m02 * m11)
+        c21 = sign * (m02 * m10 - m00 * m12)
+        c22 = sign * (m00 * m11 - m01 * m10)
+        sqrt = math.sqrt
+        vertices = {} # id of a vertex -> transformed vertex
+        planes = {}   # id of a plane -> transformed plane
+        result = []
+        for poly in polygons:
+            newVertices = []
+            for v in poly.vertices:
+                vertex = vertices.get(id(v))
+                if vertex is None:
+                    p = v.pos
+                    x, y, z = p.x, p.y, p.z
+                    # clone to keep custom vertex classes and their data
+                    vertex = v.clone()
+                    vertex.pos = Vector(m00 * x + m01 * y + m02 * z + m03,
+                                        m10 * x + m11 * y + m12 * z + m13,
+                                        m20 * x + m21 * y + m22 * z + m23)
+                    n = getattr(v, 'normal', None)
+                    if n is not None:
+                        x, y, z = n.x, n.y, n.z
+                        nx = c00 * x + c01 * y + c02 * z
+                        ny = c10 * x + c11 * y + c12 * z
+                        nz = c20 * x + c21 * y + c22 * z
+                        length = sqrt(nx * nx + ny * ny + nz * nz)
+                        if length > 0.:
+                            vertex.normal = Vector(nx / length, ny / length,
+                                                   nz / length)
+                    vertices[id(v)] = vertex
+                newVertices.append(vertex)
+            plane = planes.get(id(poly.plane))
+            if plane is None:
+                n = poly.plane.normal
+                w = poly.plane.w
+                x, y, z = n.x, n.y, n.z
+                nx = c00 * x + c01 * y + c02 * z
+                ny = c10 * x + c11 * y + c12 * z
+                nz = c20 * x + c21 * y + c22 * z
+                length = sqrt(nx * nx + ny * ny + nz * nz)
+                nx /= length
+                ny /= length
+                nz /= length
+                # w from the transformed point of the plane closest to the origin
+                x, y, z = x * w, y * w, z * w
+                plane = Plane(Vector(nx, ny, nz),
+                              nx * (m00 * x + m01 * y + m02 * z + m03) +
+                              ny * (m10 * x + m11 * y + m12 * z + m13) +
+                              nz * (m20 * x + m21 * y + m22 * z + m23))
+                planes[id(poly.plane)] = plane
+            if det < 0.:
+                newVertices.reverse()
+            result.append(Polygon(newVertices, poly.shared, plane))
+        return result
+
+    def toVerticesAndPolygons(self, tolerance=None):
         """
         Return list of vertices, polygons (cells), and the total
         number of vertex indices in the polygon connectivity list
-        (count).
+        (count). Vertices closer than `tolerance` are merged, see
+        `Mesh.weld()`, which returns the same data as flat arrays.
         """
-        offset = 1.234567890
-        verts = []
-        polys = []
-        vertexIndexMap = {}
-        count = 0
-        for poly in self.polygons:
-            verts = poly.vertices
-            cell = []
-            for v in poly.vertices:
-                p = v.pos
-                # use string key to remove degeneracy associated
-                # very close points. The format %.10e ensures that
-                # points differing in the 11 digits and higher are 
-                # treated as the same. For instance 1.2e-10 and 
-                # 1.3e-10 are essentially the same.
-                vKey = '%.10e,%.10e,%.10e' % (p[0] + offset, 
-                                              p[1] + offset, 
-                                              p[2] + offset)
-                if not vKey in vertexIndexMap:
-                    vertexIndexMap[vKey] = len(vertexIndexMap)
-                index = vertexIndexMap[vKey]
-                cell.append(index)
-                count += 1
-            polys.append(cell)
-        # sort by index
-        sortedVertexIndex = sorted(vertexIndexMap.items(),
-                                   key=operator.itemgetter(1))
-        verts = []
-        for v, i in sortedVertexIndex:
-            p = []
-            for c in v.split(','):
-                p.append(float(c) - offset)
-            verts.append(tuple(p))
-        return verts, polys, count
-
-    def saveVTK(self, filename):
-        """
-        Save polygons in VTK file.
-        """
-        with open(filename, 'w') as f:
-            f.write('# vtk DataFile Version 3.0\n')
-            f.write('pycsg output\n')
-            f.write('ASCII\n')
-            f.write('DATASET POLYDATA\n')
-        
-            verts, cells, count = self.toVerticesAndPolygons()
+        if tolerance is None:
+            tolerance = Mesh.WELD_TOLERANCE
+        mesh = self.toMesh(tolerance)
+        p = mesh.positions
+        verts = list(zip(p[0::3], p[1::3], p[2::3]))
+        indices = mesh.indices
+        offsets = mesh.offsets
+        polys = [indices[offsets[i]:offsets[i + 1]].tolist()
+                 for i in range(len(offsets) - 1)]
+        return verts, polys, len(indices)
+
+    def saveVTK(self, filename, tolerance=None, binary=False):
+        """
+        Save polygons in VTK file, in ASCII or with `binary` in big endian
+        binary. See `csg.formats` for this and the other exporters.
+        """
+        from csg import formats
+        formats.saveVTK(self, filename, tolerance, binary)
+
+    def saveVTU(self, filename, tolerance=None):
+        """ Save polygons in a VTK XML unstructured grid file. """
+        from csg import formats
+        formats.saveVTU(self, filename, tolerance)
+
+    def saveSTL(self, filename):
+        """ Save polygons in a binary STL file. """
+        from csg import formats
+        formats.saveSTL(self, filename)
+
+    def savePLY(self, filename, tolerance=None):
+        """ Save polygons in a binary PLY file. """
+        from csg import formats
+        formats.savePLY(self, filename, tolerance)
+
+    def saveOBJ(self, filename, tolerance=None):
+        """ Save polygons in a Wavefront OBJ file. """
+        from csg import formats
+        formats.saveOBJ(self, filename, tolerance)
+
+    def _boolean(self, op, csg, splitStrategy, retainTree, simplify=False,
+                 progress=None, token=None, budget=None):
+        """
+        Run the boolean operation `op` ('union', 'subtract' or 'intersect') with
+        `csg`, consulting `CSG.resultCache` if one is set, and simplify the
+        result if `simplify` is set. The operation is monitored if any of
+        `progress`, `token` and `budget` is given.
+        """
+        return CSG._monitored(op, progress, token, budget, self._evaluate,
+                              op, csg, splitStrategy, retainTree, simplify)
+
+    @staticmethod
+    def _monitored(op, progress, token, budget, func, *args):
+        """
+        Return `func(*args)`, called under a `csg.monitor.Monitor` of `op` if
+        any of `progress`, `token` and `budget` is given.
+        """
+        if progress is None and token is None and budget is None:
+            return func(*args)
+        monitor = Monitor(op, progress, token, budget)
+        monitor.start()
+        done = False
+        try:
+            result = func(*args)
+            done = True
+        finally:
+            monitor.finish(done)
+        return result
+
+    def _evaluate(self, op, csg, splitStrategy, retainTree, simplify):
+        csg = CSG._toCSG(csg)
+        cache = CSG.resultCache
+        if cache is None:
+            result = getattr(self, '_' + op)(csg, splitStrategy, retainTree)
+        else:
+            key = cache.key(op, self, csg, splitStrategy)
+            result = cache.get(key)
+            if result is None:
+                result = getattr(self, '_' + op)(csg, splitStrategy, retainTree)
+                cache.put(key, result)
+            elif retainTree:
+                # the cache only keeps polygons
+                result = CSG._fromTree(
+                    BSPNode(result.polygons, splitStrategy), True)
+        if simplify:
+            result = result.simplify()
+        return result
+
+    def hasTree(self):
+        """
+        Return True if this solid holds a valid BSP tree kept by the boolean
+        operation that produced it.
+        """
+        return self._tree is not None and self._treePolygons is self.polygons
+
+    def treeStats(self, splitStrategy=None):
+        """
+        Build a BSP tree of this solid with `splitStrategy` and return its
+        `BSPNode.stats()`, with the time the build took added as 'buildTime'.
+        A tree retained by a boolean operation is reported instead of building
+        a new one, with a 'buildTime' of 0. Useful to find inputs that produce
+        degenerate trees and to compare the split strategies::
+
+            for strategy in (BSPNode.SPLIT_FIRST, BSPNode.SPLIT_AXIS):
+                print(strategy, csg.treeStats(strategy)['depth'])
+        """
+        if self.hasTree():
+            stats = self._tree.stats()
+            stats['buildTime'] = 0.
+            return stats
+        start = time.perf_counter()
+        tree = BSPNode(self._sharedPolygons(), splitStrategy)
+        buildTime = time.perf_counter() - start
+        stats = tree.stats()
+        stats['buildTime'] = buildTime
+        return stats
 
-            f.write('POINTS {0} float\n'.format(len(verts)))
-            for v in verts:
-                f.write('{0} {1} {2}\n'.format(v[0], v[1], v[2]))
-            numCells = len(cells)
-            f.write('POLYGONS {0} {1}\n'.format(numCells, count + numCells))
-            for cell in cells:
-                f.write('{0} '.format(len(cell)))
-                for index in cell:
-                    f.write('{0} '.format(index))
-                f.write('\n')
+    def _bspTree(self, splitStrategy):
+        """
+        Return a BSP tree of this solid that may be modified, either a copy of
+        the retained tree or a newly built one.
+        """
+        if self.hasTree():
+            return self._cloneTree()
+        return BSPNode(self._sharedPolygons(), splitStrategy)
 
-    def union(self, csg):
+    def _cloneTree(self):
+        # copy of the retained tree with polygons as from `_sharedPolygons()`
+        tree = self._tree.clone()
+        for node in tree.nodes():
+            node.polygons = [Polygon(p.vertices, p.shared, p.plane)
+                             for p in node.polygons]
+        return tree
+
+    def _treeAndClassifier(self, splitStrategy, retainTree):
+        """
+        Return a BSP tree of this solid that may be modified and, if
+        `retainTree` is set, a second one that is left untouched for point
+        queries while the first one is clipped and extended.
+        """
+        if self.hasTree():
+            return self._cloneTree(), self._tree
+        tree = BSPNode(self._sharedPolygons(), splitStrategy)
+        if retainTree:
+            return tree.clone(), tree
+        return tree, None
+
+    @staticmethod
+    def _skipOutside(csg, nodes):
+        """
+        Return a `BSPNode.repair()` skip predicate for the nodes in `nodes`
+        (a set of ids) at points outside the bounding box of `csg`, where the
+        other operand of a union or subtraction cannot have changed anything.
+        """
+        bounds = csg.getBounds()
+        if bounds is None:
+            # an empty solid changes nothing
+            return lambda node, p: id(node) in nodes
+        (x0, y0, z0), (x1, y1, z1) = bounds
+        e = Plane.EPSILON
+        x0, y0, z0, x1, y1, z1 = x0 - e, y0 - e, z0 - e, x1 + e, y1 + e, z1 + e
+        def skip(node, p):
+            return id(node) in nodes and not (
+                x0 <= p.x <= x1 and y0 <= p.y <= y1 and z0 <= p.z <= z1)
+        return skip
+
+    @classmethod
+    def _fromTree(cls, tree, retainTree):
+        csg = CSG.fromPolygons(tree.allPolygons())
+        if retainTree:
+            csg._tree = tree
+            csg._treePolygons = csg.polygons
+        return csg
+
+    def union(self, csg, splitStrategy=None, retainTree=False, simplify=False,
+              progress=None, token=None, budget=None):
         """
         Return a new CSG solid representing space in either this solid or in the
         solid `csg`. Neither this solid nor the solid `csg` are modified.::
@@ -230,21 +981,51 @@ class CSG(object):
                  |   B   |            |       |
                  |       |            |       |
                  +-------+            +-------+
+
+        `splitStrategy` selects how the BSP trees pick their splitting planes,
+        see `BSPNode`. The default splits on the first polygon of each set.
+        With `retainTree` the result keeps its BSP tree, and the next boolean
+        operation on it starts from a copy of that tree instead of building a
+        new one. With `simplify` the result is passed through `simplify()`,
+        which does not keep a retained tree. `progress`, `token` and `budget`
+        report on, cancel and limit the operation, see `csg.monitor`.
         """
-        a = BSPNode(self.clone().polygons)
-        b = BSPNode(csg.clone().polygons)
-        a.clipTo(b)
-        b.clipTo(a)
+        return self._boolean('union', csg, splitStrategy, retainTree, simplify,
+                             progress, token, budget)
+
+    def _union(self, csg, splitStrategy, retainTree):
+        box = self._overlap(csg)
+        if box is None:
+            # disjoint solids, the union is just both sets of polygons
+            if not retainTree:
+                return CSG._assemble([self, csg])
+            a, inA = self._treeAndClassifier(splitStrategy, True)
+            b = csg._bspTree(splitStrategy)
+            nodes = set(map(id, a.nodes()))
+            a.build(csg._sharedPolygons(), True)
+            a.repair(lambda p: inA.isInside(p) or b.isInside(p),
+                     CSG._skipOutside(csg, nodes))
+            return CSG._fromTree(a, True)
+        a, inA = self._treeAndClassifier(splitStrategy, retainTree)
+        b = csg._bspTree(splitStrategy)
+        a.clipTo(b, box, True)
+        b.clipTo(a, box, True)
         b.invert()
-        b.clipTo(a)
+        b.clipTo(a, box, True)
         b.invert()
-        a.build(b.allPolygons());
-        return CSG.fromPolygons(a.allPolygons())
+        if retainTree:
+            nodes = set(map(id, a.nodes()))
+        a.build(b.allPolygons(), retainTree)
+        if retainTree:
+            a.repair(lambda p: inA.isInside(p) or b.isInside(p),
+                     CSG._skipOutside(csg, nodes))
+        return CSG._fromTree(a, retainTree)
 
     def __add__(self, csg):
         return self.union(csg)
         
-    def subtract(self, csg):
+    def subtract(self, csg, splitStrategy=None, retainTree=False, simplify=False,
+                 progress=None, token=None, budget=None):
         """
         Return a new CSG solid representing space in this solid but not in the
         solid `csg`. Neither this solid nor the solid `csg` are modified.::
@@ -259,23 +1040,47 @@ class CSG(object):
                  |   B   |
                  |       |
                  +-------+
+
+        `splitStrategy` selects how the BSP trees pick their splitting planes,
+        see `BSPNode`. The default splits on the first polygon of each set.
+        With `retainTree` the result keeps its BSP tree, and the next boolean
+        operation on it starts from a copy of that tree instead of building a
+        new one. With `simplify` the result is passed through `simplify()`,
+        which does not keep a retained tree. `progress`, `token` and `budget`
+        report on, cancel and limit the operation, see `csg.monitor`.
         """
-        a = BSPNode(self.clone().polygons)
-        b = BSPNode(csg.clone().polygons)
+        return self._boolean('subtract', csg, splitStrategy, retainTree, simplify,
+                             progress, token, budget)
+
+    def _subtract(self, csg, splitStrategy, retainTree):
+        box = self._overlap(csg)
+        if box is None:
+            # nothing of this solid is removed
+            if retainTree:
+                return CSG._fromTree(self._bspTree(splitStrategy), True)
+            return self.instance()
+        a, inA = self._treeAndClassifier(splitStrategy, retainTree)
+        b = csg._bspTree(splitStrategy)
         a.invert()
-        a.clipTo(b)
-        b.clipTo(a)
+        a.clipTo(b, box, True)
+        b.clipTo(a, box, False)
         b.invert()
-        b.clipTo(a)
+        b.clipTo(a, box, False)
         b.invert()
-        a.build(b.allPolygons())
+        if retainTree:
+            nodes = set(map(id, a.nodes()))
+        a.build(b.allPolygons(), retainTree)
         a.invert()
-        return CSG.fromPolygons(a.allPolygons())
+        if retainTree:
+            a.repair(lambda p: inA.isInside(p) and not b.isInside(p),
+                     CSG._skipOutside(csg, nodes))
+        return CSG._fromTree(a, retainTree)
 
     def __sub__(self, csg):
         return self.subtract(csg)
         
-    def intersect(self, csg):
+    def intersect(self, csg, splitStrategy=None, retainTree=False, simplify=False,
+                  progress=None, token=None, budget=None):
         """
         Return a new CSG solid representing space both this solid and in the
         solid `csg`. Neither this solid nor the solid `csg` are modified.::
@@ -290,29 +1095,189 @@ class CSG(object):
                  |   B   |
                  |       |
                  +-------+
+
+        `splitStrategy` selects how the BSP trees pick their splitting planes,
+        see `BSPNode`. The default splits on the first polygon of each set.
+        With `retainTree` the result keeps its BSP tree, and the next boolean
+        operation on it starts from a copy of that tree instead of building a
+        new one. With `simplify` the result is passed through `simplify()`,
+        which does not keep a retained tree. `progress`, `token` and `budget`
+        report on, cancel and limit the operation, see `csg.monitor`.
         """
-        a = BSPNode(self.clone().polygons)
-        b = BSPNode(csg.clone().polygons)
+        return self._boolean('intersect', csg, splitStrategy, retainTree, simplify,
+                             progress, token, budget)
+
+    def _intersect(self, csg, splitStrategy, retainTree):
+        box = self._overlap(csg)
+        if box is None:
+            # disjoint solids have no common space
+            return CSG._fromTree(BSPNode(), retainTree)
+        a, inA = self._treeAndClassifier(splitStrategy, retainTree)
+        b = csg._bspTree(splitStrategy)
         a.invert()
-        b.clipTo(a)
+        b.clipTo(a, box, False)
         b.invert()
-        a.clipTo(b)
-        b.clipTo(a)
-        a.build(b.allPolygons())
+        a.clipTo(b, box, False)
+        b.clipTo(a, box, False)
+        a.build(b.allPolygons(), retainTree)
         a.invert()
-        return CSG.fromPolygons(a.allPolygons())
+        if retainTree:
+            # b is still inverted here
+            a.repair(lambda p: inA.isInside(p) and not b.isInside(p))
+        return CSG._fromTree(a, retainTree)
 
     def __mul__(self, csg):
         return self.intersect(csg)
+
+    @classmethod
+    def unionAll(cls, csgs, splitStrategy=None, progress=None, token=None,
+                 budget=None):
+        """
+        Return a new CSG solid representing the union of all solids in the
+        iterable `csgs`, none of which are modified.::
+
+            CSG.unionAll([a, b, c, d])
+
+        Chaining `a + b + c + d` unions an ever growing solid with one more
+        operand at a time. Instead, the operands are first grouped into clusters
+        whose bounding boxes overlap (directly or through other operands).
+        Clusters cannot intersect each other and are simply concatenated. Inside
+        a cluster, operands are ordered so that neighbours are spatially close
+        and are then united pairwise, level by level, like a balanced binary
+        tree. `progress`, `token` and `budget` apply to all of these unions
+        together, see `csg.monitor`.
+        """
+        return CSG._monitored('unionAll', progress, token, budget,
+                              CSG._unionAll, csgs, splitStrategy)
+
+    @staticmethod
+    def _unionAll(csgs, splitStrategy):
+        items = []
+        for csg in csgs:
+            csg = CSG._toCSG(csg)
+            bounds = csg.getBounds()
+            if bounds is not None:
+                items.append((csg, bounds))
+
+        results = []
+        for cluster in CSG._clusters(items):
+            level = [csg for csg, bounds in CSG._spatialOrder(cluster)]
+            if len(level) == 1:
+                level = [level[0].instance()]
+            while len(level) > 1:
+                merged = []
+                for i in range(0, len(level) - 1, 2):
+                    merged.append(level[i].union(level[i + 1], splitStrategy))
+                if len(level) % 2:
+                    merged.append(level[-1])
+                level = merged
+            results.append(level[0])
+        return CSG._assemble(results)
+
+    union_all = unionAll
+
+    def subtractAll(self, csgs, splitStrategy=None, progress=None, token=None,
+                    budget=None):
+        """
+        Return a new CSG solid representing space in this solid but in none of
+        the solids in the iterable `csgs`. Tools whose bounding box does not
+        touch this solid are skipped, the others are combined with `unionAll()`
+        and removed in a single `subtract()`::
+
+            plate.subtractAll([CSG.cylinder(start=..., end=...) for ...])
+
+        `progress`, `token` and `budget` apply to the whole operation, see
+        `csg.monitor`.
+        """
+        return CSG._monitored('subtractAll', progress, token, budget,
+                              self._subtractAll, csgs, splitStrategy)
+
+    def _subtractAll(self, csgs, splitStrategy):
+        bounds = self.getBounds()
+        if bounds is None:
+            return CSG()
+        tools = []
+        for csg in csgs:
+            csg = CSG._toCSG(csg)
+            if CSG._boundsOverlap(bounds, csg.getBounds()):
+                tools.append(csg)
+        if not tools:
+            return self.instance()
+        return self.subtract(CSG.unionAll(tools, splitStrategy), splitStrategy)
+
+    subtract_all = subtractAll
+
+    @staticmethod
+    def _boundsOverlap(a, b):
+        # True if the bounding boxes `a` and `b` overlap within Plane.EPSILON
+        if a is None or b is None:
+            return False
+        for i in range(3):
+            if a[0][i] > b[1][i] + Plane.EPSILON or \
+               b[0][i] > a[1][i] + Plane.EPSILON:
+                return False
+        return True
+
+    @staticmethod
+    def _clusters(items):
+        """
+        Split a list of (csg, bounds) pairs into clusters of pairs whose bounds
+        overlap, directly or through other members of the cluster.
+        """
+        parent = list(range(len(items)))
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+        # sweep along x, only boxes that are still open can overlap
+        order = sorted(range(len(items)), key=lambda i: items[i][1][0][0])
+        active = []
+        for i in order:
+            bounds = items[i][1]
+            active = [j for j in active
+                      if items[j][1][1][0] + Plane.EPSILON >= bounds[0][0]]
+            for j in active:
+                if CSG._boundsOverlap(bounds, items[j][1]):
+                    parent[find(j)] = find(i)
+            active.append(i)
+        clusters = {}
+        for i in range(len(items)):
+            clusters.setdefault(find(i), []).append(items[i])
+        return [clusters[k] for k in sorted(clusters)]
+
+    @staticmethod
+    def _spatialOrder(items):
+        """
+        Order (csg, bounds) pairs so that neighbours in the list are close in
+        space, by recursively halving them along the longest axis of the box
+        around their centers.
+        """
+        ordered = []
+        stack = [items]
+        while stack:
+            items = stack.pop()
+            if len(items) <= 2:
+                ordered.extend(items)
+                continue
+            centers = [[0.5 * (b[0][i] + b[1][i]) for i in range(3)]
+                       for csg, b in items]
+            extent = [max(c[i] for c in centers) - min(c[i] for c in centers)
+                      for i in range(3)]
+            axis = extent.index(max(extent))
+            order = sorted(range(len(items)), key=lambda k: centers[k][axis])
+            half = len(items) // 2
+            # push the upper half first so that the lower half comes out first
+            stack.append([items[k] for k in order[half:]])
+            stack.append([items[k] for k in order[:half]])
+        return ordered
         
     def inverse(self):
         """
         Return a new CSG solid with solid and empty space switched. This solid is
         not modified.
         """
-        csg = self.clone()
-        map(lambda p: p.flip(), csg.polygons)
-        return csg
+        return CSG.fromPolygons([p.flipped() for p in self.polygons])
 
     @classmethod
     def cube(cls, center=[0,0,0], radius=[1,1,1]):
@@ -355,6 +1320,47 @@ class CSG(object):
                     ]))
         return CSG.fromPolygons(polygons)
         
+    @classmethod
+    def _template(cls, key, build):
+        """
+        Return the polygons of the unit primitive `key`, calling `build()` to
+        make them if they are not in `_templates`. The polygons must not be
+        modified, primitives are made from transformed copies of them.
+        """
+        templates = CSG._templates
+        polygons = templates.get(key)
+        if polygons is None:
+            polygons = build()
+            templates[key] = polygons
+            while len(templates) > CSG.TEMPLATE_CACHE_SIZE:
+                templates.popitem(last=False)
+        else:
+            templates.move_to_end(key)
+        return polygons
+
+    @staticmethod
+    def _slices(kwargs, radius):
+        """
+        Return the number of slices of a primitive of `radius` built with
+        `kwargs`: its `slices`, or if it has a `tolerance`, the smallest
+        number for which the chords of a circle of `radius` are no farther
+        from it than the tolerance.
+        """
+        tolerance = kwargs.get('tolerance')
+        if tolerance is None:
+            return kwargs.get('slices', 16)
+        scale = kwargs.get('scale')
+        if scale is not None:
+            tolerance *= scale
+        if not tolerance > 0.:
+            raise ValueError('tolerance must be positive')
+        radius = math.fabs(radius)
+        if tolerance >= radius:
+            return 3
+        # a chord spanning the angle a is r * (1 - cos(a / 2)) from the circle
+        return max(3, int(math.ceil(
+            math.pi / math.acos(1. - tolerance / radius))))
+
     @classmethod
     def sphere(cls, **kwargs):
         """ Returns a sphere.
@@ -367,6 +1373,15 @@ class CSG(object):
                 slices (int): Number of slices, default 16.
                 
                 stacks (int): Number of stacks, default 8.
+                
+                tolerance (float): Largest distance allowed between the
+                polygons and the exact surface. If given, the smallest
+                numbers of slices and stacks that keep within it are used
+                instead of `slices` and `stacks`.
+                
+                scale (float): Makes `tolerance` relative: the distance
+                allowed is `tolerance * scale`, e.g. with the size of the
+                model as `scale`.
         """
         center = kwargs.get('center', [0.0, 0.0, 0.0])
         if isinstance(center, float):
@@ -375,16 +1390,35 @@ class CSG(object):
         r = kwargs.get('radius', 1.0)
         if isinstance(r, list) and len(r) > 2:
             r = r[0]
-        slices = kwargs.get('slices', 16)
-        stacks = kwargs.get('stacks', 8)
+        slices = CSG._slices(kwargs, r)
+        if kwargs.get('tolerance') is None:
+            stacks = kwargs.get('stacks', 8)
+        else:
+            # the triangles around the poles are a bit larger than the others
+            # with exactly half as many stacks as slices
+            stacks = slices // 2 + 1
+        polygons = CSG._template(('sphere', slices, stacks),
+                                 lambda: CSG._unitSphere(slices, stacks))
+        return CSG.fromPolygons(CSG._transformed(
+            polygons, (r, 0., 0., c.x, 0., r, 0., c.y, 0., 0., r, c.z)))
+
+    @staticmethod
+    def _unitSphere(slices, stacks):
         polygons = []
-        def appendVertex(vertices, theta, phi):
-            d = Vector(
-                math.cos(theta) * math.sin(phi),
-                math.cos(phi),
-                math.sin(theta) * math.sin(phi))
-            vertices.append(Vertex(c.plus(d.times(r)), d))
-            
+        shared = {} # (2 * i, 2 * j) -> Vertex
+        def appendVertex(vertices, i, j):
+            key = (int(2 * i), int(2 * j))
+            v = shared.get(key)
+            if v is None:
+                theta = i * dTheta
+                phi = j * dPhi
+                d = Vector(
+                    math.cos(theta) * math.sin(phi),
+                    math.cos(phi),
+                    math.sin(theta) * math.sin(phi))
+                v = shared[key] = Vertex(d, d)
+            vertices.append(v)
+
         dTheta = math.pi * 2.0 / float(slices)
         dPhi = math.pi / float(stacks)
 
@@ -397,9 +1431,9 @@ class CSG(object):
             #  |/
             #  +
             vertices = []
-            appendVertex(vertices, i0 * dTheta, j0 * dPhi)
-            appendVertex(vertices, i1 * dTheta, j1 * dPhi)
-            appendVertex(vertices, i0 * dTheta, j1 * dPhi)
+            appendVertex(vertices, i0, j0)
+            appendVertex(vertices, i1, j1)
+            appendVertex(vertices, i0, j1)
             polygons.append(Polygon(vertices))
 
         j0 = stacks - 1
@@ -411,9 +1445,9 @@ class CSG(object):
             #  | \
             #  +--+
             vertices = []
-            appendVertex(vertices, i0 * dTheta, j0 * dPhi)
-            appendVertex(vertices, i1 * dTheta, j0 * dPhi)
-            appendVertex(vertices, i0 * dTheta, j1 * dPhi)
+            appendVertex(vertices, i0, j0)
+            appendVertex(vertices, i1, j0)
+            appendVertex(vertices, i0, j1)
             polygons.append(Polygon(vertices))
             
         for j0 in range(1, stacks - 1):
@@ -428,27 +1462,27 @@ class CSG(object):
                 #  |/ \|
                 #  +---+
                 verticesN = []
-                appendVertex(verticesN, i1 * dTheta, j1 * dPhi)
-                appendVertex(verticesN, i2 * dTheta, j2 * dPhi)
-                appendVertex(verticesN, i0 * dTheta, j2 * dPhi)
+                appendVertex(verticesN, i1, j1)
+                appendVertex(verticesN, i2, j2)
+                appendVertex(verticesN, i0, j2)
                 polygons.append(Polygon(verticesN))
                 verticesS = []
-                appendVertex(verticesS, i1 * dTheta, j1 * dPhi)
-                appendVertex(verticesS, i0 * dTheta, j0 * dPhi)
-                appendVertex(verticesS, i2 * dTheta, j0 * dPhi)
+                appendVertex(verticesS, i1, j1)
+                appendVertex(verticesS, i0, j0)
+                appendVertex(verticesS, i2, j0)
                 polygons.append(Polygon(verticesS))
                 verticesW = []
-                appendVertex(verticesW, i1 * dTheta, j1 * dPhi)
-                appendVertex(verticesW, i0 * dTheta, j2 * dPhi)
-                appendVertex(verticesW, i0 * dTheta, j0 * dPhi)
+                appendVertex(verticesW, i1, j1)
+                appendVertex(verticesW, i0, j2)
+                appendVertex(verticesW, i0, j0)
                 polygons.append(Polygon(verticesW))
                 verticesE = []
-                appendVertex(verticesE, i1 * dTheta, j1 * dPhi)
-                appendVertex(verticesE, i2 * dTheta, j0 * dPhi)
-                appendVertex(verticesE, i2 * dTheta, j2 * dPhi)
+                appendVertex(verticesE, i1, j1)
+                appendVertex(verticesE, i2, j0)
+                appendVertex(verticesE, i2, j2)
                 polygons.append(Polygon(verticesE))
                 
-        return CSG.fromPolygons(polygons)
+        return polygons
     
     @classmethod
     def cylinder(cls, **kwargs):
@@ -462,6 +1496,15 @@ class CSG(object):
                 radius (float): Radius of cylinder, default 1.0.
                 
                 slices (int): Number of slices, default 16.
+                
+                tolerance (float): Largest distance allowed between the
+                polygons and the exact surface. If given, the smallest
+                number of slices that keeps within it is used instead of
+                `slices`.
+                
+                scale (float): Makes `tolerance` relative: the distance
+                allowed is `tolerance * scale`, e.g. with the size of the
+                model as `scale`.
         """
         s = kwargs.get('start', Vector(0.0, -1.0, 0.0))
         e = kwargs.get('end', Vector(0.0, 1.0, 0.0))
@@ -470,42 +1513,65 @@ class CSG(object):
         if isinstance(e, list):
             e = Vector(*e)
         r = kwargs.get('radius', 1.0)
-        slices = kwargs.get('slices', 16)
-        ray = e.minus(s)
+        slices = CSG._slices(kwargs, r)
+        polygons = CSG._template(('cylinder', slices),
+                                 lambda: CSG._unitCylinder(slices))
+        return CSG.fromPolygons(CSG._transformed(
+            polygons, CSG._axisMatrix(s, e, r)))
 
+    @staticmethod
+    def _axisMatrix(s, e, r):
+        """
+        Return the matrix placing a unit cylinder or cone, which goes from
+        the origin to [0, 0, 1], between `s` and `e` with radius `r`.
+        """
+        ray = e.minus(s)
         axisZ = ray.unit()
         isY = (math.fabs(axisZ.y) > 0.5)
         axisX = Vector(float(isY), float(not isY), 0).cross(axisZ).unit()
         axisY = axisX.cross(axisZ).unit()
-        start = Vertex(s, axisZ.negated())
-        end = Vertex(e, axisZ.unit())
+        # the unit primitives have axisX = [1, 0, 0] and axisY = [0, -1, 0]
+        x = axisX.times(r)
+        y = axisY.times(-r)
+        return (x.x, y.x, ray.x, s.x,
+                x.y, y.y, ray.y, s.y,
+                x.z, y.z, ray.z, s.z)
+
+    @staticmethod
+    def _unitCylinder(slices):
+        axisZ = Vector(0., 0., 1.)
+        start = Vertex(Vector(0., 0., 0.), axisZ.negated())
+        end = Vertex(axisZ, axisZ)
         polygons = []
+        shared = {} # (stack, slice, normalBlend) -> Vertex
         
-        def point(stack, angle, normalBlend):
-            out = axisX.times(math.cos(angle)).plus(
-                axisY.times(math.sin(angle)))
-            pos = s.plus(ray.times(stack)).plus(out.times(r))
-            normal = out.times(1.0 - math.fabs(normalBlend)).plus(
-                axisZ.times(normalBlend))
-            return Vertex(pos, normal)
+        def point(stack, i, normalBlend):
+            key = (stack, i, normalBlend)
+            v = shared.get(key)
+            if v is None:
+                angle = i * dt
+                out = Vector(math.cos(angle), -math.sin(angle), 0.)
+                pos = out.plus(axisZ.times(stack))
+                normal = out.times(1.0 - math.fabs(normalBlend)).plus(
+                    axisZ.times(normalBlend))
+                v = shared[key] = Vertex(pos, normal)
+            return v
             
         dt = math.pi * 2.0 / float(slices)
         for i in range(0, slices):
-            t0 = i * dt
             i1 = (i + 1) % slices
-            t1 = i1 * dt
-            polygons.append(Polygon([start.clone(), 
-                                     point(0., t0, -1.), 
-                                     point(0., t1, -1.)]))
-            polygons.append(Polygon([point(0., t1, 0.), 
-                                     point(0., t0, 0.),
-                                     point(1., t0, 0.), 
-                                     point(1., t1, 0.)]))
-            polygons.append(Polygon([end.clone(), 
-                                     point(1., t1, 1.), 
-                                     point(1., t0, 1.)]))
+            polygons.append(Polygon([start, 
+                                     point(0., i, -1.), 
+                                     point(0., i1, -1.)]))
+            polygons.append(Polygon([point(0., i1, 0.), 
+                                     point(0., i, 0.),
+                                     point(1., i, 0.), 
+                                     point(1., i1, 0.)]))
+            polygons.append(Polygon([end, 
+                                     point(1., i1, 1.), 
+                                     point(1., i, 1.)]))
         
-        return CSG.fromPolygons(polygons)
+        return polygons
 
     @classmethod
     def cone(cls, **kwargs):
@@ -519,6 +1585,15 @@ class CSG(object):
                 radius (float): Maximum radius of cone at start, default 1.0.
                 
                 slices (int): Number of slices, default 16.
+                
+                tolerance (float): Largest distance allowed between the
+                polygons and the exact surface. If given, the smallest
+                number of slices that keeps within it is used instead of
+                `slices`.
+                
+                scale (float): Makes `tolerance` relative: the distance
+                allowed is `tolerance * scale`, e.g. with the size of the
+                model as `scale`.
         """
         s = kwargs.get('start', Vector(0.0, -1.0, 0.0))
         e = kwargs.get('end', Vector(0.0, 1.0, 0.0))
@@ -527,47 +1602,42 @@ class CSG(object):
         if isinstance(e, list):
             e = Vector(*e)
         r = kwargs.get('radius', 1.0)
-        slices = kwargs.get('slices', 16)
-        ray = e.minus(s)
-        
-        axisZ = ray.unit()
-        isY = (math.fabs(axisZ.y) > 0.5)
-        axisX = Vector(float(isY), float(not isY), 0).cross(axisZ).unit()
-        axisY = axisX.cross(axisZ).unit()
+        slices = CSG._slices(kwargs, r)
+        polygons = CSG._template(('cone', slices),
+                                 lambda: CSG._unitCone(slices))
+        return CSG.fromPolygons(CSG._transformed(
+            polygons, CSG._axisMatrix(s, e, r)))
+
+    @staticmethod
+    def _unitCone(slices):
+        axisZ = Vector(0., 0., 1.)
         startNormal = axisZ.negated()
-        start = Vertex(s, startNormal)
+        start = Vertex(Vector(0., 0., 0.), startNormal)
         polygons = []
         
-        taperAngle = math.atan2(r, ray.length())
-        sinTaperAngle = math.sin(taperAngle)
-        cosTaperAngle = math.cos(taperAngle)
-        def point(angle):
+        # the taper angle of the unit cone is 45 degrees, transforming the
+        # normals gives the taper of the placed cone
+        sinTaperAngle = cosTaperAngle = math.sqrt(0.5)
+        def point(i):
             # radial direction pointing out
-            out = axisX.times(math.cos(angle)).plus(
-                axisY.times(math.sin(angle)))
-            pos = s.plus(out.times(r))
+            angle = i * dt
+            out = Vector(math.cos(angle), -math.sin(angle), 0.)
             # normal taking into account the tapering of the cone
             normal = out.times(cosTaperAngle).plus(axisZ.times(sinTaperAngle))
-            return pos, normal
+            return out, normal
 
         dt = math.pi * 2.0 / float(slices)
+        points = [point(i) for i in range(0, slices)]
+        # rim vertices of the bottom disk and of the side
+        bottom = [Vertex(p, startNormal) for p, n in points]
+        side = [Vertex(p, n) for p, n in points]
         for i in range(0, slices):
-            t0 = i * dt
             i1 = (i + 1) % slices
-            t1 = i1 * dt
-            # coordinates and associated normal pointing outwards of the cone's
-            # side
-            p0, n0 = point(t0)
-            p1, n1 = point(t1)
             # average normal for the tip
-            nAvg = n0.plus(n1).times(0.5)
+            nAvg = side[i].normal.plus(side[i1].normal).times(0.5)
             # polygon on the low side (disk sector)
-            polyStart = Polygon([start.clone(), 
-                                 Vertex(p0, startNormal), 
-                                 Vertex(p1, startNormal)])
-            polygons.append(polyStart)
+            polygons.append(Polygon([start, bottom[i], bottom[i1]]))
             # polygon extending from the low side to the tip
-            polySide = Polygon([Vertex(p0, n0), Vertex(e, nAvg), Vertex(p1, n1)])
-            polygons.append(polySide)
+            polygons.append(Polygon([side[i], Vertex(axisZ, nAvg), side[i1]]))
 
-        return CSG.fromPolygons(polygons)
+        return polygons
@@ -0,0 +1,717 @@
+"""
+Mesh exporters and importers.
+
+Every writer takes a `source` and a `target`. The source is a CSG solid, a
+`LazyCSG`, a `Mesh` or any iterable of `Polygon` instances, e.g. a generator.
+The target is a file name or a file object opened for binary writing::
+
+    from csg import formats
+    formats.saveSTL(CSG.sphere(), 'sphere.stl')
+    formats.savePLY((p for p in polygons if p.shared == 'red'), 'red.ply')
+
+The available formats are legacy VTK (ASCII or binary), VTK XML unstructured
+grid with raw appended data (.vtu), binary STL, binary little endian PLY and
+Wavefront OBJ.
+
+Solids and meshes are written as a single welded mesh, see `Mesh.weld()`.
+Polygon iterables are streamed in blocks of `BLOCK_SIZE` polygons, each turned
+into a mesh of its own, so no index map over all vertices is built and a
+vertex shared by polygons in different blocks is written more than once.
+Sections of formats that need the total counts up front are collected in
+temporary files, which stay in memory up to `SPOOL_SIZE` bytes.
+
+The readers `loadSTL()` (binary and ASCII), `loadPLY()` (binary and ASCII) and
+`loadOBJ()` return a `Mesh`, `load()` picks one by file extension and returns
+a CSG solid unless asked for the mesh::
+
+    part = formats.load('part.stl')
+    mesh = CSG.load('scan.ply', asMesh=True)
+
+Files are memory-mapped and binary records are unpacked straight from the
+mapping, so the data goes into the arrays of the mesh without intermediate
+copies or per-vertex objects. Corners of STL triangles with the same position
+become one vertex. Polygon planes are computed from the first three vertices,
+or with Newell's method over all vertices when those three are collinear.
+Polygons with fewer than three vertices, or whose vertices are all collinear,
+are dropped. OBJ materials (`usemtl`) become the `shared` value of their
+polygons.
+"""
+import contextlib
+import math
+import mmap
+import os
+import re
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+
+from csg.core import CSG
+from csg.geom import Plane
+from csg.mesh import Mesh
+
+# number of polygons converted and written at a time
+BLOCK_SIZE = 4096
+# bytes of a spooled section kept in memory before going to disk
+SPOOL_SIZE = 64 * 1024 * 1024
+
+STL_HEADER = b'pycsg output'
+STL_TRIANGLE = struct.Struct('<12fH')
+VTK_POLYGON = 7
+# largest number of vertices of a PLY face, whose vertex count is a uchar
+PLY_MAX_VERTICES = 255
+
+def _meshes(source, tolerance=None, weld=True):
+    """
+    Yield the polygons of `source` as one or more `Mesh` blocks, welded with
+    `tolerance` (by default `Mesh.WELD_TOLERANCE`) if `weld` is set.
+    """
+    if not weld:
+        tolerance = None
+    elif tolerance is None:
+        tolerance = Mesh.WELD_TOLERANCE
+    if isinstance(source, Mesh):
+        yield source if tolerance is None else source.weld(tolerance)
+    elif hasattr(source, 'toMesh'):
+        yield source.toMesh(tolerance)
+    else:
+        block = []
+        for polygon in source:
+            block.append(polygon)
+            if len(block) == BLOCK_SIZE:
+                yield Mesh.fromPolygons(block, tolerance)
+                block = []
+        if block:
+            yield Mesh.fromPolygons(block, tolerance)
+
+def _ranges(mesh):
+    # polygon index ranges of at most BLOCK_SIZE polygons
+    n = mesh.numPolygons()
+    for start in range(0, n, BLOCK_SIZE):
+        yield start, min(start + BLOCK_SIZE, n)
+
+def _indices(mesh, start, end, base):
+    """
+    Return the vertex indices of the polygons `start` to `end` of `mesh`,
+    shifted by `base`.
+    """
+    indices = mesh.indices[mesh.offsets[start]:mesh.offsets[end]]
+    if base:
+        indices = array('i', [i + base for i in indices])
+    return indices
+
+def _binary(a, typecode, byteorder):
+    """ Return the values of the array `a` as `typecode` in `byteorder`. """
+    if sys.byteorder != byteorder or a.typecode != typecode:
+        a = array(typecode, a)
+        if sys.byteorder != byteorder:
+            a.byteswap()
+    return a.tobytes()
+
+@contextlib.contextmanager
+def _open(target):
+    if hasattr(target, 'write'):
+        yield target
+    else:
+        with open(target, 'wb') as f:
+            yield f
+
+def _spool():
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+
+def _copy(spool, f):
+    spool.seek(0)
+    shutil.copyfileobj(spool, f, 1024 * 1024)
+
+def saveVTK(source, target, tolerance=None, binary=False):
+    """
+    Write `source` as legacy VTK polygon data, in ASCII or big endian binary.
+    """
+    numPoints = 0
+    numCells = 0
+    size = 0
+    with _spool() as points, _spool() as cells:
+        for mesh in _meshes(source, tolerance):
+            positions = mesh.positions
+            offsets = mesh.offsets
+            for start, end in _ranges(mesh):
+                indices = _indices(mesh, start, end, numPoints)
+                first = offsets[start]
+                if binary:
+                    block = array('i')
+                    for i in range(start, end):
+                        block.append(offsets[i + 1] - offsets[i])
+                        block.extend(indices[offsets[i] - first:
+                                             offsets[i + 1] - first])
+                    cells.write(_binary(block, 'i', 'big'))
+                else:
+                    lines = []
+                    for i in range(start, end):
+                        cell = indices[offsets[i] - first:offsets[i + 1] - first]
+                        lines.append('{0} {1}\n'.format(
+                            len(cell), ''.join(['{0} '.format(j) for j in cell])))
+                    cells.write(''.join(lines).encode('ascii'))
+                size += len(indices) + end - start
+            if binary:
+                points.write(_binary(positions, 'f', 'big'))
+            else:
+                p = positions
+                points.write(''.join(['{0} {1} {2}\n'.format(*v) for v in
+                                      zip(p[0::3], p[1::3], p[2::3])]).encode('ascii'))
+            numPoints += mesh.numVertices()
+            numCells += mesh.numPolygons()
+
+        with _open(target) as f:
+            f.write(('# vtk DataFile Version 3.0\n'
+                     'pycsg output\n'
+                     '{0}\n'
+                     'DATASET POLYDATA\n'
+                     'POINTS {1} float\n').format(
+                         'BINARY' if binary else 'ASCII', numPoints).encode('ascii'))
+            _copy(points, f)
+            if binary:
+                f.write(b'\n')
+            f.write('POLYGONS {0} {1}\n'.format(numCells, size).encode('ascii'))
+            _copy(cells, f)
+            if binary:
+                f.write(b'\n')
+
+def saveVTU(source, target, tolerance=None):
+    """
+    Write `source` as a VTK XML unstructured grid with its data arrays appended
+    in raw binary form.
+    """
+    numPoints = 0
+    numCells = 0
+    size = 0
+    with _spool() as points, _spool() as connectivity, \
+         _spool() as offsets, _spool() as types:
+        for mesh in _meshes(source, tolerance):
+            for start, end in _ranges(mesh):
+                connectivity.write(_binary(_indices(mesh, start, end, numPoints),
+                                           'i', 'little'))
+                first = mesh.offsets[start]
+                offsets.write(_binary(array('i', [size + o - first for o in
+                                                  mesh.offsets[start + 1:end + 1]]),
+                                      'i', 'little'))
+                size += mesh.offsets[end] - first
+            types.write(bytes(bytearray([VTK_POLYGON]) * mesh.numPolygons()))
+            points.write(_binary(mesh.positions, 'f', 'little'))
+            numPoints += mesh.numVertices()
+            numCells += mesh.numPolygons()
+
+        spools = (points, connectivity, offsets, types)
+        sizes = [spool.tell() for spool in spools]
+        starts = [0]
+        for n in sizes[:-1]:
+            starts.append(starts[-1] + 8 + n)
+        header = (
+            '<?xml version="1.0"?>\n'
+            '<VTKFile type="UnstructuredGrid" version="1.0" '
+            'byte_order="LittleEndian" header_type="UInt64">\n'
+            '  <UnstructuredGrid>\n'
+            '    <Piece NumberOfPoints="{0}" NumberOfCells="{1}">\n'
+            '      <Points>\n'
+            '        <DataArray type="Float32" NumberOfComponents="3" '
+            'format="appended" offset="{2}"/>\n'
+            '      </Points>\n'
+            '      <Cells>\n'
+            '        <DataArray type="Int32" Name="connectivity" '
+            'format="appended" offset="{3}"/>\n'
+            '        <DataArray type="Int32" Name="offsets" '
+            'format="appended" offset="{4}"/>\n'
+            '        <DataArray type="UInt8" Name="types" '
+            'format="appended" offset="{5}"/>\n'
+            '      </Cells>\n'
+            '    </Piece>\n'
+            '  </UnstructuredGrid>\n'
+            '  <AppendedData encoding="raw">\n'
+            '   _').format(numPoints, numCells, *starts)
+        with _open(target) as f:
+            f.write(header.encode('ascii'))
+            for spool, n in zip(spools, sizes):
+                f.write(struct.pack('<Q', n))
+                _copy(spool, f)
+            f.write(b'\n  </AppendedData>\n</VTKFile>\n')
+
+def _writeTriangles(source, f):
+    """
+    Write the STL triangle records of `source` to `f` and return their number.
+    Polygons are split into triangle fans.
+    """
+    pack = STL_TRIANGLE.pack
+    count = 0
+    for mesh in _meshes(source, weld=False):
+        p = mesh.positions
+        planes = mesh.planes
+        offsets = mesh.offsets
+        indices = mesh.indices
+        for start, end in _ranges(mesh):
+            records = []
+            for i in range(start, end):
+                nx, ny, nz = planes[4 * i:4 * i + 3]
+                o = offsets[i]
+                a = 3 * indices[o]
+                x0, y0, z0 = p[a:a + 3]
+                b = 3 * indices[o + 1]
+                for k in range(o + 2, offsets[i + 1]):
+                    c = 3 * indices[k]
+                    records.append(pack(nx, ny, nz, x0, y0, z0,
+                                         p[b], p[b + 1], p[b + 2],
+                                         p[c], p[c + 1], p[c + 2], 0))
+                    b = c
+            f.write(b''.join(records))
+            count += len(records)
+    return count
+
+def saveSTL(source, target):
+    """
+    Write `source` as binary STL. The triangle count in the header is patched
+    in afterwards, so a file object that is not seekable gets the triangles
+    from a temporary file.
+    """
+    with _open(target) as f:
+        f.write(STL_HEADER.ljust(80, b' '))
+        if f.seekable():
+            pos = f.tell()
+            f.write(struct.pack('<I', 0))
+            count = _writeTriangles(source, f)
+            end = f.tell()
+            f.seek(pos)
+            f.write(struct.pack('<I', count))
+            f.seek(end)
+        else:
+            with _spool() as triangles:
+                count = _writeTriangles(source, triangles)
+                f.write(struct.pack('<I', count))
+                _copy(triangles, f)
+
+def _fan(face, size):
+    """
+    Split the convex polygon with the vertex indices `face` into a fan of
+    convex polygons of at most `size` vertices around its first vertex.
+    """
+    parts = []
+    k = 1
+    while k < len(face) - 1:
+        parts.append([face[0]] + list(face[k:k + size - 1]))
+        k += size - 2
+    return parts
+
+def savePLY(source, target, tolerance=None):
+    """
+    Write `source` as binary little endian PLY with float vertex positions and
+    int vertex indices. The vertex count of a face is stored as a uchar, so
+    polygons with more than `PLY_MAX_VERTICES` vertices are written as a fan of
+    smaller ones.
+    """
+    faceStructs = {}
+    numPoints = 0
+    numFaces = 0
+    with _spool() as vertices, _spool() as faces:
+        for mesh in _meshes(source, tolerance):
+            offsets = mesh.offsets
+            for start, end in _ranges(mesh):
+                indices = _indices(mesh, start, end, numPoints)
+                first = offsets[start]
+                records = []
+                for i in range(start, end):
+                    face = indices[offsets[i] - first:offsets[i + 1] - first]
+                    if len(face) > PLY_MAX_VERTICES:
+                        parts = _fan(face, PLY_MAX_VERTICES)
+                        numFaces += len(parts) - 1
+                    else:
+                        parts = [face]
+                    for face in parts:
+                        n = len(face)
+                        s = faceStructs.get(n)
+                        if s is None:
+                            s = faceStructs[n] = struct.Struct('<B%di' % n)
+                        records.append(s.pack(n, *face))
+                faces.write(b''.join(records))
+            vertices.write(_binary(mesh.positions, 'f', 'little'))
+            numPoints += mesh.numVertices()
+            numFaces += mesh.numPolygons()
+
+        with _open(target) as f:
+            f.write(('ply\n'
+                     'format binary_little_endian 1.0\n'
+                     'comment pycsg output\n'
+                     'element vertex {0}\n'
+                     'property float x\n'
+                     'property float y\n'
+                     'property float z\n'
+                     'element face {1}\n'
+                     'property list uchar int vertex_indices\n'
+                     'end_header\n').format(numPoints, numFaces).encode('ascii'))
+            _copy(vertices, f)
+            _copy(faces, f)
+
+def saveOBJ(source, target, tolerance=None):
+    """
+    Write `source` as Wavefront OBJ. Vertices and faces are written block by
+    block, so nothing is spooled.
+    """
+    base = 1
+    with _open(target) as f:
+        f.write(b'# pycsg output\n')
+        for mesh in _meshes(source, tolerance):
+            p = mesh.positions
+            f.write(''.join(['v {0!r} {1!r} {2!r}\n'.format(*v) for v in
+                             zip(p[0::3], p[1::3], p[2::3])]).encode('ascii'))
+            offsets = mesh.offsets
+            for start, end in _ranges(mesh):
+                indices = _indices(mesh, start, end, base)
+                first = offsets[start]
+                f.write(''.join(['f {0}\n'.format(' '.join(map(str, indices[
+                    offsets[i] - first:offsets[i + 1] - first])))
+                                 for i in range(start, end)]).encode('ascii'))
+            base += mesh.numVertices()
+
+@contextlib.contextmanager
+def _mapped(filename):
+    # read-only memory map of the file, or b'' for an empty file
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+            return
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield data
+        finally:
+            data.close()
+
+def _newell(p, face):
+    """
+    Return the plane (nx, ny, nz, w) of the polygon with the vertex indices
+    `face` into the positions `p` by Newell's method, like
+    `Plane.fromVertices()`, or None if all its vertices are collinear.
+    """
+    x = y = z = 0.
+    cx = cy = cz = 0.
+    j = 3 * face[-1]
+    for index in face:
+        i = 3 * index
+        x += (p[j + 1] - p[i + 1]) * (p[j + 2] + p[i + 2])
+        y += (p[j + 2] - p[i + 2]) * (p[j] + p[i])
+        z += (p[j] - p[i]) * (p[j + 1] + p[i + 1])
+        cx += p[i]
+        cy += p[i + 1]
+        cz += p[i + 2]
+        j = i
+    length = math.sqrt(x * x + y * y + z * z)
+    if length == 0:
+        return None
+    x /= length
+    y /= length
+    z /= length
+    k = float(len(face))
+    return x, y, z, (x * cx + y * cy + z * cz) / k
+
+def _finish(mesh):
+    """
+    Give the polygons of `mesh`, whose positions, offsets and indices are
+    filled in, their planes and zero normals to the vertices. Polygons whose
+    vertices are all collinear have no plane and are removed.
+    """
+    p = mesh.positions
+    offsets = mesh.offsets
+    indices = mesh.indices
+    shared = mesh.shared
+    if len(shared) < len(offsets) - 1:
+        shared = shared + [None] * (len(offsets) - 1 - len(shared))
+    newOffsets = array('i', [0])
+    newIndices = array('i')
+    planes = array('d')
+    newShared = []
+    sqrt = math.sqrt
+    for i in range(len(offsets) - 1):
+        start = offsets[i]
+        end = offsets[i + 1]
+        if end - start < 3:
+            continue
+        a = 3 * indices[start]
+        b = 3 * indices[start + 1]
+        c = 3 * indices[start + 2]
+        ax = p[a]
+        ay = p[a + 1]
+        az = p[a + 2]
+        ux = p[b] - ax
+        uy = p[b + 1] - ay
+        uz = p[b + 2] - az
+        vx = p[c] - ax
+        vy = p[c + 1] - ay
+        vz = p[c + 2] - az
+        # same arithmetic as Plane.fromPoints()
+        nx = uy * vz - uz * vy
+        ny = uz * vx - ux * vz
+        nz = ux * vy - uy * vx
+        length = sqrt(nx * nx + ny * ny + nz * nz)
+        if length > Plane.EPSILON * sqrt((ux * ux + uy * uy + uz * uz) *
+                                         (vx * vx + vy * vy + vz * vz)):
+            nx = nx / length
+            ny = ny / length
+            nz = nz / length
+            w = nx * ax + ny * ay + nz * az
+        else:
+            # the first three vertices are (nearly) collinear
+            plane = _newell(p, indices[start:end])
+            if plane is None:
+                continue
+            nx, ny, nz, w = plane
+        planes.extend((nx, ny, nz, w))
+        newIndices.extend(indices[start:end])
+        newOffsets.append(len(newIndices))
+        newShared.append(shared[i])
+    mesh.offsets = newOffsets
+    mesh.indices = newIndices
+    mesh.planes = planes
+    mesh.shared = newShared
+    if len(mesh.normals) != len(p):
+        mesh.normals = array('d', bytes(8 * len(p)))
+    return mesh
+
+def loadSTL(filename):
+    """
+    Read a binary or ASCII STL file and return a `Mesh`.
+    """
+    mesh = Mesh()
+    positions = mesh.positions
+    offsets = mesh.offsets
+    indices = mesh.indices
+    vertexIndex = {}
+    with _mapped(filename) as data:
+        n = struct.unpack_from('<I', data, 80)[0] if len(data) >= 84 else -1
+        if len(data) == 84 + 50 * n:
+            view = memoryview(data)
+            try:
+                for record in STL_TRIANGLE.iter_unpack(view[84:]):
+                    for k in (3, 6, 9):
+                        key = record[k:k + 3]
+                        index = vertexIndex.get(key)
+                        if index is None:
+                            index = len(vertexIndex)
+                            vertexIndex[key] = index
+                            positions.extend(key)
+                        indices.append(index)
+                    offsets.append(len(indices))
+            finally:
+                view.release()
+        elif data[:5] == b'solid':
+            vertex = re.compile(br'vertex\s+(\S+)\s+(\S+)\s+(\S+)')
+            for loop in re.finditer(br'outer\s+loop(.*?)endloop', data, re.S):
+                for m in vertex.finditer(loop.group(1)):
+                    key = (float(m.group(1)), float(m.group(2)),
+                           float(m.group(3)))
+                    index = vertexIndex.get(key)
+                    if index is None:
+                        index = len(vertexIndex)
+                        vertexIndex[key] = index
+                        positions.extend(key)
+                    indices.append(index)
+                offsets.append(len(indices))
+        else:
+            raise ValueError('%s is not an STL file' % filename)
+    return _finish(mesh)
+
+# PLY property types and their struct format characters
+PLY_TYPES = {
+    'char': 'b', 'int8': 'b', 'uchar': 'B', 'uint8': 'B',
+    'short': 'h', 'int16': 'h', 'ushort': 'H', 'uint16': 'H',
+    'int': 'i', 'int32': 'i', 'uint': 'I', 'uint32': 'I',
+    'float': 'f', 'float32': 'f', 'double': 'd', 'float64': 'd',
+}
+
+def _plyHeader(data, filename):
+    """
+    Parse the header of a PLY file. Return the format, the list of elements
+    as (name, count, properties) and the offset of the body. A property is
+    (name, type) or (name, countType, itemType) for lists.
+    """
+    end = data.find(b'end_header')
+    if data[:3] != b'ply' or end < 0:
+        raise ValueError('%s is not a PLY file' % filename)
+    body = data.find(b'\n', end) + 1
+    format = None
+    elements = []
+    try:
+        for line in data[:end].decode('ascii').splitlines()[1:]:
+            words = line.split()
+            if not words or words[0] in ('comment', 'obj_info'):
+                continue
+            if words[0] == 'format':
+                format = words[1]
+            elif words[0] == 'element':
+                elements.append((words[1], int(words[2]), []))
+            elif words[0] == 'property':
+                if words[1] == 'list':
+                    elements[-1][2].append((words[4], PLY_TYPES[words[2]],
+                                            PLY_TYPES[words[3]]))
+                else:
+                    elements[-1][2].append((words[2], PLY_TYPES[words[1]]))
+    except (KeyError, IndexError, ValueError, UnicodeDecodeError):
+        raise ValueError('%s has an invalid PLY header' % filename)
+    if format not in ('ascii', 'binary_little_endian', 'binary_big_endian'):
+        raise ValueError('%s has unknown PLY format %r' % (filename, format))
+    return format, elements, body
+
+def _plyRecords(data, offset, endian, count, properties):
+    """
+    Yield the `count` records of a binary PLY element starting at `offset`
+    as tuples of property values (lists as tuples), then the end offset.
+    """
+    if all(len(prop) == 2 for prop in properties):
+        s = struct.Struct(endian + ''.join(prop[1] for prop in properties))
+        view = memoryview(data)
+        try:
+            for record in s.iter_unpack(view[offset:offset + count * s.size]):
+                yield record
+        finally:
+            view.release()
+        yield offset + count * s.size
+        return
+    structs = {}
+    for i in range(count):
+        record = []
+        for prop in properties:
+            if len(prop) == 2:
+                s = structs.get(prop[1])
+                if s is None:
+                    s = structs[prop[1]] = struct.Struct(endian + prop[1])
+                record.append(s.unpack_from(data, offset)[0])
+                offset += s.size
+            else:
+                s = structs.get(prop[1])
+                if s is None:
+                    s = structs[prop[1]] = struct.Struct(endian + prop[1])
+                n = s.unpack_from(data, offset)[0]
+                offset += s.size
+                key = (n, prop[2])
+                s = structs.get(key)
+                if s is None:
+                    s = structs[key] = struct.Struct(endian + '%d%s' % key)
+                record.append(s.unpack_from(data, offset))
+                offset += s.size
+        yield tuple(record)
+    yield offset
+
+def _plyTokenRecords(tokens, count, properties):
+    # same as _plyRecords() for the whitespace separated tokens of ASCII PLY
+    for i in range(count):
+        record = []
+        for prop in properties:
+            if len(prop) == 2:
+                record.append(float(next(tokens)))
+            else:
+                n = int(next(tokens))
+                record.append(tuple(int(next(tokens)) for j in range(n)))
+        yield tuple(record)
+
+def loadPLY(filename):
+    """
+    Read a binary or ASCII PLY file and return a `Mesh`. The vertex element
+    needs x, y and z properties, faces are read from the list property
+    `vertex_indices` (or `vertex_index`) of the face element.
+    """
+    mesh = Mesh()
+    positions = mesh.positions
+    normals = mesh.normals
+    offsets = mesh.offsets
+    indices = mesh.indices
+    with _mapped(filename) as data:
+        format, elements, offset = _plyHeader(data, filename)
+        if format == 'ascii':
+            tokens = iter(data[offset:].split())
+        else:
+            endian = '<' if format == 'binary_little_endian' else '>'
+        for name, count, properties in elements:
+            names = [prop[0] for prop in properties]
+            if format == 'ascii':
+                records = _plyTokenRecords(tokens, count, properties)
+            else:
+                records = _plyRecords(data, offset, endian, count, properties)
+            if name == 'vertex':
+                try:
+                    x, y, z = [names.index(n) for n in ('x', 'y', 'z')]
+                except ValueError:
+                    raise ValueError('%s has no vertex positions' % filename)
+                n = [names.index(n) for n in ('nx', 'ny', 'nz') if n in names]
+                for i, record in zip(range(count), records):
+                    positions.extend((record[x], record[y], record[z]))
+                    if len(n) == 3:
+                        normals.extend((record[n[0]], record[n[1]],
+                                        record[n[2]]))
+            elif name == 'face':
+                if 'vertex_indices' in names:
+                    k = names.index('vertex_indices')
+                elif 'vertex_index' in names:
+                    k = names.index('vertex_index')
+                else:
+                    raise ValueError('%s has no face indices' % filename)
+                for i, record in zip(range(count), records):
+                    indices.extend(record[k])
+                    offsets.append(len(indices))
+            else:
+                for i, record in zip(range(count), records):
+                    pass
+            if format != 'ascii':
+                offset = next(records)
+    numVertices = len(positions) // 3
+    for i in indices:
+        if not 0 <= i < numVertices:
+            raise ValueError('%s has a face with invalid vertex index %d'
+                             % (filename, i))
+    return _finish(mesh)
+
+def loadOBJ(filename):
+    """
+    Read a Wavefront OBJ file and return a `Mesh` of its vertices and faces.
+    Texture coordinates, normals and everything else are ignored.
+    """
+    mesh = Mesh()
+    positions = mesh.positions
+    offsets = mesh.offsets
+    indices = mesh.indices
+    shared = mesh.shared
+    material = None
+    with _mapped(filename) as data:
+        for line in iter(data.readline, b'') if data else ():
+            words = line.split()
+            if not words:
+                continue
+            key = words[0]
+            if key == b'v':
+                positions.extend((float(words[1]), float(words[2]),
+                                  float(words[3])))
+            elif key == b'f':
+                numVertices = len(positions) // 3
+                for word in words[1:]:
+                    i = int(word.split(b'/', 1)[0])
+                    if i < 0:
+                        i += numVertices
+                    else:
+                        i -= 1
+                    if not 0 <= i < numVertices:
+                        raise ValueError('%s has a face with invalid vertex '
+                                         'index %s' % (filename, word))
+                    indices.append(i)
+                offsets.append(len(indices))
+                shared.append(material)
+            elif key == b'usemtl':
+                material = line.split(None, 1)[1].strip().decode('utf-8')
+    return _finish(mesh)
+
+def load(filename, asMesh=False):
+    """
+    Read the STL, PLY or OBJ file `filename`, chosen by its extension, and
+    return a CSG solid, or with `asMesh` the `Mesh`.
+    """
+    loaders = {'.stl': loadSTL, '.ply': loadPLY, '.obj': loadOBJ}
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in loaders:
+        raise ValueError('unknown mesh file type %r' % ext)
+    mesh = loaders[ext](filename)
+    if asMesh:
+        return mesh
+    return CSG.fromMesh(mesh)
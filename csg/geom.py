@@ -1,9 +1,9 @@
 import math
+import random
 import sys
 from functools import reduce
 
-# increase the max number of recursive calls
-sys.setrecursionlimit(10000) # my default is 1000, increasing too much may cause a seg fault
+from csg import monitor as _monitor
 
 class Vector(object):
     """
@@ -16,14 +16,18 @@ class Vector(object):
          Vector([1, 2, 3]);
          Vector({ 'x': 1, 'y': 2, 'z': 3 });
     """
-    def __init__(self, *args):
+    __slots__ = ('x', 'y', 'z')
+
+    def __init__(self, x=None, y=None, z=None):
+        if z is not None:
+            # Vector(x, y, z), which is what all the arithmetic below uses
+            self.x = x
+            self.y = y
+            self.z = z
+            return
         self.x, self.y, self.z = 0., 0., 0.
-        if len(args) == 3:
-            self.x = args[0]
-            self.y = args[1]
-            self.z = args[2]
-        elif len(args) == 1:
-            a = args[0]
+        if y is None:
+            a = x
             if isinstance(a, dict):
                 self.x = a.get('x', 0.0)
                 self.y = a.get('y', 0.0)
@@ -130,12 +134,18 @@ class Vertex(object):
     functions like `CSG.sphere()` can return a smooth vertex normal, but `normal`
     is not used anywhere else.
     """
+    __slots__ = ('pos', 'normal')
+
     def __init__(self, pos, normal=None):
         self.pos = Vector(pos)
         self.normal = Vector(normal)
     
     def clone(self):
-        return Vertex(self.pos.clone(), self.normal.clone())
+        vertex = Vertex(self.pos.clone(), self.normal)
+        if self.normal is None:
+            # vertices without a normal, e.g. from `Mesh.toPolygons()`
+            vertex.normal = None
+        return vertex
     
     def flip(self):
         """
@@ -169,6 +179,14 @@ class Plane(object):
     """
     EPSILON = 1.e-5
 
+    __slots__ = ('normal', 'w')
+
+    # Classification of a point or polygon with respect to the plane.
+    COPLANAR = 0 # all the vertices are within EPSILON distance from plane
+    FRONT = 1 # all the vertices are in front of the plane
+    BACK = 2 # all the vertices are at the back of the plane
+    SPANNING = 3 # some vertices are in front, some in the back
+
     def __init__(self, normal, w):
         self.normal = normal
         # w is the (perpendicular) distance of the plane from (0, 0, 0)
@@ -179,6 +197,29 @@ class Plane(object):
         n = b.minus(a).cross(c.minus(a)).unit()
         return Plane(n, n.dot(a))
 
+    @classmethod
+    def fromVertices(cls, vertices):
+        """
+        Return the plane of the polygon through `vertices`, computed with
+        Newell's method, which also works when some consecutive vertices are
+        collinear. Raises ZeroDivisionError if all of them are.
+        """
+        x = y = z = 0.
+        cx = cy = cz = 0.
+        prev = vertices[-1].pos
+        for v in vertices:
+            pos = v.pos
+            x += (prev.y - pos.y) * (prev.z + pos.z)
+            y += (prev.z - pos.z) * (prev.x + pos.x)
+            z += (prev.x - pos.x) * (prev.y + pos.y)
+            cx += pos.x
+            cy += pos.y
+            cz += pos.z
+            prev = pos
+        n = Vector(x, y, z).unit()
+        k = float(len(vertices))
+        return Plane(n, n.dot(Vector(cx / k, cy / k, cz / k)))
+
     def clone(self):
         return Plane(self.normal.clone(), self.w)
         
@@ -186,6 +227,10 @@ class Plane(object):
         self.normal = self.normal.negated()
         self.w = -self.w
 
+    def flipped(self):
+        """ Return a new plane facing the other way. """
+        return Plane(self.normal.negated(), -self.w)
+
     def __repr__(self):
         return 'normal: {0} w: {1}'.format(self.normal, self.w)
     
@@ -197,67 +242,101 @@ class Plane(object):
         respect to this plane. Polygons in front or in back of this plane go into
         either `front` or `back`
         """
-        COPLANAR = 0 # all the vertices are within EPSILON distance from plane
-        FRONT = 1 # all the vertices are in front of the plane
-        BACK = 2 # all the vertices are at the back of the plane
-        SPANNING = 3 # some vertices are in front, some in the back
-
-        # Classify each point as well as the entire polygon into one of the above
-        # four classes.
-        polygonType = 0
+        self.splitPolygons([polygon], coplanarFront, coplanarBack, front, back)
+
+    def splitPolygons(self, polygons, coplanarFront, coplanarBack, front, back):
+        """
+        Batch version of `splitPolygon()`. All vertices of all `polygons` are
+        classified against this plane in a single pass with the plane
+        coefficients held in local variables. Only the polygons that are truly
+        spanning the plane are handed to `_splitSpanning()` to build fragments.
+        The output lists receive the polygons in the same order as calling
+        `splitPolygon()` for each polygon would.
+        """
+        COPLANAR = Plane.COPLANAR
+        FRONT = Plane.FRONT
+        BACK = Plane.BACK
+        eps = Plane.EPSILON
+        neps = -eps
+        nx, ny, nz = self.normal.x, self.normal.y, self.normal.z
+        w = self.w
+
+        for polygon in polygons:
+            # Classify each point as well as the entire polygon into one of the
+            # four classes.
+            polygonType = 0
+            for v in polygon.vertices:
+                p = v.pos
+                t = nx * p.x + ny * p.y + nz * p.z - w
+                if t < neps:
+                    polygonType |= BACK
+                elif t > eps:
+                    polygonType |= FRONT
+
+            # Put the polygon in the correct list, splitting it when necessary.
+            if polygonType == COPLANAR:
+                n = polygon.plane.normal
+                if nx * n.x + ny * n.y + nz * n.z > 0:
+                    coplanarFront.append(polygon)
+                else:
+                    coplanarBack.append(polygon)
+            elif polygonType == FRONT:
+                front.append(polygon)
+            elif polygonType == BACK:
+                back.append(polygon)
+            else:
+                self._splitSpanning(polygon, front, back)
+
+    def _splitSpanning(self, polygon, front, back):
+        """
+        Split a `polygon` that has vertices on both sides of this plane and put
+        the front and back fragments in `front` and `back`.
+        """
+        COPLANAR = Plane.COPLANAR
+        FRONT = Plane.FRONT
+        BACK = Plane.BACK
+        SPANNING = Plane.SPANNING
+        eps = Plane.EPSILON
+
         vertexLocs = []
-        
+        for v in polygon.vertices:
+            t = self.normal.dot(v.pos) - self.w
+            if t < -eps:
+                vertexLocs.append(BACK)
+            elif t > eps:
+                vertexLocs.append(FRONT)
+            else:
+                vertexLocs.append(COPLANAR)
+
+        f = []
+        b = []
         numVertices = len(polygon.vertices)
         for i in range(numVertices):
-            t = self.normal.dot(polygon.vertices[i].pos) - self.w
-            loc = -1
-            if t < -Plane.EPSILON: 
-                loc = BACK
-            elif t > Plane.EPSILON: 
-                loc = FRONT
-            else: 
-                loc = COPLANAR
-            polygonType |= loc
-            vertexLocs.append(loc)
-    
-        # Put the polygon in the correct list, splitting it when necessary.
-        if polygonType == COPLANAR:
-            normalDotPlaneNormal = self.normal.dot(polygon.plane.normal)
-            if normalDotPlaneNormal > 0:
-                coplanarFront.append(polygon)
-            else:
-                coplanarBack.append(polygon)
-        elif polygonType == FRONT:
-            front.append(polygon)
-        elif polygonType == BACK:
-            back.append(polygon)
-        elif polygonType == SPANNING:
-            f = []
-            b = []
-            for i in range(numVertices):
-                j = (i+1) % numVertices
-                ti = vertexLocs[i]
-                tj = vertexLocs[j]
-                vi = polygon.vertices[i]
-                vj = polygon.vertices[j]
-                if ti != BACK: 
-                    f.append(vi)
-                if ti != FRONT:
-                    if ti != BACK: 
-                        b.append(vi.clone())
-                    else:
-                        b.append(vi)
-                if (ti | tj) == SPANNING:
-                    # interpolation weight at the intersection point
-                    t = (self.w - self.normal.dot(vi.pos)) / self.normal.dot(vj.pos.minus(vi.pos))
-                    # intersection point on the plane
-                    v = vi.interpolate(vj, t)
-                    f.append(v)
-                    b.append(v.clone())
-            if len(f) >= 3: 
-                front.append(Polygon(f, polygon.shared))
-            if len(b) >= 3: 
-                back.append(Polygon(b, polygon.shared))
+            j = (i+1) % numVertices
+            ti = vertexLocs[i]
+            tj = vertexLocs[j]
+            vi = polygon.vertices[i]
+            vj = polygon.vertices[j]
+            if ti != BACK:
+                f.append(vi)
+            if ti != FRONT:
+                if ti != BACK:
+                    b.append(vi.clone())
+                else:
+                    b.append(vi)
+            if (ti | tj) == SPANNING:
+                # interpolation weight at the intersection point
+                t = (self.w - self.normal.dot(vi.pos)) / self.normal.dot(vj.pos.minus(vi.pos))
+                # intersection point on the plane
+                v = vi.interpolate(vj, t)
+                f.append(v)
+                b.append(v.clone())
+        # the fragments lie in the plane of the polygon, which is shared rather
+        # than computed from their first vertices, which may be collinear
+        if len(f) >= 3:
+            front.append(Polygon(f, polygon.shared, polygon.plane))
+        if len(b) >= 3:
+            back.append(Polygon(b, polygon.shared, polygon.plane))
 
 class Polygon(object):
     """
@@ -271,13 +350,38 @@ class Polygon(object):
     Each convex polygon has a `shared` property, which is shared between all
     polygons that are clones of each other or were split from the same polygon.
     This can be used to define per-polygon properties (such as surface color).
+
+    Polygons, their vertices and planes are treated as immutable by the CSG
+    operations, which share them between their operands and results instead of
+    copying them. Use `flipped()` rather than `flip()`, and `clone()` a polygon
+    before modifying it in place.
     """
-    def __init__(self, vertices, shared=None):
+    __slots__ = ('vertices', 'shared', 'plane')
+
+    # sine of the angle at the first vertex below which the plane is computed
+    # from all vertices instead of the first three
+    COLLINEAR = 1.e-9
+
+    def __init__(self, vertices, shared=None, plane=None):
         self.vertices = vertices
         self.shared = shared
-        self.plane = Plane.fromPoints(vertices[0].pos, vertices[1].pos, vertices[2].pos)
+        if plane is None:
+            a = vertices[0].pos
+            ab = vertices[1].pos.minus(a)
+            ac = vertices[2].pos.minus(a)
+            n = ab.cross(ac)
+            length = n.length()
+            if length > Polygon.COLLINEAR * ab.length() * ac.length():
+                n = n.dividedBy(length)
+                plane = Plane(n, n.dot(a))
+            else:
+                # the first three vertices are (almost) collinear
+                plane = Plane.fromVertices(vertices)
+        self.plane = plane
     
     def clone(self):
+        # the plane is computed again, since the vertices of the copy may be
+        # moved before it is used
         vertices = list(map(lambda v: v.clone(), self.vertices))
         return Polygon(vertices, self.shared)
                 
@@ -286,6 +390,13 @@ class Polygon(object):
         map(lambda v: v.flip(), self.vertices)
         self.plane.flip()
 
+    def flipped(self):
+        """
+        Return a new polygon with the opposite orientation. The vertex objects
+        are shared with this polygon and left untouched.
+        """
+        return Polygon(self.vertices[::-1], self.shared, self.plane.flipped())
+
     def __repr__(self):
         return reduce(lambda x,y: x+y,
                       ['Polygon(['] + [repr(v) + ', ' \
@@ -300,114 +411,438 @@ class BSPNode(object):
     polygons) are added directly to that node and the other polygons are added to
     the front and/or back subtrees. This is not a leafy BSP tree since there is
     no distinction between internal and leaf nodes.
+
+    The polygon used to split a set of polygons is chosen by `splitStrategy`:
+
+        BSPNode.SPLIT_FIRST: the first polygon of the set (the default).
+        BSPNode.SPLIT_RANDOM: the best of the first polygon and
+            `SPLIT_CANDIDATES` randomly sampled ones, scored by the number of
+            polygons they split, the front/back balance they produce and the
+            number of polygons coplanar with them (see `SPLIT_WEIGHT`,
+            `BALANCE_WEIGHT` and `COPLANAR_WEIGHT`).
+        BSPNode.SPLIT_AXIS: like SPLIT_RANDOM, but only polygons whose plane is
+            perpendicular to a coordinate axis are considered as long as there
+            are any.
+
+    The non-default strategies spend extra time while building to produce
+    shallower trees with fewer fragment polygons. They cannot do much for a
+    large convex part, whose polygons end up in a chain of nodes whichever
+    order they are picked in, and such inputs can get deeper trees than with
+    SPLIT_FIRST. Random sampling is seeded, so a given input always yields
+    the same tree.
     """
-    def __init__(self, polygons=None):
+    SPLIT_FIRST = 'first'
+    SPLIT_RANDOM = 'random'
+    SPLIT_AXIS = 'axis'
+
+    # number of candidate polygons scored by the sampling strategies
+    SPLIT_CANDIDATES = 10
+    # maximum number of polygons a candidate plane is scored against
+    SPLIT_SAMPLE = 100
+    # score of a candidate, lowest wins: cost of each polygon it splits, of
+    # each polygon of front/back imbalance, and credit for each polygon
+    # coplanar with it, which is stored in the node and leaves the subtrees
+    SPLIT_WEIGHT = 2
+    BALANCE_WEIGHT = 1
+    COPLANAR_WEIGHT = 4
+
+    __slots__ = ('plane', 'front', 'back', 'polygons', 'center',
+                 'splitStrategy', '_random')
+
+    def __init__(self, polygons=None, splitStrategy=None):
         self.plane = None # Plane instance
         self.front = None # BSPNode
         self.back = None  # BSPNode
         self.polygons = []
+        # point on `plane` inside the region of this node, see `repair()`
+        self.center = None
+        self.splitStrategy = splitStrategy or BSPNode.SPLIT_FIRST
+        if self.splitStrategy not in (BSPNode.SPLIT_FIRST,
+                                      BSPNode.SPLIT_RANDOM,
+                                      BSPNode.SPLIT_AXIS):
+            raise ValueError('unknown split strategy %r' % (splitStrategy,))
+        self._random = None
         if polygons:
             self.build(polygons)
             
+    def _newNode(self):
+        # child nodes use the strategy and random stream of their parent
+        node = BSPNode(splitStrategy=self.splitStrategy)
+        node._random = self._random
+        return node
+
     def clone(self):
-        node = BSPNode()
-        if self.plane: 
-            node.plane = self.plane.clone()
-        if self.front: 
-            node.front = self.front.clone()
-        if self.back: 
-            node.back = self.back.clone()
-        node.polygons = list(map(lambda p: p.clone(), self.polygons))
+        node = self._newNode()
+        stack = [(self, node)]
+        while stack:
+            src, dst = stack.pop()
+            # planes and polygons are never modified, so they can be shared
+            dst.plane = src.plane
+            dst.center = src.center
+            dst.polygons = list(src.polygons)
+            if src.front:
+                dst.front = dst._newNode()
+                stack.append((src.front, dst.front))
+            if src.back:
+                dst.back = dst._newNode()
+                stack.append((src.back, dst.back))
         return node
-        
+
+    def nodes(self):
+        """
+        Return a list of all nodes in this BSP tree in depth-first order, this
+        node first, then the front subtree, then the back subtree.
+        """
+        nodes = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+            if node.back:
+                stack.append(node.back)
+            if node.front:
+                stack.append(node.front)
+        return nodes
+
+    def stats(self):
+        """
+        Return a dict describing the shape of this BSP tree:
+
+            nodes:          number of nodes
+            leaves:         number of nodes without children
+            depth:          number of levels
+            depthHistogram: number of nodes on each level, the root level first
+            polygons:       number of polygons stored in the nodes
+            polygonsPerNode: average number of polygons per node
+            maxPolygons:    largest number of polygons in one node
+            balance:        depth of a perfectly balanced tree with as many
+                            nodes divided by `depth`, 1.0 for a balanced tree
+                            and close to 0.0 for a degenerate one
+            bytes:          estimated memory held by the tree, counting shared
+                            planes, polygons and vertices once
+        """
+        histogram = []
+        numPolygons = 0
+        maxPolygons = 0
+        leaves = 0
+        size = 0
+        seen = set()
+        stack = [(self, 0)]
+        while stack:
+            node, level = stack.pop()
+            if level == len(histogram):
+                histogram.append(0)
+            histogram[level] += 1
+            n = len(node.polygons)
+            numPolygons += n
+            maxPolygons = max(maxPolygons, n)
+            size += sys.getsizeof(node) + sys.getsizeof(node.polygons)
+            for obj in [node.plane, node.center] + node.polygons:
+                size += BSPNode._footprint(obj, seen)
+            if node.front is None and node.back is None:
+                leaves += 1
+            if node.back is not None:
+                stack.append((node.back, level + 1))
+            if node.front is not None:
+                stack.append((node.front, level + 1))
+        numNodes = sum(histogram)
+        depth = len(histogram)
+        return {'nodes': numNodes,
+                'leaves': leaves,
+                'depth': depth,
+                'depthHistogram': histogram,
+                'polygons': numPolygons,
+                'polygonsPerNode': numPolygons / float(numNodes),
+                'maxPolygons': maxPolygons,
+                'balance': math.log(numNodes + 1, 2) / depth,
+                'bytes': size}
+
+    @staticmethod
+    def _footprint(obj, seen):
+        # bytes of a plane, polygon, vertex or vector not counted yet
+        if obj is None or id(obj) in seen:
+            return 0
+        seen.add(id(obj))
+        size = sys.getsizeof(obj)
+        if isinstance(obj, Polygon):
+            size += sys.getsizeof(obj.vertices) + BSPNode._footprint(obj.plane, seen)
+            for v in obj.vertices:
+                size += BSPNode._footprint(v, seen)
+        elif isinstance(obj, Vertex):
+            size += BSPNode._footprint(obj.pos, seen) + \
+                    BSPNode._footprint(obj.normal, seen)
+        elif isinstance(obj, Plane):
+            size += BSPNode._footprint(obj.normal, seen)
+        return size
+
     def invert(self):
         """ 
         Convert solid space to empty space and empty space to solid space.
+        Planes and polygons are replaced by flipped copies, the polygons this
+        tree was built from are not modified.
         """
-        for poly in self.polygons:
-            poly.flip()
-        self.plane.flip()
-        if self.front: 
-            self.front.invert()
-        if self.back: 
-            self.back.invert()
-        temp = self.front
-        self.front = self.back
-        self.back = temp
+        for node in self.nodes():
+            node.polygons = [poly.flipped() for poly in node.polygons]
+            if node.plane:
+                node.plane = node.plane.flipped()
+            node.front, node.back = node.back, node.front
         
     def clipPolygons(self, polygons):
         """ 
-        Recursively remove all polygons in `polygons` that are inside this BSP
-        tree.
+        Remove all polygons in `polygons` that are inside this BSP tree.
         """
+        monitor = _monitor.current()
+        if monitor is not None:
+            monitor.check('clipTo', clipped=len(polygons))
         if not self.plane: 
             return polygons[:]
 
-        front = []
-        back = []
-        for poly in polygons:
-            self.plane.splitPolygon(poly, front, back, front, back)
-
-        if self.front: 
-            front = self.front.clipPolygons(front)
-
-        if self.back: 
-            back = self.back.clipPolygons(back)
-        else:
+        result = []
+        # Walk the tree depth-first, front before back, so the polygons come
+        # out in the same order as with a recursive descent. An entry with no
+        # node holds polygons that ended up in front of a leaf and are kept.
+        stack = [(self, polygons)]
+        while stack:
+            node, polygons = stack.pop()
+            if node is None:
+                result.extend(polygons)
+                continue
+            front = []
             back = []
-
-        front.extend(back)
-        return front
+            node.plane.splitPolygons(polygons, front, back, front, back)
+            # polygons behind a node without back subtree are inside, drop them
+            if back and node.back:
+                stack.append((node.back, back))
+            if front:
+                stack.append((node.front, front))
+        return result
         
-    def clipTo(self, bsp):
+    def clipTo(self, bsp, bounds=None, keepOutside=True):
         """ 
         Remove all polygons in this BSP tree that are inside the other BSP tree
         `bsp`.
+
+        If `bounds` (a pair of [x, y, z] lists with the minimum and maximum
+        corner) is given, only polygons whose bounding box intersects it are
+        clipped. The other polygons are kept when `keepOutside` is True and
+        removed otherwise, so `bounds` must enclose all of the solid of `bsp`
+        (or all of its empty space when `bsp` is inverted).
         """
-        self.polygons = bsp.clipPolygons(self.polygons)
-        if self.front: 
-            self.front.clipTo(bsp)
-        if self.back: 
-            self.back.clipTo(bsp)
+        if bounds is None:
+            for node in self.nodes():
+                node.polygons = bsp.clipPolygons(node.polygons)
+            return
+        (x0, y0, z0), (x1, y1, z1) = bounds
+        for node in self.nodes():
+            inside = []
+            outside = []
+            for poly in node.polygons:
+                vertices = poly.vertices
+                p = vertices[0].pos
+                minX = maxX = p.x
+                minY = maxY = p.y
+                minZ = maxZ = p.z
+                for v in vertices:
+                    p = v.pos
+                    if p.x < minX: minX = p.x
+                    elif p.x > maxX: maxX = p.x
+                    if p.y < minY: minY = p.y
+                    elif p.y > maxY: maxY = p.y
+                    if p.z < minZ: minZ = p.z
+                    elif p.z > maxZ: maxZ = p.z
+                if minX > x1 or maxX < x0 or minY > y1 or maxY < y0 or \
+                   minZ > z1 or maxZ < z0:
+                    outside.append(poly)
+                else:
+                    inside.append(poly)
+            polygons = bsp.clipPolygons(inside)
+            if keepOutside:
+                polygons.extend(outside)
+            node.polygons = polygons
         
     def allPolygons(self):
         """
         Return a list of all polygons in this BSP tree.
         """
-        polygons = self.polygons[:]
-        if self.front: 
-            polygons.extend(self.front.allPolygons())
-        if self.back: 
-            polygons.extend(self.back.allPolygons())
+        polygons = []
+        for node in self.nodes():
+            polygons.extend(node.polygons)
         return polygons
         
-    def build(self, polygons):
+    def isInside(self, point):
+        """
+        Return True if `point` is in the solid space of this BSP tree.
+        """
+        node = self
+        if not node.plane:
+            return False
+        while True:
+            if node.plane.normal.dot(point) - node.plane.w >= 0:
+                if not node.front:
+                    return False
+                node = node.front
+            else:
+                if not node.back:
+                    return True
+                node = node.back
+
+    def repair(self, isInside, skip=None):
+        """
+        Make every leaf of this tree agree with the predicate `isInside(point)`.
+
+        A tree that is extended with `build()` after clipping classifies space
+        correctly wherever new polygons were added, but a region that got no
+        polygons keeps the label it had before, even if the solid now covers
+        it (or no longer does). For each empty front or back child, a point
+        just off the plane next to `center` is tested and a mismatching
+        region gets a child node with the flipped plane, which moves all of
+        the region to the other side. Children for which `skip(node, point)`
+        returns True are left alone.
+        """
+        delta = 10 * Plane.EPSILON
+        for node in self.nodes():
+            if node.center is None:
+                continue
+            offset = node.plane.normal.times(delta)
+            for front in (True, False):
+                child = node.front if front else node.back
+                if child:
+                    continue
+                if front:
+                    point = node.center.plus(offset)
+                else:
+                    point = node.center.minus(offset)
+                if skip is not None and skip(node, point):
+                    continue
+                # an empty front child is outside, an empty back child inside
+                if isInside(point) == front:
+                    child = node._newNode()
+                    child.plane = node.plane.flipped()
+                    child.center = node.center
+                    if front:
+                        node.front = child
+                    else:
+                        node.back = child
+
+    def _pickSplit(self, polygons):
+        """
+        Return the index in `polygons` of the polygon to split along according
+        to `splitStrategy`.
+        """
+        if self.splitStrategy == BSPNode.SPLIT_FIRST or len(polygons) < 3:
+            return 0
+        if self._random is None:
+            self._random = random.Random(len(polygons))
+        rnd = self._random
+        n = len(polygons)
+        if self.splitStrategy == BSPNode.SPLIT_AXIS:
+            candidates = []
+            for i in range(n):
+                normal = polygons[i].plane.normal
+                if max(abs(normal.x), abs(normal.y), abs(normal.z)) > 1. - Plane.EPSILON:
+                    candidates.append(i)
+            if not candidates:
+                candidates = range(n)
+        else:
+            candidates = range(n)
+        if len(candidates) > BSPNode.SPLIT_CANDIDATES:
+            candidates = rnd.sample(candidates, BSPNode.SPLIT_CANDIDATES)
+        if 0 not in candidates:
+            # never score worse than the default choice
+            candidates = [0] + list(candidates)
+        if n > BSPNode.SPLIT_SAMPLE:
+            sample = rnd.sample(polygons, BSPNode.SPLIT_SAMPLE)
+        else:
+            sample = polygons
+
+        eps = Plane.EPSILON
+        best = None
+        bestScore = None
+        for i in candidates:
+            plane = polygons[i].plane
+            nx, ny, nz = plane.normal.x, plane.normal.y, plane.normal.z
+            w = plane.w
+            numFront = numBack = numSplit = 0
+            for poly in sample:
+                polygonType = 0
+                for v in poly.vertices:
+                    p = v.pos
+                    t = nx * p.x + ny * p.y + nz * p.z - w
+                    if t < -eps:
+                        polygonType |= Plane.BACK
+                    elif t > eps:
+                        polygonType |= Plane.FRONT
+                if polygonType == Plane.FRONT:
+                    numFront += 1
+                elif polygonType == Plane.BACK:
+                    numBack += 1
+                elif polygonType == Plane.SPANNING:
+                    numSplit += 1
+            numCoplanar = len(sample) - numFront - numBack - numSplit
+            score = (BSPNode.SPLIT_WEIGHT * numSplit +
+                     BSPNode.BALANCE_WEIGHT * abs(numFront - numBack) -
+                     BSPNode.COPLANAR_WEIGHT * numCoplanar)
+            if bestScore is None or score < bestScore:
+                best = i
+                bestScore = score
+        return best
+
+    def build(self, polygons, exact=False):
         """
         Build a BSP tree out of `polygons`. When called on an existing tree, the
         new polygons are filtered down to the bottom of the tree and become new
-        nodes there. Each set of polygons is partitioned using the first polygon
-        (no heuristic is used to pick a good split).
-        """
-        if len(polygons) == 0:
-            return
-        if not self.plane: 
-            self.plane = polygons[0].plane.clone()
-        # add polygon to this node
-        self.polygons.append(polygons[0])
-        front = []
-        back = []
-        # split all other polygons using the first polygon's plane
-        for poly in polygons[1:]:
-            # coplanar front and back polygons go into self.polygons
-            self.plane.splitPolygon(poly, self.polygons, self.polygons,
-                                    front, back)
-        # recursively build the BSP tree
-        if len(front) > 0:
-            if not self.front:
-                self.front = BSPNode()
-            self.front.build(front)
-        if len(back) > 0:
-            if not self.back:
-                self.back = BSPNode()
-            self.back.build(back)
+        nodes there. Each set of polygons is partitioned using the polygon
+        chosen by `splitStrategy`.
 
+        On an existing node the first polygon of the set reaching it is stored
+        in that node without being classified. This is enough to collect the
+        polygons of a CSG result, but the tree then no longer partitions space
+        correctly. With `exact` every polygon is filtered down to where it
+        belongs, so that the tree can be used again (see `repair()`).
+        """
+        monitor = _monitor.current()
+        stack = [(self, polygons)]
+        while stack:
+            node, polygons = stack.pop()
+            if len(polygons) == 0:
+                continue
+            if monitor is not None:
+                numPolygons = len(node.polygons)
+            front = []
+            back = []
+            if not node.plane:
+                i = node._pickSplit(polygons)
+                if i:
+                    polygons = [polygons[i]] + polygons[:i] + polygons[i+1:]
+                node.plane = polygons[0].plane
+                x = y = z = 0.
+                vertices = polygons[0].vertices
+                for v in vertices:
+                    x += v.pos.x
+                    y += v.pos.y
+                    z += v.pos.z
+                n = float(len(vertices))
+                node.center = Vector(x / n, y / n, z / n)
+            elif exact:
+                node.plane.splitPolygons(polygons, node.polygons, node.polygons,
+                                         front, back)
+                polygons = []
+            if polygons:
+                # add polygon to this node
+                node.polygons.append(polygons[0])
+                polygons = polygons[1:]
+            # split the (other) polygons using the node's plane, coplanar front
+            # and back polygons go into node.polygons
+            node.plane.splitPolygons(polygons, node.polygons, node.polygons,
+                                     front, back)
+            if monitor is not None:
+                monitor.check('build', 1, len(node.polygons) - numPolygons)
+            # continue building the BSP tree below this node
+            if len(back) > 0:
+                if not node.back:
+                    node.back = node._newNode()
+                stack.append((node.back, back))
+            if len(front) > 0:
+                if not node.front:
+                    node.front = node._newNode()
+                stack.append((node.front, front))
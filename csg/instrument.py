@@ -0,0 +1,320 @@
+"""
+Per-phase timing and counters of boolean operations.
+
+Instrumentation is opt-in. Once enabled, every `CSG.union()`, `subtract()` and
+`intersect()` call is recorded with the time spent in each phase of the BSP
+algorithm and with counters of the work done::
+
+    from csg import instrument
+    profiler = instrument.enable()
+    ...
+    print(profiler.toDict()['operations'][-1]['phases'])
+    profiler.saveTrace('csg-trace.json') # open in chrome://tracing
+    instrument.disable()
+
+The phases are 'build', 'clipTo', 'invert', 'allPolygons' and 'repair'; time
+spent elsewhere in an operation (bounding boxes, copying polygons, building
+the result) is reported as 'other'. A phase called from inside another one,
+like the `build()` of a `BSPNode` constructor, is timed once, as the outer
+phase. The counters are:
+
+    splits:    polygons split by a plane
+    fragments: polygons created by these splits
+    nodes:     BSP nodes created by `build()`, not counting copies made by
+               `clone()` or nodes added by `repair()`
+    maxDepth:  depth of the deepest BSP tree built
+
+`enable()` hooks these phases by replacing methods of `CSG`, `BSPNode` and
+`Plane` with timing wrappers, and `disable()` puts the original methods back,
+so instrumentation costs nothing while it is disabled. Operations running in
+several threads at once are recorded separately, each with the thread it ran
+in; only `enable()` and `disable()` must not race with them.
+
+Observers added with `Profiler.addObserver()` are called as
+`observer(event, data)` where `event` is 'begin', 'phase' or 'end' and `data`
+is a dict: the operation name and operand sizes for 'begin', the phase name,
+start and duration for 'phase' and the complete record of the operation for
+'end'.
+"""
+import json
+import os
+import threading
+import time
+
+from csg.core import CSG
+from csg.geom import BSPNode, Plane
+
+PHASES = ('build', 'clipTo', 'invert', 'allPolygons', 'repair')
+COUNTERS = ('splits', 'fragments', 'nodes', 'maxDepth')
+
+class Profiler(object):
+    """
+    class Profiler
+
+    Collects one record per boolean operation while it is installed with
+    `enable()`.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.observers = []
+        self.origin = time.perf_counter()
+        # per thread: `active`, the records of the operations in progress,
+        # innermost last, and `phase`, the name of the phase being timed
+        self._local = threading.local()
+        self._originals = None
+
+    def _state(self):
+        state = self._local
+        try:
+            state.active
+        except AttributeError:
+            state.active = []
+            state.phase = None
+        return state
+
+    def addObserver(self, observer):
+        self.observers.append(observer)
+
+    def removeObserver(self, observer):
+        self.observers.remove(observer)
+
+    def _notify(self, event, data):
+        for observer in self.observers:
+            observer(event, data)
+
+    def clear(self):
+        """ Forget the records collected so far. """
+        del self.records[:]
+
+    def begin(self, op, a, b):
+        """ Start the record of the boolean operation `op` on `a` and `b`. """
+        record = {
+            'op': op,
+            'start': time.perf_counter() - self.origin,
+            'duration': 0.,
+            'polygons': [_numPolygons(a), _numPolygons(b)],
+            'result': None,
+            'phases': dict((name, {'time': 0., 'calls': 0})
+                           for name in PHASES + ('other',)),
+            'counters': dict((name, 0) for name in COUNTERS),
+            'events': [],
+            'thread': threading.current_thread().ident,
+        }
+        self._state().active.append(record)
+        self._notify('begin', {'op': op, 'polygons': record['polygons']})
+        return record
+
+    def end(self, record, result):
+        """ Finish `record` of an operation that returned `result`. """
+        record['duration'] = time.perf_counter() - self.origin - record['start']
+        if result is not None:
+            record['result'] = _numPolygons(result)
+        phases = record['phases']
+        phases['other']['time'] = max(0., record['duration'] - sum(
+            phases[name]['time'] for name in PHASES))
+        self._state().active.remove(record)
+        self.records.append(record)
+        self._notify('end', record)
+
+    def phase(self, name, func, *args, **kwargs):
+        """
+        Call `func(*args, **kwargs)` and add its duration to phase `name` of
+        the current operation, unless no operation or another phase is in
+        progress.
+        """
+        state = self._state()
+        if not state.active or state.phase is not None:
+            return func(*args, **kwargs)
+        state.phase = name
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            end = time.perf_counter()
+            state.phase = None
+            record = state.active[-1]
+            entry = record['phases'][name]
+            entry['time'] += end - start
+            entry['calls'] += 1
+            event = (name, start - self.origin, end - start)
+            record['events'].append(event)
+            if self.observers:
+                self._notify('phase', {'op': record['op'], 'phase': name,
+                                       'start': event[1], 'duration': event[2]})
+
+    def count(self, name, n=1):
+        active = self._state().active
+        if active:
+            active[-1]['counters'][name] += n
+
+    def depth(self, depth):
+        active = self._state().active
+        if active:
+            counters = active[-1]['counters']
+            counters['maxDepth'] = max(counters['maxDepth'], depth)
+
+    def toDict(self):
+        """
+        Return the collected data as a dict holding the list of operation
+        records and the totals of all phases and counters.
+        """
+        phases = dict((name, {'time': 0., 'calls': 0})
+                      for name in PHASES + ('other',))
+        counters = dict((name, 0) for name in COUNTERS)
+        for record in self.records:
+            for name, entry in record['phases'].items():
+                phases[name]['time'] += entry['time']
+                phases[name]['calls'] += entry['calls']
+            for name, value in record['counters'].items():
+                if name == 'maxDepth':
+                    counters[name] = max(counters[name], value)
+                else:
+                    counters[name] += value
+        return {'operations': [dict((k, v) for k, v in record.items()
+                                    if k != 'events')
+                               for record in self.records],
+                'phases': phases,
+                'counters': counters}
+
+    def toTrace(self):
+        """
+        Return the collected data in the Chrome trace event format, one
+        complete event per operation and per timed phase.
+        """
+        pid = os.getpid()
+        events = []
+        for record in self.records:
+            events.append({
+                'name': record['op'], 'cat': 'csg', 'ph': 'X',
+                'ts': record['start'] * 1.e6, 'dur': record['duration'] * 1.e6,
+                'pid': pid, 'tid': record['thread'],
+                'args': dict(record['counters'], polygons=record['polygons'],
+                             result=record['result'])})
+            for name, start, duration in record['events']:
+                events.append({
+                    'name': name, 'cat': 'phase', 'ph': 'X',
+                    'ts': start * 1.e6, 'dur': duration * 1.e6,
+                    'pid': pid, 'tid': record['thread']})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def saveTrace(self, filename):
+        """ Write `toTrace()` as JSON to `filename`. """
+        with open(filename, 'w') as f:
+            json.dump(self.toTrace(), f)
+
+    def install(self):
+        """ Replace the instrumented methods with timing wrappers. """
+        if self._originals is not None:
+            return
+        profiler = self
+        boolean = CSG._boolean
+        build = BSPNode.build
+        newNode = BSPNode._newNode
+        splitSpanning = Plane._splitSpanning
+        phased = [(BSPNode, name, getattr(BSPNode, name))
+                  for name in PHASES if name != 'build']
+        self._originals = [(CSG, '_boolean', boolean),
+                           (BSPNode, 'build', build),
+                           (BSPNode, '_newNode', newNode),
+                           (Plane, '_splitSpanning', splitSpanning)] + phased
+
+        def _boolean(self, op, csg, *args, **kwargs):
+            record = profiler.begin(op, self, csg)
+            result = None
+            try:
+                result = boolean(self, op, csg, *args, **kwargs)
+            finally:
+                profiler.end(record, result)
+            return result
+
+        def _build(self, polygons, exact=False):
+            state = profiler._state()
+            outer = state.phase is None
+            if outer and self.plane is None and polygons:
+                # the root node of a new tree
+                profiler.count('nodes')
+            result = profiler.phase('build', build, self, polygons, exact)
+            if outer and state.active:
+                profiler.depth(treeDepth(self))
+            return result
+
+        def _newNode(self):
+            if profiler._state().phase == 'build':
+                profiler.count('nodes')
+            return newNode(self)
+
+        def _splitSpanning(self, polygon, front, back):
+            n = len(front) + len(back)
+            splitSpanning(self, polygon, front, back)
+            profiler.count('splits')
+            profiler.count('fragments', len(front) + len(back) - n)
+
+        def timed(name, func):
+            def wrapper(*args, **kwargs):
+                return profiler.phase(name, func, *args, **kwargs)
+            wrapper.__name__ = func.__name__
+            wrapper.__doc__ = func.__doc__
+            return wrapper
+
+        CSG._boolean = _boolean
+        BSPNode.build = _build
+        BSPNode._newNode = _newNode
+        Plane._splitSpanning = _splitSpanning
+        for cls, name, func in phased:
+            setattr(cls, name, timed(name, func))
+
+    def uninstall(self):
+        """ Put back the methods replaced by `install()`. """
+        if self._originals is None:
+            return
+        for cls, name, func in self._originals:
+            setattr(cls, name, func)
+        self._originals = None
+
+def _numPolygons(solid):
+    """
+    Return the number of polygons of `solid`, a `CSG` or a `Mesh`, without
+    applying the pending transforms of a CSG.
+    """
+    parts = getattr(solid, '_parts', None)
+    if parts is not None:
+        return sum(len(polygons) for polygons, matrix in parts)
+    offsets = getattr(solid, 'offsets', None)
+    if offsets is not None:
+        return len(offsets) - 1
+    return len(getattr(solid, 'polygons', ()))
+
+def treeDepth(node):
+    """ Return the depth of the BSP tree below `node`. """
+    depth = 0
+    stack = [(node, 1)]
+    while stack:
+        node, d = stack.pop()
+        if d > depth:
+            depth = d
+        if node.front is not None:
+            stack.append((node.front, d + 1))
+        if node.back is not None:
+            stack.append((node.back, d + 1))
+    return depth
+
+def enable():
+    """
+    Start recording boolean operations and return the `Profiler` that
+    collects them.
+    """
+    if CSG.profiler is None:
+        CSG.profiler = Profiler()
+        CSG.profiler.install()
+    return CSG.profiler
+
+def disable():
+    """ Stop recording boolean operations. """
+    if CSG.profiler is not None:
+        CSG.profiler.uninstall()
+    CSG.profiler = None
+
+def current():
+    """ Return the `Profiler` in use, or None. """
+    return CSG.profiler
@@ -0,0 +1,194 @@
+"""
+Lazily evaluated CSG expressions.
+
+`CSG.lazy()` wraps a solid in a `LazyCSG`. Boolean operators and transforms on
+a `LazyCSG` do not compute anything, they return a new node of an expression
+graph. The graph is evaluated when its polygons are requested, e.g. by
+`toPolygons()` or `saveVTK()`::
+
+    base = CSG.cube().lazy()
+    hole = CSG.cylinder(radius=0.3).lazy()
+    part = base - hole.rotate([1, 0, 0], 90)
+    variant = part + CSG.sphere(center=[0, 1, 0]).lazy()
+    variant.saveVTK('variant.vtk')
+
+Every node is identified by a hash of its content: leaves by `CSG.digest()`,
+operations by their name, parameters and operand hashes. Identical
+subexpressions, even when they were built separately, are evaluated only once,
+and results are kept in a cache shared by all expressions so that recurring
+subassemblies are reused across evaluations.
+"""
+import hashlib
+from collections import OrderedDict
+
+from csg.core import CSG
+from csg.mesh import Mesh
+
+class LazyCSG(object):
+    """
+    class LazyCSG
+
+    Node of a lazily evaluated CSG expression graph. Create leaves with
+    `CSG.lazy()` or `LazyCSG(csg)`, everything else with the operators and
+    methods of this class.
+
+    A leaf keeps an `instance()` of its solid, so transforming the solid or
+    changing its list of polygons afterwards does not affect the expression.
+    Like for the boolean operations, the vertices of the solid must not be
+    modified in place; `clone()` it first.
+    """
+
+    # maximum number of evaluated subexpressions kept in `cache`
+    CACHE_SIZE = 256
+    # content hash -> evaluated CSG, least recently used first
+    cache = OrderedDict()
+
+    def __init__(self, csg=None, op=None, operands=(), params=()):
+        if isinstance(csg, Mesh):
+            csg = CSG.fromMesh(csg)
+        elif csg is not None:
+            csg = csg.instance()
+        self.csg = csg
+        self.op = op
+        self.operands = tuple(operands)
+        self.params = tuple(params)
+        self._key = None
+
+    @staticmethod
+    def _wrap(obj):
+        if isinstance(obj, LazyCSG):
+            return obj
+        return LazyCSG(obj)
+
+    def key(self):
+        """
+        Return the content hash identifying this expression.
+        """
+        if self._key is None:
+            # hash operands before their parents, without recursion
+            stack = [self]
+            while stack:
+                node = stack[-1]
+                missing = [x for x in node.operands if x._key is None]
+                if missing:
+                    stack.extend(missing)
+                    continue
+                stack.pop()
+                if node._key is not None:
+                    continue
+                if node.op is None:
+                    node._key = node.csg.digest()
+                else:
+                    h = hashlib.sha256(repr((node.op, node.params)).encode('utf-8'))
+                    for x in node.operands:
+                        h.update(x._key.encode('ascii'))
+                    node._key = h.hexdigest()
+        return self._key
+
+    def union(self, csg):
+        return LazyCSG(op='union', operands=(self, LazyCSG._wrap(csg)))
+
+    def __add__(self, csg):
+        return self.union(csg)
+
+    def subtract(self, csg):
+        return LazyCSG(op='subtract', operands=(self, LazyCSG._wrap(csg)))
+
+    def __sub__(self, csg):
+        return self.subtract(csg)
+
+    def intersect(self, csg):
+        return LazyCSG(op='intersect', operands=(self, LazyCSG._wrap(csg)))
+
+    def __mul__(self, csg):
+        return self.intersect(csg)
+
+    def translate(self, disp):
+        """
+        Return a new expression for this one translated by `disp`. Unlike
+        `CSG.translate()` this does not modify anything.
+        """
+        return LazyCSG(op='translate', operands=(self,),
+                       params=(tuple(float(x) for x in disp),))
+
+    def rotate(self, axis, angleDeg):
+        """
+        Return a new expression for this one rotated by `angleDeg` degrees
+        around `axis`. Unlike `CSG.rotate()` this does not modify anything.
+        """
+        return LazyCSG(op='rotate', operands=(self,),
+                       params=(tuple(float(x) for x in axis), float(angleDeg)))
+
+    def _evaluate(self):
+        """
+        Return the evaluated CSG of this expression. The returned solid may be
+        shared with the cache and must not be modified.
+        """
+        cache = LazyCSG.cache
+        # key -> solid of every node this evaluation needs, so that evicting
+        # entries from `cache` while it runs cannot lose operand results
+        results = {}
+        stack = [self]
+        while stack:
+            node = stack[-1]
+            key = node.key()
+            if key in results:
+                stack.pop()
+                continue
+            if node.op is None:
+                results[key] = node.csg
+                stack.pop()
+                continue
+            if key in cache:
+                cache.move_to_end(key)
+                results[key] = cache[key]
+                stack.pop()
+                continue
+            missing = [x for x in node.operands if x.key() not in results]
+            if missing:
+                stack.extend(missing)
+                continue
+            stack.pop()
+            operands = [results[x.key()] for x in node.operands]
+            if node.op == 'translate':
+                # transforms replace the polygons, the operand is not modified
+                result = CSG.fromPolygons(operands[0].polygons)
+                result.translate(*node.params)
+            elif node.op == 'rotate':
+                result = CSG.fromPolygons(operands[0].polygons)
+                result.rotate(*node.params)
+            else:
+                result = getattr(operands[0], node.op)(operands[1])
+            results[key] = result
+            cache[key] = result
+            while len(cache) > LazyCSG.CACHE_SIZE:
+                cache.popitem(last=False)
+        return results[self.key()]
+
+    def evaluate(self):
+        """
+        Evaluate this expression and return the result as a new CSG solid.
+        """
+        return self._evaluate().clone()
+
+    def toPolygons(self):
+        return self.evaluate().toPolygons()
+
+    def toMesh(self, tolerance=None):
+        return self._evaluate().toMesh(tolerance)
+
+    def toVerticesAndPolygons(self, tolerance=None):
+        return self._evaluate().toVerticesAndPolygons(tolerance)
+
+    def saveVTK(self, filename, tolerance=None, binary=False):
+        self._evaluate().saveVTK(filename, tolerance, binary)
+
+    @classmethod
+    def clearCache(cls):
+        cls.cache.clear()
+
+    def __repr__(self):
+        if self.op is None:
+            return 'LazyCSG(%d polygons)' % len(self.csg.polygons)
+        return 'LazyCSG(%s, %s)' % (self.op, ', '.join(
+            [repr(x) for x in self.operands] + [repr(p) for p in self.params]))
@@ -0,0 +1,384 @@
+import hashlib
+import math
+import sys
+from array import array
+from csg.geom import Vector, Vertex, Plane, Polygon
+
+# stored in `Mesh.normals` for vertices without a normal
+_NO_NORMAL = (float('nan'),) * 3
+
+class Mesh(object):
+    """
+    class Mesh
+
+    Compact, array-backed representation of a collection of polygons. Instead
+    of one `Polygon` object per face holding `Vertex` objects that each own two
+    `Vector` objects, all data lives in a handful of flat arrays:
+
+        positions: array('d') with x, y, z for each vertex
+        normals:   array('d') with nx, ny, nz for each vertex, NaN for a
+                   vertex whose normal is None
+        offsets:   array('i') with numPolygons + 1 entries; polygon `i` uses
+                   the vertex indices `indices[offsets[i]:offsets[i + 1]]`
+        indices:   array('i') with the vertex indices of all polygons
+        planes:    array('d') with nx, ny, nz, w for each polygon
+        shared:    list with the `shared` property of each polygon
+
+    The arrays support the buffer protocol, so they can be wrapped without
+    copying by e.g. `numpy.frombuffer(mesh.positions)`.
+
+    Example usage::
+
+        mesh = CSG.sphere(slices=64, stacks=32).toMesh()
+        csg = CSG.fromMesh(mesh)
+    """
+    # default tolerance of `weld()`
+    WELD_TOLERANCE = 1.e-10
+
+    def __init__(self, positions=None, normals=None, offsets=None,
+                 indices=None, planes=None, shared=None):
+        self.positions = array('d', positions or [])
+        self.normals = array('d', normals or [])
+        self.offsets = array('i', offsets or [0])
+        self.indices = array('i', indices or [])
+        self.planes = array('d', planes or [])
+        self.shared = list(shared or [None] * (len(self.offsets) - 1))
+
+    @classmethod
+    def fromPolygons(cls, polygons, tolerance=None):
+        """
+        Build a mesh from a list of `Polygon` instances. Vertex objects that
+        are used by several polygons are stored only once. If `tolerance` is
+        given, vertices are welded like `weld()` does while they are added.
+        """
+        mesh = cls()
+        positions = mesh.positions
+        normals = mesh.normals
+        offsets = mesh.offsets
+        indices = mesh.indices
+        planes = mesh.planes
+        shared = mesh.shared
+        if tolerance is None:
+            vertexIndex = {}
+            for poly in polygons:
+                for v in poly.vertices:
+                    key = id(v)
+                    index = vertexIndex.get(key)
+                    if index is None:
+                        index = len(vertexIndex)
+                        vertexIndex[key] = index
+                        p = v.pos
+                        n = v.normal
+                        positions.extend((p.x, p.y, p.z))
+                        if n is None:
+                            normals.extend(_NO_NORMAL)
+                        else:
+                            normals.extend((n.x, n.y, n.z))
+                    indices.append(index)
+                offsets.append(len(indices))
+                n = poly.plane.normal
+                planes.extend((n.x, n.y, n.z, poly.plane.w))
+                shared.append(poly.shared)
+        else:
+            welder = _Welder(mesh, tolerance)
+            exact = welder.exact
+            for poly in polygons:
+                for v in poly.vertices:
+                    p = v.pos
+                    key = (p.x, p.y, p.z)
+                    index = exact.get(key)
+                    if index is None:
+                        n = v.normal
+                        if n is None:
+                            index = welder.add(key, _NO_NORMAL)
+                        else:
+                            index = welder.add(key, (n.x, n.y, n.z))
+                    indices.append(index)
+                offsets.append(len(indices))
+                n = poly.plane.normal
+                planes.extend((n.x, n.y, n.z, poly.plane.w))
+                shared.append(poly.shared)
+        return mesh
+
+    def toPolygons(self, share=False):
+        """
+        Return a list of `Polygon` instances that keep the planes stored in
+        the mesh. Every polygon gets its own `Vertex` and `Plane` objects,
+        unless `share` is True: then the polygons using a vertex of the mesh
+        share one `Vertex` object, and polygons with equal planes one `Plane`.
+        """
+        positions = self.positions
+        normals = self.normals
+        indices = self.indices
+        planes = self.planes
+        shared = self.shared
+        offsets = self.offsets
+        vertexCache = {} if share else None
+        planeCache = {} if share else None
+        polygons = []
+        for i in range(len(offsets) - 1):
+            vertices = []
+            for k in range(offsets[i], offsets[i + 1]):
+                index = indices[k]
+                if vertexCache is not None:
+                    v = vertexCache.get(index)
+                    if v is not None:
+                        vertices.append(v)
+                        continue
+                j = 3 * index
+                nx = normals[j]
+                if nx != nx:
+                    v = Vertex(Vector(positions[j], positions[j + 1],
+                                      positions[j + 2]))
+                    v.normal = None
+                else:
+                    v = Vertex(
+                        Vector(positions[j], positions[j + 1], positions[j + 2]),
+                        Vector(nx, normals[j + 1], normals[j + 2]))
+                if vertexCache is not None:
+                    vertexCache[index] = v
+                vertices.append(v)
+            j = 4 * i
+            if planeCache is None:
+                plane = Plane(Vector(planes[j], planes[j + 1], planes[j + 2]),
+                              planes[j + 3])
+            else:
+                key = planes[j:j + 4].tobytes()
+                plane = planeCache.get(key)
+                if plane is None:
+                    plane = planeCache[key] = Plane(
+                        Vector(planes[j], planes[j + 1], planes[j + 2]),
+                        planes[j + 3])
+            polygons.append(Polygon(vertices, shared[i], plane))
+        return polygons
+
+    def weld(self, tolerance=None):
+        """
+        Return a new mesh in which vertices that lie within `tolerance` of each
+        other along every axis are merged into one. Merged vertices take the
+        position and normal of the first of them. Polygons, planes and `shared`
+        values are kept, and the vertices stay in order of first use.
+
+        Positions that are exactly equal are merged through a dict lookup.
+        Otherwise the vertex is located on a grid of cells twice the size of
+        `tolerance`, and only its own cell and the 7 neighbouring cells on the
+        side it is closest to are searched. A `tolerance` of 0 merges exactly
+        equal positions only. The default is `Mesh.WELD_TOLERANCE`.
+        """
+        if tolerance is None:
+            tolerance = Mesh.WELD_TOLERANCE
+        positions = self.positions
+        normals = self.normals
+        mesh = Mesh()
+        welder = _Welder(mesh, tolerance)
+        exact = welder.exact
+        remap = array('i', [0]) * self.numVertices()
+        for n in range(self.numVertices()):
+            j = 3 * n
+            key = (positions[j], positions[j + 1], positions[j + 2])
+            index = exact.get(key)
+            if index is None:
+                index = welder.add(key, normals[j:j + 3])
+            remap[n] = index
+        mesh.offsets = array('i', self.offsets)
+        mesh.indices = array('i', [remap[i] for i in self.indices])
+        mesh.planes = array('d', self.planes)
+        mesh.shared = list(self.shared)
+        return mesh
+
+    def refine(self, levels=1):
+        """
+        Return a new mesh in which every polygon is refined `levels` times,
+        like `CSG.refine()` does: a vertex is added in the middle of each edge
+        and at the center of the polygon, and the polygon is replaced by one
+        quad per corner. The quads keep the plane and `shared` value of the
+        polygon.
+
+        Vertices with equal positions and normals are merged first, so the
+        midpoint of an edge is computed once and used by the polygons on both
+        sides of it. A midpoint has no normal if an end of the edge has none,
+        and the center gets the plane normal if the first vertex has one.
+        """
+        positions = array('d')
+        normals = array('d')
+        vertexIndex = {} # position and normal -> index of the merged vertex
+        remap = array('i', [0]) * self.numVertices()
+        for n in range(self.numVertices()):
+            j = 3 * n
+            p = self.positions[j:j + 3]
+            normal = self.normals[j:j + 3]
+            key = (tuple(p), None if normal[0] != normal[0] else tuple(normal))
+            index = vertexIndex.get(key)
+            if index is None:
+                index = vertexIndex[key] = len(positions) // 3
+                positions.extend(p)
+                normals.extend(normal)
+            remap[n] = index
+        offsets = self.offsets
+        indices = array('i', [remap[i] for i in self.indices])
+        planes = self.planes
+        shared = self.shared
+        for level in range(levels):
+            newOffsets = array('i', [0])
+            newIndices = array('i')
+            newPlanes = array('d')
+            newShared = []
+            midpoints = {} # (lower index, higher index) -> midpoint index
+            for i in range(len(offsets) - 1):
+                corners = indices[offsets[i]:offsets[i + 1]]
+                numCorners = len(corners)
+                if numCorners == 0:
+                    continue
+                plane = planes[4 * i:4 * i + 4]
+                x = y = z = 0.
+                for a in corners:
+                    j = 3 * a
+                    x += positions[j]
+                    y += positions[j + 1]
+                    z += positions[j + 2]
+                center = len(positions) // 3
+                positions.extend((x / numCorners, y / numCorners,
+                                  z / numCorners))
+                if normals[3 * corners[0]] != normals[3 * corners[0]]:
+                    normals.extend(_NO_NORMAL)
+                else:
+                    normals.extend(plane[:3])
+                mids = []
+                for k in range(numCorners):
+                    a = corners[k]
+                    b = corners[(k + 1) % numCorners]
+                    key = (a, b) if a < b else (b, a)
+                    m = midpoints.get(key)
+                    if m is None:
+                        m = midpoints[key] = len(positions) // 3
+                        ja = 3 * a
+                        jb = 3 * b
+                        for d in range(3):
+                            pa = positions[ja + d]
+                            positions.append(pa + (positions[jb + d] - pa) * 0.5)
+                        if normals[ja] != normals[ja] or \
+                           normals[jb] != normals[jb]:
+                            normals.extend(_NO_NORMAL)
+                        else:
+                            for d in range(3):
+                                na = normals[ja + d]
+                                normals.append(na + (normals[jb + d] - na) * 0.5)
+                    mids.append(m)
+                for k in range(numCorners):
+                    newIndices.extend((corners[k], mids[k], center, mids[k - 1]))
+                    newOffsets.append(len(newIndices))
+                    newPlanes.extend(plane)
+                    newShared.append(shared[i])
+            offsets = newOffsets
+            indices = newIndices
+            planes = newPlanes
+            shared = newShared
+        mesh = Mesh()
+        mesh.positions = positions
+        mesh.normals = normals
+        mesh.offsets = array('i', offsets)
+        mesh.indices = array('i', indices)
+        mesh.planes = array('d', planes)
+        mesh.shared = list(shared)
+        return mesh
+
+    def clone(self):
+        return Mesh(self.positions, self.normals, self.offsets, self.indices,
+                    self.planes, self.shared)
+
+    def numPolygons(self):
+        return len(self.offsets) - 1
+
+    def numVertices(self):
+        return len(self.positions) // 3
+
+    def __len__(self):
+        return self.numPolygons()
+
+    def polygonIndices(self, i):
+        """ Return the vertex indices of polygon `i`. """
+        return self.indices[self.offsets[i]:self.offsets[i + 1]]
+
+    def nbytes(self):
+        """ Return the number of bytes held by the arrays of this mesh. """
+        return sum(a.itemsize * len(a) for a in (
+            self.positions, self.normals, self.offsets, self.indices,
+            self.planes))
+
+    def digest(self):
+        """
+        Return a hex digest of the content of this mesh, which is the same for
+        meshes with equal arrays and `shared` values on any platform.
+        """
+        h = hashlib.sha256()
+        for a in (self.positions, self.normals, self.offsets, self.indices,
+                  self.planes):
+            if sys.byteorder != 'little':
+                a = array(a.typecode, a)
+                a.byteswap()
+            h.update(a.tobytes())
+        if any(s is not None for s in self.shared):
+            h.update(repr(self.shared).encode('utf-8'))
+        return h.hexdigest()
+
+    def __repr__(self):
+        return 'Mesh(%d vertices, %d polygons)' % (self.numVertices(),
+                                                   self.numPolygons())
+
+class _Welder(object):
+    """
+    Adds vertices to the arrays of `mesh`, merging each one with an earlier
+    vertex within `tolerance` along every axis (see `Mesh.weld()`).
+    """
+    def __init__(self, mesh, tolerance):
+        self.positions = mesh.positions
+        self.normals = mesh.normals
+        self.tolerance = tolerance
+        self.inv = 0.5 / tolerance if tolerance > 0 else 0.
+        self.exact = {} # (x, y, z) -> vertex index
+        self.cells = {} # (i, j, k) -> list of vertex indices
+
+    def add(self, key, normal):
+        """
+        Return the index of the vertex at the position `key`, an (x, y, z)
+        tuple that is not in `exact` yet, appending it if no vertex is close.
+        """
+        positions = self.positions
+        tolerance = self.tolerance
+        inv = self.inv
+        x, y, z = key
+        index = None
+        if inv:
+            fx = x * inv
+            fy = y * inv
+            fz = z * inv
+            i0 = int(math.floor(fx))
+            j0 = int(math.floor(fy))
+            k0 = int(math.floor(fz))
+            cell = (i0, j0, k0)
+            di = -1 if fx - i0 < 0.5 else 1
+            dj = -1 if fy - j0 < 0.5 else 1
+            dk = -1 if fz - k0 < 0.5 else 1
+            cells = self.cells
+            for c in (cell,
+                      (i0 + di, j0, k0), (i0, j0 + dj, k0),
+                      (i0, j0, k0 + dk), (i0 + di, j0 + dj, k0),
+                      (i0 + di, j0, k0 + dk), (i0, j0 + dj, k0 + dk),
+                      (i0 + di, j0 + dj, k0 + dk)):
+                for m in cells.get(c, ()):
+                    k = 3 * m
+                    if abs(positions[k] - x) <= tolerance and \
+                       abs(positions[k + 1] - y) <= tolerance and \
+                       abs(positions[k + 2] - z) <= tolerance:
+                        index = m
+                        break
+                if index is not None:
+                    break
+        if index is None:
+            index = len(positions) // 3
+            positions.extend(key)
+            self.normals.extend(normal)
+            if inv:
+                cells.setdefault(cell, []).append(index)
+        self.exact[key] = index
+        return index
@@ -0,0 +1,167 @@
+"""
+Progress reporting, cancellation and budgets of boolean operations.
+
+`CSG.union()`, `subtract()`, `intersect()`, `unionAll()` and `subtractAll()`
+accept a `progress` callback, a cancellation `token` and a `budget`::
+
+    from csg.monitor import Budget, CancelToken, Cancelled
+
+    token = CancelToken() # token.cancel() may be called from another thread
+    try:
+        c = a.subtract(b, progress=print, token=token,
+                       budget=Budget(seconds=60., polygons=10 ** 6))
+    except Cancelled as e:
+        print(e, e.stats)
+
+The operation checks the token and the budget after each node
+`BSPNode.build()` works on and every time `BSPNode.clipPolygons()` is called,
+and raises `Cancelled`, or `BudgetExceeded` if a limit was hit, with the
+statistics of the work done so far. The operands are not modified by a
+boolean operation, so they can be used again after it was interrupted, and
+nothing is stored in `CSG.resultCache`.
+
+`progress(stats)` is called when the operation enters a phase ('build' or
+'clipTo'), at most every `Monitor.INTERVAL` seconds while it runs and once
+with the phase 'done' at the end. `stats` is a dict with:
+
+    op:       the operation, e.g. 'subtract'
+    phase:    the phase in progress
+    elapsed:  seconds since the operation started
+    nodes:    BSP nodes `build()` worked on
+    built:    polygons stored in BSP tree nodes by `build()`, including
+              the polygons of the operands and the fragments split from them
+    clipped:  polygons passed to `clipPolygons()`
+
+The polygon budget limits `built + clipped`, the number of polygons the
+operation processed, which grows quickly when splitting gets out of hand.
+Operations started while another one is monitored in the same thread, like
+the unions of `unionAll()`, are counted as part of it.
+"""
+import threading
+import time
+
+class Cancelled(Exception):
+    """
+    class Cancelled
+
+    Raised by a boolean operation that was cancelled through its
+    `CancelToken`. `stats` holds the statistics of the work done so far.
+    """
+
+    def __init__(self, message, stats):
+        Exception.__init__(self, message)
+        self.stats = stats
+
+class BudgetExceeded(Cancelled):
+    """
+    class BudgetExceeded
+
+    Raised by a boolean operation that ran out of its `Budget`. `limit` is
+    'seconds' or 'polygons'.
+    """
+
+    def __init__(self, message, stats, limit):
+        Cancelled.__init__(self, message, stats)
+        self.limit = limit
+
+class CancelToken(object):
+    """
+    class CancelToken
+
+    Lets any thread ask the operations it was passed to to stop.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    def isCancelled(self):
+        return self._event.is_set()
+
+class Budget(object):
+    """
+    class Budget
+
+    Limits on the wall time in `seconds` and on the number of `polygons`
+    processed by one operation. None means no limit.
+    """
+
+    def __init__(self, seconds=None, polygons=None):
+        self.seconds = seconds
+        self.polygons = polygons
+
+class Monitor(object):
+    """
+    class Monitor
+
+    Tracks one monitored operation in the thread running it, see `start()`.
+    """
+    # seconds between two progress reports within a phase
+    INTERVAL = 0.1
+
+    def __init__(self, op, progress=None, token=None, budget=None):
+        self.progress = progress
+        self.token = token
+        self.budget = budget or Budget()
+        self.stats = {'op': op, 'phase': None, 'elapsed': 0., 'nodes': 0,
+                      'built': 0, 'clipped': 0}
+        self._start = None
+        self._reported = None
+        self._previous = None
+
+    def start(self):
+        """
+        Make this the monitor of the operations run by the current thread
+        until `finish()` is called.
+        """
+        self._start = self._reported = time.perf_counter()
+        self._previous = getattr(_local, 'monitor', None)
+        _local.monitor = self
+
+    def finish(self, done=True):
+        """
+        Restore the monitor that was in use before `start()` and report the
+        'done' phase if `done` is set.
+        """
+        _local.monitor = self._previous
+        if done and self.progress is not None:
+            stats = self.stats
+            stats['phase'] = 'done'
+            stats['elapsed'] = time.perf_counter() - self._start
+            self.progress(dict(stats))
+
+    def check(self, phase, nodes=0, built=0, clipped=0):
+        """
+        Add the counts to the statistics of phase `phase`, report progress
+        and raise `Cancelled` if the operation must stop.
+        """
+        stats = self.stats
+        stats['nodes'] += nodes
+        stats['built'] += built
+        stats['clipped'] += clipped
+        now = time.perf_counter()
+        elapsed = stats['elapsed'] = now - self._start
+        if self.progress is not None and (phase != stats['phase'] or
+                now - self._reported >= Monitor.INTERVAL):
+            stats['phase'] = phase
+            self._reported = now
+            self.progress(dict(stats))
+        stats['phase'] = phase
+        if self.token is not None and self.token.isCancelled():
+            raise Cancelled('%s cancelled' % stats['op'], dict(stats))
+        budget = self.budget
+        if budget.seconds is not None and elapsed > budget.seconds:
+            raise BudgetExceeded('%s ran out of time after %.3g s' % (
+                stats['op'], elapsed), dict(stats), 'seconds')
+        if budget.polygons is not None and \
+           stats['built'] + stats['clipped'] > budget.polygons:
+            raise BudgetExceeded('%s processed more than %d polygons' % (
+                stats['op'], budget.polygons), dict(stats), 'polygons')
+
+_local = threading.local()
+
+def current():
+    """ Return the `Monitor` of the operation running in this thread, or None. """
+    return getattr(_local, 'monitor', None)
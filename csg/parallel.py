@@ -0,0 +1,138 @@
+"""
+Evaluation of trees of CSG operations on a process pool.
+
+A tree is a nested tuple whose first item names the operation and whose other
+items are the operands, either CSG solids (or meshes) or other trees::
+
+    from csg.core import CSG
+    from csg import parallel
+
+    tree = ('subtract',
+            ('union', CSG.cube(), CSG.sphere(center=[1, 0, 0])),
+            ('union', CSG.cylinder(radius=0.3), CSG.cylinder(radius=0.2,
+                                                 start=[-2, 0, 0],
+                                                 end=[2, 0, 0])))
+    result = parallel.evaluate(tree, workers=4)
+
+The operations are 'union', 'subtract' and 'intersect'; with more than two
+operands they are applied from left to right, e.g. ('subtract', a, b, c) is
+`a - b - c`. A bare solid is a tree too, which evaluates to a copy of it.
+Independent subtrees are evaluated concurrently, operands and
+results travel between processes as array-backed `Mesh` instances. With one
+worker the tree is evaluated in this process, which gives the same polygons.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from csg.core import CSG
+
+OPERATIONS = ('union', 'subtract', 'intersect')
+
+def _flatten(tree):
+    """
+    Return the operation nodes of `tree` in post-order as a list of
+    (operation, operands) pairs. An operand is either a CSG solid or the index
+    of an earlier node whose result it uses.
+    """
+    if not isinstance(tree, tuple):
+        # a bare solid
+        tree = ('union', tree)
+    nodes = []
+    # entries are (tree, operands evaluated so far)
+    stack = [(tree, [])]
+    while stack:
+        node, operands = stack[-1]
+        if not node:
+            raise ValueError('empty CSG operation')
+        if len(operands) == len(node) - 1:
+            stack.pop()
+            op = node[0]
+            if op not in OPERATIONS:
+                raise ValueError('unknown CSG operation %r' % (op,))
+            if not operands:
+                raise ValueError('%s needs at least one operand' % op)
+            nodes.append((op, operands))
+            if stack:
+                stack[-1][1].append(len(nodes) - 1)
+            continue
+        child = node[len(operands) + 1]
+        if isinstance(child, tuple):
+            stack.append((child, []))
+        else:
+            child = CSG._toCSG(child)
+            if not isinstance(child, CSG):
+                raise ValueError('%s operand is not a CSG solid or mesh: %r'
+                                 % (node[0], child))
+            operands.append(child)
+    return nodes
+
+def apply(op, operands, splitStrategy=None):
+    """
+    Apply the operation `op` from left to right to the list of CSG solids
+    `operands` and return the resulting CSG solid.
+    """
+    result = operands[0]
+    for csg in operands[1:]:
+        result = getattr(result, op)(csg, splitStrategy)
+    if len(operands) == 1:
+        result = CSG.fromPolygons(result._sharedPolygons())
+    return result
+
+def _applyMeshes(op, meshes, splitStrategy):
+    # runs in a worker process
+    operands = [CSG.fromMesh(mesh) for mesh in meshes]
+    return apply(op, operands, splitStrategy).toMesh()
+
+def evaluate(tree, workers=None, splitStrategy=None, executor=None):
+    """
+    Evaluate the CSG operation tree `tree` and return the resulting CSG solid.
+
+    `workers` is the number of worker processes and defaults to the number of
+    CPUs; with one worker (or less) everything runs serially in this process.
+    An existing `concurrent.futures` `executor` can be passed instead.
+    """
+    nodes = _flatten(tree)
+    if executor is None:
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers <= 1 or len(nodes) == 1:
+            results = []
+            for op, operands in nodes:
+                operands = [results[x] if isinstance(x, int) else x
+                            for x in operands]
+                results.append(apply(op, operands, splitStrategy))
+            return results[-1]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return _evaluateOn(pool, nodes, splitStrategy)
+    return _evaluateOn(executor, nodes, splitStrategy)
+
+def _evaluateOn(executor, nodes, splitStrategy):
+    meshes = {} # leaf solid id -> Mesh
+    results = [None] * len(nodes)
+    pending = {} # future -> node index
+    waiting = set(range(len(nodes)))
+
+    def submitReady():
+        for i in sorted(waiting):
+            op, operands = nodes[i]
+            if all(not isinstance(x, int) or results[x] is not None
+                   for x in operands):
+                args = []
+                for x in operands:
+                    if isinstance(x, int):
+                        args.append(results[x])
+                    else:
+                        if id(x) not in meshes:
+                            meshes[id(x)] = x.toMesh()
+                        args.append(meshes[id(x)])
+                waiting.discard(i)
+                pending[executor.submit(_applyMeshes, op, args,
+                                        splitStrategy)] = i
+
+    submitReady()
+    while pending:
+        done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+        for future in done:
+            results[pending.pop(future)] = future.result()
+        submitReady()
+    return CSG.fromMesh(results[-1])
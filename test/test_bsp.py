@@ -1,10 +1,68 @@
 import os
+import random
 import sys
 import unittest
 
 sys.path.insert(0, os.getcwd())
 
-from csg.geom import BSPNode, Polygon, Vector, Vertex
+from csg.core import CSG
+from csg.geom import BSPNode, Plane, Polygon, Vector, Vertex
+
+def splitPolygonReference(plane, polygon, coplanarFront, coplanarBack, front,
+                          back):
+    # the original per-polygon Plane.splitPolygon()
+    COPLANAR = 0
+    FRONT = 1
+    BACK = 2
+    SPANNING = 3
+    polygonType = 0
+    vertexLocs = []
+    numVertices = len(polygon.vertices)
+    for i in range(numVertices):
+        t = plane.normal.dot(polygon.vertices[i].pos) - plane.w
+        if t < -Plane.EPSILON:
+            loc = BACK
+        elif t > Plane.EPSILON:
+            loc = FRONT
+        else:
+            loc = COPLANAR
+        polygonType |= loc
+        vertexLocs.append(loc)
+    if polygonType == COPLANAR:
+        if plane.normal.dot(polygon.plane.normal) > 0:
+            coplanarFront.append(polygon)
+        else:
+            coplanarBack.append(polygon)
+    elif polygonType == FRONT:
+        front.append(polygon)
+    elif polygonType == BACK:
+        back.append(polygon)
+    elif polygonType == SPANNING:
+        f = []
+        b = []
+        for i in range(numVertices):
+            j = (i + 1) % numVertices
+            ti = vertexLocs[i]
+            tj = vertexLocs[j]
+            vi = polygon.vertices[i]
+            vj = polygon.vertices[j]
+            if ti != BACK:
+                f.append(vi)
+            if ti != FRONT:
+                if ti != BACK:
+                    b.append(vi.clone())
+                else:
+                    b.append(vi)
+            if (ti | tj) == SPANNING:
+                t = (plane.w - plane.normal.dot(vi.pos)) / \
+                    plane.normal.dot(vj.pos.minus(vi.pos))
+                v = vi.interpolate(vj, t)
+                f.append(v)
+                b.append(v.clone())
+        if len(f) >= 3:
+            front.append(Polygon(f, polygon.shared))
+        if len(b) >= 3:
+            back.append(Polygon(b, polygon.shared))
 
 class TestBSPNode(unittest.TestCase):
     def setUp(self):
@@ -39,5 +97,146 @@ class TestBSPNode(unittest.TestCase):
         polygons = [p0]
         node = BSPNode(polygons)
 
+    def test_splitPolygons(self):
+        # the batch splitter must sort polygons and fragments like the
+        # original one-polygon-at-a-time algorithm
+        random.seed(3)
+        polygons = (CSG.sphere(slices=8, stacks=4).polygons +
+                    CSG.cube(radius=0.5).polygons)
+        planes = [Plane(Vector(0.3, 0.4, 0.1).unit(), 0.2),
+                  Plane(Vector(1., 0., 0.), 0.5), # coplanar with a cube face
+                  Plane(Vector(0., -1., 0.), 0.)] # through sphere vertices
+        for i in range(20):
+            n = Vector(random.uniform(-1., 1.), random.uniform(-1., 1.),
+                       random.uniform(-1., 1.)).unit()
+            planes.append(Plane(n, random.uniform(-0.8, 0.8)))
+        for plane in planes:
+            expected = [[], [], [], []]
+            for poly in polygons:
+                splitPolygonReference(plane, poly, *expected)
+            batch = [[], [], [], []]
+            plane.splitPolygons(polygons, *batch)
+            single = [[], [], [], []]
+            for poly in polygons:
+                plane.splitPolygon(poly, *single)
+            for a, b, c in zip(expected, batch, single):
+                a = [[tuple(v.pos) for v in p.vertices] for p in a]
+                self.assertEqual([[tuple(v.pos) for v in p.vertices] for p in b], a)
+                self.assertEqual([[tuple(v.pos) for v in p.vertices] for p in c], a)
+        self.assertTrue(len(batch[2]) > 0 and len(batch[3]) > 0)
+
+    def test_splitStrategies(self):
+        def area(csg):
+            total = 0.
+            for poly in csg.polygons:
+                v0 = poly.vertices[0].pos
+                for i in range(1, len(poly.vertices) - 1):
+                    e1 = poly.vertices[i].pos.minus(v0)
+                    e2 = poly.vertices[i + 1].pos.minus(v0)
+                    total += 0.5 * e1.cross(e2).length()
+            return total
+        a = CSG.sphere(slices=8, stacks=4)
+        b = CSG.cube([0.5, 0.5, 0.0])
+        expected = area(a.subtract(b))
+        for strategy in (BSPNode.SPLIT_FIRST, BSPNode.SPLIT_RANDOM,
+                         BSPNode.SPLIT_AXIS):
+            c = a.subtract(b, splitStrategy=strategy)
+            self.assertAlmostEqual(area(c), expected, places=6)
+        self.assertRaises(ValueError, BSPNode, None, 'best')
+
+    def test_splitStrategyTrees(self):
+        # the sampling strategies must split fewer polygons than SPLIT_FIRST
+        # without making the tree deeper
+        a = CSG.sphere(slices=8, stacks=4) - CSG.cylinder(radius=0.3, slices=8)
+        first = BSPNode(a.polygons).stats()
+        for strategy in (BSPNode.SPLIT_RANDOM, BSPNode.SPLIT_AXIS):
+            stats = BSPNode(a.polygons, strategy).stats()
+            self.assertTrue(stats['polygons'] < first['polygons'])
+            self.assertTrue(stats['depth'] <= first['depth'])
+
+    def test_deepTree(self):
+        # a stack of parallel squares gives a tree deeper than the default
+        # recursion limit
+        n = sys.getrecursionlimit() + 200
+        polygons = []
+        for i in range(n):
+            z = float(i)
+            polygons.append(Polygon([Vertex([0., 0., z]), Vertex([1., 0., z]),
+                                     Vertex([1., 1., z]), Vertex([0., 1., z])]))
+        node = BSPNode(polygons)
+        self.assertEqual(len(node.nodes()), n)
+        node.invert()
+        node = node.clone()
+        node.clipTo(node)
+        self.assertEqual(len(node.allPolygons()), n)
+
+    def test_stats(self):
+        # parallel squares make a chain of nodes, one square in each
+        n = 15
+        polygons = [Polygon([Vertex([0., 0., z]), Vertex([1., 0., z]),
+                             Vertex([1., 1., z]), Vertex([0., 1., z])])
+                    for z in map(float, range(n))]
+        stats = BSPNode(polygons).stats()
+        self.assertEqual(stats['nodes'], n)
+        self.assertEqual(stats['leaves'], 1)
+        self.assertEqual(stats['depth'], n)
+        self.assertEqual(stats['depthHistogram'], [1] * n)
+        self.assertEqual(stats['polygons'], n)
+        self.assertEqual(stats['maxPolygons'], 1)
+        self.assertAlmostEqual(stats['balance'], 4. / n)
+        self.assertTrue(stats['bytes'] > 0)
+        # a square in the middle plane first splits the stack in two halves
+        middle = n // 2
+        stats = BSPNode(polygons[middle:middle + 1] + polygons[:middle] +
+                        polygons[middle + 1:]).stats()
+        self.assertEqual(stats['depthHistogram'], [1] + [2] * middle)
+        self.assertEqual(stats['leaves'], 2)
+        self.assertAlmostEqual(stats['balance'], 4. / (middle + 1))
+        stats = CSG.fromPolygons(polygons).treeStats()
+        self.assertEqual(stats['nodes'], n)
+        self.assertTrue(stats['buildTime'] >= 0.)
+        a = CSG.cube().subtract(CSG.cube([0.5, 0.5, 0.]), retainTree=True)
+        self.assertEqual(a.treeStats()['nodes'], len(a._tree.nodes()))
+
+    def test_invertShared(self):
+        polygons = CSG.cube().polygons
+        before = [([tuple(v.pos) for v in p.vertices], tuple(p.plane.normal))
+                  for p in polygons]
+        node = BSPNode(polygons)
+        node.invert()
+        flipped = node.allPolygons()
+        self.assertEqual(len(flipped), 6)
+        for poly in flipped:
+            self.assertFalse(poly in polygons)
+            self.assertTrue(poly.plane.normal.dot(poly.vertices[0].pos) < 0)
+        after = [([tuple(v.pos) for v in p.vertices], tuple(p.plane.normal))
+                 for p in polygons]
+        self.assertEqual(after, before)
+
+class TestGeometry(unittest.TestCase):
+    def test_vector(self):
+        for v in (Vector(1., 2., 3.), Vector([1., 2., 3.]),
+                  Vector({'x': 1., 'y': 2., 'z': 3.}), Vector(Vector(1., 2., 3.))):
+            self.assertEqual(tuple(v), (1., 2., 3.))
+        self.assertEqual(tuple(Vector()), (0., 0., 0.))
+        self.assertEqual(tuple(Vector(None)), (0., 0., 0.))
+
+    def test_planeFromVertices(self):
+        vertices = [Vertex([0., 0., 1.]), Vertex([1., 0., 1.]),
+                    Vertex([2., 0., 1.]), Vertex([2., 1., 1.]),
+                    Vertex([0., 1., 1.])]
+        plane = Plane.fromVertices(vertices)
+        self.assertEqual(tuple(plane.normal), (0., 0., 1.))
+        self.assertAlmostEqual(plane.w, 1.)
+        p = Polygon(vertices)
+        self.assertEqual(tuple(p.plane.normal), (0., 0., 1.))
+        self.assertRaises(ZeroDivisionError, Polygon, vertices[:3])
+
+    def test_slots(self):
+        v = Vertex([0., 0., 0.])
+        p = Polygon([v, Vertex([1., 0., 0.]), Vertex([0., 1., 0.])])
+        for obj in (v.pos, v, p.plane, p, BSPNode([p])):
+            self.assertFalse(hasattr(obj, '__dict__'))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,112 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.getcwd())
+
+from csg.core import CSG
+from csg import cache
+from csg.geom import Vector
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        cache.disable()
+        shutil.rmtree(self.directory)
+
+    def polygons(self, csg):
+        return [([tuple(v.pos) for v in p.vertices], tuple(p.plane.normal),
+                 p.plane.w, p.shared) for p in csg.polygons]
+
+    def test_hitAndMiss(self):
+        a = CSG.cube()
+        b = CSG.sphere(center=[0.5, 0.5, 0.], slices=8, stacks=4)
+        expected = self.polygons(a - b)
+        c = cache.enable(self.directory)
+        self.assertEqual(self.polygons(a - b), expected)
+        self.assertEqual((c.hits, c.misses, c.writes), (0, 1, 1))
+        self.assertEqual(self.polygons(a.clone() - b.clone()), expected)
+        self.assertEqual((c.hits, c.misses), (1, 1))
+        a + b
+        self.assertEqual(c.stats()['entries'], 2)
+
+    def test_retainTree(self):
+        a = CSG.cube()
+        b = CSG.sphere(center=[0.5, 0.5, 0.], slices=8, stacks=4)
+        c = cache.enable(self.directory)
+        a - b
+        d = a.subtract(b, retainTree=True)
+        self.assertEqual(c.hits, 1)
+        self.assertTrue(d.hasTree())
+        e = d - CSG.cube(center=[-0.5, -0.5, 0.], radius=0.25)
+        f = a - b - CSG.cube(center=[-0.5, -0.5, 0.], radius=0.25)
+        self.assertEqual(e.getBounds(), f.getBounds())
+
+    def test_eviction(self):
+        c = cache.enable(self.directory, maxBytes=1)
+        a = CSG.cube()
+        a + CSG.cube([0.5, 0., 0.])
+        self.assertEqual(c.evictions, 1)
+        self.assertEqual(c.size(), 0)
+
+    def test_shared(self):
+        a = CSG.cube()
+        for p in a.polygons:
+            p.shared = 'red'
+        c = cache.enable(self.directory)
+        a.union(CSG.cube([0.5, 0., 0.]))
+        b = a.union(CSG.cube([0.5, 0., 0.]))
+        self.assertEqual(c.hits, 1)
+        self.assertTrue('red' in [p.shared for p in b.polygons])
+
+    def test_canonicalKey(self):
+        a = CSG.sphere(slices=8, stacks=4) - CSG.cylinder(radius=0.3)
+        b = CSG.cube([0.5, 0., 0.])
+        c = cache.enable(self.directory)
+        self.assertEqual(c.key('union', a, b), c.key('union', a.clone(), b))
+        # the same square as two triangles, sharing vertices or not
+        from csg.geom import Polygon, Vertex
+        v = [Vertex([0., 0., 0.]), Vertex([1., 0., 0.]), Vertex([1., 1., 0.]),
+             Vertex([0., 1., 0.])]
+        shared = CSG.fromPolygons([Polygon(v[:3]), Polygon([v[0], v[2], v[3]])])
+        self.assertEqual(shared.digest(), shared.clone().digest())
+        self.assertNotEqual(c.key('union', a, b), c.key('subtract', a, b))
+
+    def test_normals(self):
+        # operands that only differ in their vertex normals get their own
+        # results
+        a = CSG.sphere(slices=8, stacks=4)
+        b = a.clone()
+        for p in b.polygons:
+            for v in p.vertices:
+                v.normal = Vector(0., 0., 0.)
+        d = CSG.cube([0.5, 0., 0.])
+        c = cache.enable(self.directory)
+        self.assertNotEqual(c.key('union', a, d), c.key('union', b, d))
+        a.union(d)
+        e = b.union(d)
+        self.assertEqual(c.hits, 0)
+        self.assertTrue(all(tuple(v.normal) == (0., 0., 0.)
+                            for p in e.polygons for v in p.vertices
+                            if v.pos.x < 0.4))
+
+    def test_unsafeShared(self):
+        a = CSG.cube()
+        for p in a.polygons:
+            p.shared = ('red', 1)
+        c = cache.enable(self.directory)
+        a.union(CSG.cube([0.5, 0., 0.]))
+        self.assertEqual(c.writes, 0)
+        for p in a.polygons:
+            p.shared = 1.5
+        a.union(CSG.cube([0.5, 0., 0.]))
+        b = a.union(CSG.cube([0.5, 0., 0.]))
+        self.assertEqual((c.writes, c.hits), (1, 1))
+        self.assertTrue(1.5 in [p.shared for p in b.polygons])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,4 @@
+import math
 import os
 import sys
 import unittest
@@ -5,7 +6,35 @@ import unittest
 sys.path.insert(0, os.getcwd())
 
 from csg.core import CSG
-from csg.geom import Vector
+from csg.geom import Plane, Polygon, Vector, Vertex
+
+def volume(csg):
+    # signed volume of the closed surface, by the divergence theorem
+    total = 0.
+    for poly in csg.polygons:
+        a = poly.vertices[0].pos
+        for i in range(1, len(poly.vertices) - 1):
+            b = poly.vertices[i].pos
+            c = poly.vertices[i + 1].pos
+            total += a.dot(b.cross(c))
+    return total / 6.
+
+class CVertex(Vertex):
+    # a vertex with a color, like the custom vertex classes of applications
+    __slots__ = ('color',)
+
+    def __init__(self, pos, normal=None, color=None):
+        Vertex.__init__(self, pos, normal)
+        self.color = color
+
+    def clone(self):
+        return CVertex(self.pos.clone(), self.normal.clone(), self.color)
+
+    def interpolate(self, other, t):
+        return CVertex(self.pos.lerp(other.pos, t),
+                       self.normal.lerp(other.normal, t),
+                       tuple(a + (b - a) * t
+                             for a, b in zip(self.color, other.color)))
 
 class TestCSG(unittest.TestCase):
     def setUp(self):
@@ -96,6 +125,337 @@ class TestCSG(unittest.TestCase):
         bolt2x = bolt.refine()
         bolt2x.saveVTK('test_bolt2x.vtk')
 
+    def test_bounds(self):
+        a = CSG.cube(center=[1., 2., 3.], radius=[1., 2., 3.])
+        self.assertEqual(a.getBounds(), ([0., 0., 0.], [2., 4., 6.]))
+        self.assertEqual(CSG().getBounds(), None)
+
+    def test_disjoint(self):
+        a = CSG.cube()
+        b = CSG.cube([5., 0., 0.])
+        self.assertEqual(len(a.union(b).polygons), 12)
+        self.assertEqual(len(a.subtract(b).polygons), 6)
+        self.assertEqual(len(a.intersect(b).polygons), 0)
+        # the results do not follow later changes of the operands
+        c = a.union(b)
+        d = a - b
+        a.polygons.extend(CSG.cube([0., 5., 0.]).polygons)
+        self.assertEqual(len(c.polygons), 12)
+        self.assertEqual(len(d.polygons), 6)
+
+    def test_nested(self):
+        a = CSG.cube(radius=3.)
+        b = CSG.sphere(radius=0.5, slices=8, stacks=4)
+        self.assertEqual(len(a.union(b).polygons), 6)
+        self.assertEqual(len(b.subtract(a).polygons), 0)
+        lo, hi = a.intersect(b).getBounds()
+        for x, y in zip(lo + hi, b.getBounds()[0] + b.getBounds()[1]):
+            self.assertAlmostEqual(x, y)
+
+    def test_unionAll(self):
+        parts = [CSG.cube([2. * i, 0., 0.], 0.75) for i in range(5)]
+        parts.append(CSG.cube([20., 0., 0.]))
+        a = CSG.unionAll(parts)
+        b = parts[0]
+        for part in parts[1:]:
+            b = b + part
+        self.assertEqual(a.getBounds(), b.getBounds())
+        self.assertEqual(len(CSG.unionAll([]).polygons), 0)
+
+    def test_subtractAll(self):
+        a = CSG.cube(radius=[4., 1., 4.])
+        tools = [CSG.cylinder(start=[x, -2., 0.], end=[x, 2., 0.], radius=0.3)
+                 for x in (-2., 0., 2., 10.)]
+        b = a
+        for tool in tools:
+            b = b - tool
+        c = a.subtractAll(tools)
+        self.assertEqual(c.getBounds(), b.getBounds())
+        self.assertTrue(len(c.polygons) > len(a.polygons))
+        self.assertEqual(len(a.subtractAll(tools[3:]).polygons), 6)
+
+    def test_retainTree(self):
+        a = CSG.cube(radius=[4., 1., 4.])
+        tools = [CSG.cylinder(start=[x, -2., 0.], end=[x, 2., 0.], radius=0.3)
+                 for x in (-2., 0., 2.)]
+        tools.append(CSG.cube(center=[0., 1., 0.], radius=[1., 0.5, 1.]))
+        b = a
+        c = a
+        for tool in tools:
+            b = b - tool
+            c = c.subtract(tool, retainTree=True)
+            self.assertTrue(c.hasTree())
+            self.assertEqual(c.getBounds(), b.getBounds())
+            self.assertAlmostEqual(volume(c), volume(b))
+        d = c.union(CSG.sphere(center=[4., 1., 4.]), retainTree=True)
+        self.assertTrue(d.hasTree())
+        self.assertEqual(d.getBounds(), ([-4., -1., -4.], [5., 2., 5.]))
+        self.assertAlmostEqual(volume(d),
+                               volume(b + CSG.sphere(center=[4., 1., 4.])))
+        d.translate([1., 0., 0.])
+        self.assertFalse(d.hasTree())
+
+    def test_retainTreeDisjoint(self):
+        a = CSG.cube().subtract(CSG.cylinder(radius=0.3), retainTree=True)
+        b = CSG.sphere(center=[4., 0., 0.], slices=8, stacks=4)
+        c = a.union(b, retainTree=True)
+        self.assertTrue(c.hasTree())
+        self.assertAlmostEqual(volume(c), volume(a) + volume(b))
+        # the retained tree classifies both parts
+        d = c.subtract(CSG.cube(center=[4., 0., 0.], radius=0.2),
+                       retainTree=True)
+        self.assertAlmostEqual(volume(d), volume(c) - 0.064)
+        e = c.union(CSG.cube(center=[-4., 0., 0.]), retainTree=True)
+        self.assertTrue(e.hasTree())
+        self.assertAlmostEqual(volume(e), volume(c) + 8.)
+        f = a.intersect(b, retainTree=True)
+        self.assertTrue(f.hasTree())
+        self.assertEqual(len(f.polygons), 0)
+        g = f.union(b, retainTree=True)
+        self.assertTrue(g.hasTree())
+        self.assertAlmostEqual(volume(g), volume(b))
+        self.assertFalse(a.intersect(b).hasTree())
+
+    def test_operandsUnchanged(self):
+        a = CSG.sphere()
+        b = CSG.cylinder(radius=0.3)
+        a0 = a.clone()
+        b0 = b.clone()
+        result = a.subtract(b)
+        result.translate([1., 0., 0.])
+        a.intersect(b)
+        for csg, ref in ((a, a0), (b, b0)):
+            self.assertEqual(
+                [[tuple(v.pos) for v in p.vertices] for p in csg.polygons],
+                [[tuple(v.pos) for v in p.vertices] for p in ref.polygons])
+
+    def test_inverse(self):
+        a = CSG.cube()
+        b = a.inverse()
+        for p, q in zip(a.polygons, b.polygons):
+            self.assertEqual(q.plane.normal.dot(p.plane.normal), -1.)
+            self.assertEqual([v.pos for v in q.vertices],
+                             [v.pos for v in reversed(p.vertices)])
+
+    def test_simplify(self):
+        a = CSG.cube().refine().refine()
+        b = a.simplify()
+        self.assertEqual(len(b.polygons), 6)
+        self.assertEqual([len(p.vertices) for p in b.polygons], [4] * 6)
+        self.assertEqual(b.getBounds(), a.getBounds())
+        self.assertEqual(len(a.polygons), 96)
+        a = CSG.sphere(slices=16, stacks=8) - CSG.cylinder(radius=0.3)
+        b = a.subtract(CSG.cylinder(start=[-1., 0., 0.], end=[1., 0., 0.],
+                                    radius=0.3), simplify=True)
+        self.assertTrue(len(b.polygons) < len(a.polygons))
+        c = a.simplify()
+        for csg in (a, c):
+            d = csg - CSG.cylinder(start=[-1., 0., 0.], end=[1., 0., 0.],
+                                   radius=0.3)
+            self.assertTrue(len(d.simplify().polygons) < len(d.polygons))
+            for x, y in zip(d.getBounds()[0] + d.getBounds()[1],
+                            b.getBounds()[0] + b.getBounds()[1]):
+                self.assertAlmostEqual(x, y)
+
+    def test_booleanAfterSimplify(self):
+        # merged polygons may start with collinear vertices, and fragments of
+        # them too
+        a = CSG.cube()
+        for axis in ([1., 0., 0.], [0., 1., 0.], [0., 0., 1.]):
+            a = a - CSG.cylinder(start=[-2. * c for c in axis],
+                                 end=[2. * c for c in axis], radius=0.4)
+        b = a.simplify()
+        for center, radius in (([-0.1, 0.12, 0.85], 0.39),
+                               ([0.02, 0.17, -0.63], 0.4),
+                               ([0.26, 0.59, -0.81], 0.32)):
+            a = a - CSG.cube(center=center, radius=radius)
+            b = b - CSG.cube(center=center, radius=radius)
+            b.clone().translate([1., 0., 0.])
+            for x, y in zip(a.getBounds()[0] + a.getBounds()[1],
+                            b.getBounds()[0] + b.getBounds()[1]):
+                self.assertAlmostEqual(x, y)
+
+    def test_editedClone(self):
+        # a clone whose vertices are moved in place must not keep the planes
+        # of the original
+        b = CSG.cube().clone()
+        for poly in b.polygons:
+            for v in poly.vertices:
+                v.pos.x += 1.5
+        self.assertAlmostEqual(volume(CSG.cube() - b), 6.)
+        self.assertAlmostEqual(volume(CSG.cube() + b), 14.)
+        self.assertAlmostEqual(volume(b.clone() * CSG.cube()), 2.)
+
+    def test_transform(self):
+        a = CSG.sphere(slices=8, stacks=4)
+        b = a.clone()
+        b.transform([[0., 2., 0., 1.], [-1., 0., 0., 2.], [0., 0., 3., 3.],
+                     [0., 0., 0., 1.]])
+        lo, hi = b.getBounds()
+        for x, y in zip(lo + hi, [-1., 1., 0., 3., 3., 6.]):
+            self.assertAlmostEqual(x, y)
+        self.assertAlmostEqual(volume(b), 6. * volume(a))
+        for poly in b.polygons:
+            v = poly.vertices
+            plane = Plane.fromPoints(v[0].pos, v[1].pos, v[2].pos)
+            self.assertAlmostEqual(plane.normal.dot(poly.plane.normal), 1.)
+            self.assertAlmostEqual(plane.w, poly.plane.w)
+        # a chain of transforms, applied at once or one by one
+        c = a.clone()
+        d = a.clone()
+        numVertices = len(set(id(v) for p in c.polygons for v in p.vertices))
+        for i in range(10):
+            for csg in (c, d):
+                csg.translate([0.1, 0.2, 0.])
+                csg.rotate([1., 1., 0.], 15.)
+                csg.scale([1., 1.1, 1.])
+            d.polygons
+        for p, q in zip(c.polygons, d.polygons):
+            for u, v in zip(p.vertices, q.vertices):
+                self.assertAlmostEqual(u.pos.minus(v.pos).length(), 0.)
+                self.assertAlmostEqual(u.normal.minus(v.normal).length(), 0.)
+            self.assertAlmostEqual(p.plane.w, q.plane.w)
+        # vertices stay shared
+        self.assertEqual(len(set(id(v) for p in c.polygons for v in p.vertices)),
+                         numVertices)
+        self.assertRaises(ValueError, c.transform, [[1., 0., 0.]] * 3)
+        self.assertRaises(ValueError, c.scale, [1., 0., 1.])
+        self.assertRaises(ValueError, c.transform,
+                          [[1., 0., 0., 0.], [0., 1., 0., 0.],
+                           [0., 0., 1., 0.], [0., 0., 1., 1.]])
+        e = CSG.cube()
+        e.rotate([0., 0., 1.], 90.)
+        e.translate([1., 0., 0.])
+        self.assertFalse(e.hasTree())
+
+    def test_mirror(self):
+        a = CSG.cone(start=[0., 0., 0.], end=[1., 2., 3.], radius=0.5)
+        b = a.clone()
+        b.mirror([1., 0., 0.], [2., 0., 0.])
+        self.assertAlmostEqual(volume(b), volume(a))
+        (x0, y0, z0), (x1, y1, z1) = a.getBounds()
+        for x, y in zip(b.getBounds()[0] + b.getBounds()[1],
+                        [4. - x1, y0, z0, 4. - x0, y1, z1]):
+            self.assertAlmostEqual(x, y)
+        for poly in b.polygons:
+            v = poly.vertices
+            plane = Plane.fromPoints(v[0].pos, v[1].pos, v[2].pos)
+            self.assertAlmostEqual(plane.normal.dot(poly.plane.normal), 1.)
+        c = CSG.cube(radius=2.)
+        c.scale([-1., 1., 1.])
+        d = c - CSG.cube(center=[1., 1., 1.])
+        self.assertAlmostEqual(volume(d), 64. - 8.)
+
+    def test_instance(self):
+        bolt = CSG.cylinder(radius=0.2, slices=8) + \
+            CSG.cube(center=[0., 1., 0.], radius=0.3)
+        matrices = [[[0., 0., 1., x], [0., 1., 0., 0.], [-1., 0., 0., z]]
+                    for x in range(0, 10, 2) for z in range(0, 6, 2)]
+        bolts = [bolt.instance(m) for m in matrices]
+        for b, m in zip(bolts, matrices):
+            c = bolt.clone()
+            c.transform(m)
+            self.assertEqual(b.getBounds(), c.getBounds())
+        # disjoint instances are assembled without copying the polygons
+        a = CSG.unionAll(bolts)
+        self.assertEqual(len(a._parts), len(bolts))
+        self.assertTrue(all(part[0] == bolt.polygons for part in a._parts))
+        self.assertEqual(a.getBounds(), ([-0.3, -1., -0.3], [8.3, 1.3, 4.3]))
+        self.assertAlmostEqual(volume(a), len(bolts) * volume(bolt))
+        self.assertEqual(len(a._parts), 1)
+        # an instance gets its own polygons once they are read
+        b = bolt.instance()
+        b.polygons[0].shared = 'red'
+        self.assertEqual(bolt.polygons[0].shared, None)
+        plate = CSG.cube(center=[4., 1.3, 2.], radius=[5., 0.3, 3.])
+        c = plate.subtractAll(bolts)
+        self.assertAlmostEqual(volume(c), volume(plate) - len(bolts) * 0.108)
+
+    def test_customVertex(self):
+        polygons = []
+        for poly in CSG.cube().polygons:
+            vertices = [CVertex(v.pos, v.normal, (1., 0., 0.))
+                        for v in poly.vertices]
+            polygons.append(Polygon(vertices))
+        a = CSG.fromPolygons(polygons)
+        b = a.clone()
+        b.translate([1., 0., 0.])
+        c = a.instance([[0., -1., 0., 0.], [1., 0., 0., 0.], [0., 0., 1., 0.]])
+        d = a.clone()
+        d.scale([-1., 1., 1.])
+        for csg in (b, c, d):
+            for poly in csg.polygons:
+                for v in poly.vertices:
+                    self.assertTrue(isinstance(v, CVertex))
+                    self.assertEqual(v.color, (1., 0., 0.))
+        self.assertEqual(b.getBounds(), ([0., -1., -1.], [2., 1., 1.]))
+        # vertices without a normal keep it None
+        e = CSG.fromPolygons([Polygon([Vertex([0., 0., 0.]), Vertex([1., 0., 0.]),
+                                       Vertex([0., 1., 0.])])])
+        for v in e.polygons[0].vertices:
+            v.normal = None
+        e.translate([0., 0., 1.])
+        for v in e.polygons[0].vertices:
+            self.assertEqual(v.normal, None)
+            self.assertEqual(v.clone().normal, None)
+
+    def test_templates(self):
+        a = CSG.sphere(center=[1., 2., 3.], radius=2., slices=8, stacks=4)
+        template = CSG._templates[('sphere', 8, 4)]
+        for poly in a.polygons:
+            for v in poly.vertices:
+                self.assertAlmostEqual(v.pos.minus(Vector(1., 2., 3.)).length(), 2.)
+            self.assertAlmostEqual(poly.plane.normal.length(), 1.)
+        # the same resolution reuses the template, changing a primitive
+        # leaves it alone
+        a.polygons[0].vertices[0].pos.x = 10.
+        b = CSG.sphere(slices=8, stacks=4)
+        self.assertTrue(CSG._templates[('sphere', 8, 4)] is template)
+        self.assertAlmostEqual(b.polygons[0].vertices[0].pos.length(), 1.)
+        self.assertAlmostEqual(template[0].vertices[0].pos.length(), 1.)
+        # the cone normals follow the taper of the placed cone
+        c = CSG.cone(start=[0., 0., 0.], end=[0., 0., 2.], radius=1., slices=8)
+        for poly in c.polygons[1::2]:
+            for v in (poly.vertices[0], poly.vertices[2]):
+                self.assertAlmostEqual(v.pos.z, 0.)
+                self.assertAlmostEqual(v.pos.length(), 1.)
+                self.assertAlmostEqual(v.normal.z, 1. / 5 ** 0.5)
+        d = CSG.cylinder(start=[1., 0., 0.], end=[1., 3., 0.], radius=0.5,
+                         slices=8)
+        self.assertEqual(d.getBounds(), ([0.5, 0., -0.5], [1.5, 3., 0.5]))
+        # the least recently used templates are dropped
+        size = CSG.TEMPLATE_CACHE_SIZE
+        CSG.TEMPLATE_CACHE_SIZE = 3
+        try:
+            for slices in (5, 6, 7, 5, 8):
+                CSG.cylinder(slices=slices)
+            self.assertEqual(list(CSG._templates),
+                             [('cylinder', 7), ('cylinder', 5), ('cylinder', 8)])
+        finally:
+            CSG.TEMPLATE_CACHE_SIZE = size
+
+    def test_tolerance(self):
+        c = Vector(1., 2., 3.)
+        for tolerance in (0.3, 0.05, 0.0123):
+            a = CSG.sphere(center=[1., 2., 3.], radius=2., tolerance=tolerance)
+            for poly in a.polygons:
+                v = [vertex.pos.minus(c) for vertex in poly.vertices]
+                for i, j, k in ((1, 1, 1), (2, 1, 1), (1, 2, 1), (1, 1, 2),
+                                (1, 1, 0), (0, 1, 1), (1, 0, 1)):
+                    p = v[0].times(i).plus(v[1].times(j)).plus(v[2].times(k))
+                    self.assertTrue(p.length() / (i + j + k) >= 2. - tolerance)
+        # the fewest slices that keep within the tolerance
+        for tolerance in (0.3, 0.05, 0.0123):
+            slices = len(CSG.cylinder(radius=2., tolerance=tolerance).polygons) // 3
+            self.assertTrue(2. * (1. - math.cos(math.pi / slices)) <= tolerance)
+            self.assertTrue(2. * (1. - math.cos(math.pi / (slices - 1))) > tolerance)
+            self.assertEqual(len(CSG.cone(radius=2., tolerance=tolerance).polygons),
+                             2 * slices)
+        self.assertEqual(len(CSG.cylinder(tolerance=0.01, scale=10.).polygons),
+                         len(CSG.cylinder(tolerance=0.1).polygons))
+        self.assertEqual(len(CSG.cylinder(radius=0.1, tolerance=1.).polygons), 9)
+        self.assertRaises(ValueError, CSG.sphere, tolerance=0.)
+
     def test_translate_cube(self):
         a = CSG.cube()
         a.saveVTK('a.vtk')
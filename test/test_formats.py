@@ -0,0 +1,209 @@
+import io
+import os
+import re
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.getcwd())
+
+from csg.core import CSG
+from csg import formats
+
+class Pipe(object):
+    # write-only file object that cannot seek
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+    def seekable(self):
+        return False
+
+class TestFormats(unittest.TestCase):
+    def setUp(self):
+        self.csg = CSG.sphere(slices=12, stacks=6) - CSG.cylinder(radius=0.3)
+        self.mesh = self.csg.toMesh(1.e-10)
+
+    def save(self, func, source, *args, **kwargs):
+        f = io.BytesIO()
+        func(source, f, *args, **kwargs)
+        return f.getvalue()
+
+    def test_stl(self):
+        data = self.save(formats.saveSTL, self.csg)
+        count = struct.unpack_from('<I', data, 80)[0]
+        self.assertEqual(count, sum(len(p.vertices) - 2 for p in self.csg.polygons))
+        self.assertEqual(len(data), 84 + 50 * count)
+        pipe = Pipe()
+        formats.saveSTL(iter(self.csg.polygons), pipe)
+        self.assertEqual(pipe.buffer.getvalue(), data)
+
+    def test_vtkBinary(self):
+        data = self.save(formats.saveVTK, self.csg, binary=True)
+        m = re.search(b'POINTS (\\d+) float\n', data)
+        numPoints = int(m.group(1))
+        self.assertEqual(numPoints, self.mesh.numVertices())
+        points = struct.unpack_from('>%df' % (3 * numPoints), data, m.end())
+        self.assertAlmostEqual(points[0], self.mesh.positions[0], 6)
+        m = re.search(b'POLYGONS (\\d+) (\\d+)\n', data)
+        self.assertEqual(int(m.group(1)), self.mesh.numPolygons())
+        size = int(m.group(2))
+        self.assertEqual(size, len(self.mesh.indices) + self.mesh.numPolygons())
+        self.assertEqual(len(data), m.end() + 4 * size + 1)
+        # CSG.saveVTK() takes the same arguments in the same order
+        self.assertEqual(data, self.save(formats.saveVTK, self.csg, None, True))
+        self.csg.saveVTK('test_formats.vtk', None, True)
+        with open('test_formats.vtk', 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+    def test_vtkAscii(self):
+        self.csg.saveVTK('test_formats.vtk')
+        with open('test_formats.vtk', 'rb') as f:
+            self.assertEqual(f.read(), self.save(formats.saveVTK, self.csg))
+
+    def test_vtu(self):
+        data = self.save(formats.saveVTU, self.csg)
+        start = data.index(b'_', data.index(b'encoding="raw"')) + 1
+        offsets = [int(x) for x in re.findall(b'offset="(\\d+)"', data)]
+        sizes = [struct.unpack_from('<Q', data, start + o)[0] for o in offsets]
+        self.assertEqual(sizes, [12 * self.mesh.numVertices(),
+                                 4 * len(self.mesh.indices),
+                                 4 * self.mesh.numPolygons(),
+                                 self.mesh.numPolygons()])
+
+    def test_ply(self):
+        data = self.save(formats.savePLY, self.csg)
+        numPoints = int(re.search(b'element vertex (\\d+)', data).group(1))
+        numFaces = int(re.search(b'element face (\\d+)', data).group(1))
+        self.assertEqual(numPoints, self.mesh.numVertices())
+        offset = data.index(b'end_header\n') + 11 + 12 * numPoints
+        faces = 0
+        while offset < len(data):
+            offset += 1 + 4 * struct.unpack_from('<B', data, offset)[0]
+            faces += 1
+        self.assertEqual(faces, numFaces)
+        self.assertEqual(offset, len(data))
+
+    def test_plyLargeFace(self):
+        csg = CSG.cylinder(slices=300).simplify()
+        self.assertEqual(max(len(p.vertices) for p in csg.polygons), 300)
+        data = self.save(formats.savePLY, csg)
+        numFaces = int(re.search(b'element face (\\d+)', data).group(1))
+        numPoints = int(re.search(b'element vertex (\\d+)', data).group(1))
+        offset = data.index(b'end_header\n') + 11 + 12 * numPoints
+        triangles = 0
+        for i in range(numFaces):
+            n = struct.unpack_from('<B', data, offset)[0]
+            triangles += n - 2
+            offset += 1 + 4 * n
+        self.assertEqual(offset, len(data))
+        self.assertEqual(triangles, sum(len(p.vertices) - 2 for p in csg.polygons))
+        self.assertEqual(numFaces, len(csg.polygons) + 2)
+
+    def test_obj(self):
+        text = self.save(formats.saveOBJ, self.csg).decode('ascii')
+        self.assertEqual(text.count('\nv '), self.mesh.numVertices())
+        self.assertEqual(text.count('\nf '), self.mesh.numPolygons())
+
+    def test_stream(self):
+        blockSize = formats.BLOCK_SIZE
+        formats.BLOCK_SIZE = 16
+        try:
+            for func in (formats.saveVTK, formats.saveVTU, formats.savePLY,
+                         formats.saveOBJ):
+                data = self.save(func, (p for p in self.csg.polygons))
+                self.assertTrue(len(data) > 0)
+            text = self.save(formats.saveOBJ, (p for p in self.csg.polygons))
+            text = text.decode('ascii')
+            self.assertEqual(text.count('\nf '), len(self.csg.polygons))
+            indices = [int(i) for line in re.findall('\nf (.*)', text)
+                       for i in line.split()]
+            self.assertEqual(max(indices), text.count('\nv '))
+        finally:
+            formats.BLOCK_SIZE = blockSize
+
+class TestLoad(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.csg = CSG.sphere(slices=12, stacks=6) - CSG.cylinder(radius=0.3)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name, text=None):
+        path = os.path.join(self.directory, name)
+        if text is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return path
+
+    def assertBounds(self, a, b):
+        for x, y in zip(a.getBounds()[0] + a.getBounds()[1],
+                        b.getBounds()[0] + b.getBounds()[1]):
+            self.assertAlmostEqual(x, y, 6)
+
+    def test_roundTrip(self):
+        mesh = self.csg.toMesh(1.e-10)
+        for ext in ('stl', 'ply', 'obj'):
+            path = self.path('a.' + ext)
+            getattr(self.csg, 'save' + ext.upper())(path)
+            a = CSG.load(path)
+            self.assertBounds(a, self.csg)
+            b = CSG.load(path, asMesh=True)
+            self.assertEqual(b.numPolygons(), len(a.polygons))
+            if ext != 'stl':
+                self.assertEqual(b.numPolygons(), mesh.numPolygons())
+            self.assertTrue(len(a.union(CSG.cube()).polygons) > 0)
+
+    def test_asciiSTL(self):
+        path = self.path('a.stl', 'solid a\n'
+                         'facet normal 0 0 1\n outer loop\n'
+                         '  vertex 0 0 0\n  vertex 1 0 0\n  vertex 1 1 0\n'
+                         ' endloop\nendfacet\n'
+                         'facet normal 0 0 1\n outer loop\n'
+                         '  vertex 0 0 0\n  vertex 1 1 0\n  vertex 0 1 0\n'
+                         ' endloop\nendfacet\n'
+                         'endsolid a\n')
+        mesh = formats.loadSTL(path)
+        self.assertEqual(mesh.numVertices(), 4)
+        self.assertEqual(list(mesh.indices), [0, 1, 2, 0, 2, 3])
+        self.assertEqual(list(mesh.planes[:4]), [0., 0., 1., 0.])
+
+    def test_asciiPLY(self):
+        path = self.path('a.ply', 'ply\nformat ascii 1.0\n'
+                         'element vertex 4\nproperty float x\n'
+                         'property float y\nproperty float z\n'
+                         'element face 2\nproperty list uchar int vertex_indices\n'
+                         'end_header\n'
+                         '0 0 0\n1 0 0\n1 1 0\n0 1 0\n'
+                         '4 0 1 2 3\n3 0 1 1\n')
+        mesh = formats.loadPLY(path)
+        # the second face is degenerate and dropped
+        self.assertEqual(mesh.numPolygons(), 1)
+        self.assertEqual(list(mesh.indices), [0, 1, 2, 3])
+
+    def test_OBJ(self):
+        path = self.path('a.obj', '# square\n'
+                         'v 0 0 0\nv 1 0 0\nv 1 1 0\n'
+                         'usemtl red\nf 1/1/1 2/2/2 3/3/3\n'
+                         'v 0 1 0\nf -4 -2 -1\n')
+        mesh = formats.loadOBJ(path)
+        self.assertEqual(list(mesh.indices), [0, 1, 2, 0, 2, 3])
+        self.assertEqual(mesh.shared, ['red', 'red'])
+        self.assertRaises(ValueError, formats.load, self.path('a.off'))
+
+    def test_collinearStart(self):
+        # a convex face whose first three vertices are collinear
+        path = self.path('a.obj', 'v 0 0 0\nv 1 0 0\nv 2 0 0\nv 2 1 0\nv 0 1 0\n'
+                         'f 1 2 3 4 5\nf 1 2 3\n')
+        mesh = formats.loadOBJ(path)
+        self.assertEqual(mesh.numPolygons(), 1)
+        self.assertEqual(list(mesh.planes[:4]), [0., 0., 1., 0.])
+        self.assertEqual(len(CSG.load(path).polygons), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.getcwd())
+
+from csg.core import CSG
+from csg.geom import BSPNode
+from csg import instrument
+
+class TestInstrument(unittest.TestCase):
+    def tearDown(self):
+        instrument.disable()
+
+    def test_phases(self):
+        a = CSG.sphere(slices=8, stacks=4)
+        b = CSG.cylinder(radius=0.3)
+        expected = len((a - b).polygons)
+        events = []
+        profiler = instrument.enable()
+        profiler.addObserver(lambda event, data: events.append(event))
+        self.assertEqual(len((a - b).polygons), expected)
+        a.union(b, retainTree=True)
+        data = profiler.toDict()
+        op = data['operations'][0]
+        self.assertEqual(op['op'], 'subtract')
+        self.assertEqual(op['polygons'], [len(a.polygons), len(b.polygons)])
+        self.assertEqual(op['result'], expected)
+        self.assertEqual(op['phases']['invert']['calls'], 4)
+        self.assertEqual(op['phases']['repair']['calls'], 0)
+        self.assertTrue(op['counters']['splits'] > 0)
+        self.assertEqual(op['counters']['fragments'], 2 * op['counters']['splits'])
+        self.assertTrue(op['counters']['maxDepth'] > 0)
+        self.assertEqual(data['operations'][1]['phases']['repair']['calls'], 1)
+        self.assertEqual(events[0], 'begin')
+        self.assertEqual(events[-1], 'end')
+        self.assertEqual(events.count('phase'),
+                         sum(p['calls'] for o in data['operations']
+                             for p in o['phases'].values()))
+        total = sum(p['time'] for p in op['phases'].values())
+        self.assertAlmostEqual(total, op['duration'], 6)
+
+    def test_pendingTransforms(self):
+        # counting the polygons does not apply the transforms of instances
+        bolt = CSG.cylinder(radius=0.2, slices=8)
+        a = bolt.instance([[1., 0., 0., 1.], [0., 1., 0., 0.], [0., 0., 1., 0.]])
+        b = bolt.instance([[1., 0., 0., 3.], [0., 1., 0., 0.], [0., 0., 1., 0.]])
+        profiler = instrument.enable()
+        c = a.union(b)
+        self.assertEqual(len(c._parts), 2)
+        self.assertTrue(all(m is not None for p, m in a._parts + b._parts))
+        op = profiler.toDict()['operations'][0]
+        self.assertEqual(op['polygons'], [len(bolt.polygons)] * 2)
+        self.assertEqual(op['result'], 2 * len(bolt.polygons))
+        self.assertEqual(len(c._parts), 2)
+
+    def test_nodes(self):
+        # copies of a retained tree are not counted as built nodes
+        a = CSG.cube(radius=[4., 1., 4.])
+        for x in (-2., 0., 2.):
+            a = a.subtract(CSG.cylinder(start=[x, -2., 0.], end=[x, 2., 0.],
+                                        radius=0.3), retainTree=True)
+        b = CSG.cube(center=[3.5, 0.5, 3.5], radius=0.25)
+        profiler = instrument.enable()
+        a.subtract(b, retainTree=True)
+        nodes = profiler.toDict()['operations'][0]['counters']['nodes']
+        self.assertTrue(nodes >= BSPNode(b.polygons).stats()['nodes'])
+        self.assertTrue(nodes < a.treeStats()['nodes'])
+
+    def test_threads(self):
+        a = CSG.sphere(slices=8, stacks=4)
+        b = CSG.cylinder(radius=0.3)
+        profiler = instrument.enable()
+        barrier = threading.Barrier(4)
+        def work():
+            barrier.wait()
+            for i in range(3):
+                a - b
+        threads = [threading.Thread(target=work) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        operations = profiler.toDict()['operations']
+        self.assertEqual(len(operations), 12)
+        self.assertEqual(len(set(op['thread'] for op in operations)), 4)
+        for op in operations:
+            self.assertEqual(op['phases']['invert']['calls'], 4)
+            self.assertEqual(op['phases']['build']['calls'], 3)
+
+    def test_trace(self):
+        profiler = instrument.enable()
+        CSG.cube() * CSG.cube([0.5, 0.5, 0.])
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'trace.json')
+            profiler.saveTrace(path)
+            with open(path) as f:
+                events = json.load(f)['traceEvents']
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(events[0]['name'], 'intersect')
+        self.assertTrue(all(e['ph'] == 'X' for e in events))
+        self.assertTrue(len(events) > 1)
+
+    def test_disable(self):
+        build = BSPNode.build
+        instrument.enable()
+        self.assertFalse(BSPNode.build is build)
+        instrument.disable()
+        self.assertTrue(BSPNode.build is build)
+        self.assertEqual(instrument.current(), None)
+
+if __name__ == '__main__':
+    unittest.main()
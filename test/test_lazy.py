@@ -0,0 +1,94 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.getcwd())
+
+from csg.core import CSG
+from csg.geom import Polygon, Vertex
+from csg.lazy import LazyCSG
+
+class TestLazy(unittest.TestCase):
+    def setUp(self):
+        LazyCSG.clearCache()
+
+    def polygons(self, csg):
+        return [[tuple(v.pos) for v in p.vertices] for p in csg.polygons]
+
+    def test_matchesEager(self):
+        a = CSG.cube()
+        b = CSG.sphere(center=[0.5, 0., 0.], slices=8, stacks=4)
+        before = self.polygons(b)
+        expr = (a.lazy() - b.lazy().translate([0., 0.2, 0.])) + \
+               CSG.cube([1., 1., 0.], 0.3)
+        c = b.clone()
+        c.translate([0., 0.2, 0.])
+        self.assertEqual(self.polygons(expr.evaluate()),
+                         self.polygons((a - c) + CSG.cube([1., 1., 0.], 0.3)))
+        # evaluating does not change the operands
+        self.assertEqual(self.polygons(b), before)
+
+    def test_sharedSubexpressions(self):
+        def part():
+            return CSG.cube().lazy() - CSG.sphere(slices=8, stacks=4).lazy()
+        a = part() + CSG.cube([2., 0., 0.]).lazy()
+        b = part().rotate([0., 0., 1.], 90.)
+        self.assertEqual(a.operands[0].key(), b.operands[0].key())
+        a.toPolygons()
+        self.assertTrue(b.operands[0].key() in LazyCSG.cache)
+        self.assertEqual(len(LazyCSG.cache), 2)
+        b.toPolygons()
+        self.assertEqual(len(LazyCSG.cache), 3)
+
+    def test_contentKey(self):
+        a = CSG.sphere(slices=8, stacks=4) - CSG.cylinder(radius=0.3)
+        self.assertEqual(a.lazy().key(), a.clone().lazy().key())
+        # the same square with vertices shared between its triangles or not
+        v = [Vertex([0., 0., 0.]), Vertex([1., 0., 0.]), Vertex([1., 1., 0.]),
+             Vertex([0., 1., 0.])]
+        b = CSG.fromPolygons([Polygon(v[:3]), Polygon([v[0], v[2], v[3]])])
+        self.assertEqual(b.lazy().key(), b.clone().lazy().key())
+        c = b.clone()
+        c.translate([1., 0., 0.])
+        self.assertNotEqual(c.lazy().key(), b.lazy().key())
+
+    def test_smallCache(self):
+        # an evaluation that needs more entries than the cache holds
+        size = LazyCSG.CACHE_SIZE
+        LazyCSG.CACHE_SIZE = 3
+        try:
+            a = CSG.cube().lazy()
+            b = CSG.cube([0.5, 0., 0.]).lazy()
+            for i in range(4):
+                a = a.translate([0., 0.1, 0.])
+                b = b.translate([0., 0., 0.1])
+            c = (a + b).evaluate()
+            self.assertEqual(len(LazyCSG.cache), 3)
+        finally:
+            LazyCSG.CACHE_SIZE = size
+        d = CSG.cube()
+        d.translate([0., 0.4, 0.])
+        e = CSG.cube([0.5, 0., 0.])
+        e.translate([0., 0., 0.4])
+        lo, hi = c.getBounds()
+        for x, y in zip(lo + hi, (d + e).getBounds()[0] + (d + e).getBounds()[1]):
+            self.assertAlmostEqual(x, y)
+
+    def test_leafSnapshot(self):
+        a = CSG.cube()
+        expr = a.lazy().translate([1., 0., 0.])
+        self.assertEqual(expr.evaluate().getBounds(), ([0., -1., -1.], [2., 1., 1.]))
+        # changing the solid later does not change the expression
+        a.translate([5., 0., 0.])
+        a.polygons.extend(CSG.cube([0., 5., 0.]).polygons)
+        self.assertEqual(expr.evaluate().getBounds(), ([0., -1., -1.], [2., 1., 1.]))
+        # leaves that only differ in their normals are told apart
+        b = CSG.sphere(slices=8, stacks=4)
+        c = b.clone()
+        for p in c.polygons:
+            for v in p.vertices:
+                v.normal = None
+        self.assertNotEqual(b.lazy().key(), c.lazy().key())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.getcwd())
+
+from csg.core import CSG
+from csg.mesh import Mesh
+
+class TestMesh(unittest.TestCase):
+    def test_roundTrip(self):
+        a = CSG.sphere(slices=8, stacks=4)
+        mesh = a.toMesh()
+        self.assertEqual(mesh.numPolygons(), len(a.polygons))
+        self.assertEqual(len(mesh.indices), 3 * len(a.polygons))
+        b = CSG.fromMesh(mesh)
+        for p, q in zip(a.polygons, b.polygons):
+            self.assertEqual([tuple(v.pos) for v in p.vertices],
+                             [tuple(v.pos) for v in q.vertices])
+            self.assertEqual([tuple(v.normal) for v in p.vertices],
+                             [tuple(v.normal) for v in q.vertices])
+            self.assertEqual(tuple(p.plane.normal), tuple(q.plane.normal))
+            self.assertEqual(p.plane.w, q.plane.w)
+
+    def test_noNormals(self):
+        polygons = CSG.cube().clone().polygons
+        for v in polygons[0].vertices:
+            v.normal = None
+        for tolerance in (None, 1.e-9):
+            mesh = Mesh.fromPolygons(polygons, tolerance)
+            a = CSG.fromMesh(mesh)
+            self.assertEqual([v.normal for v in a.polygons[0].vertices],
+                             [None] * 4)
+            self.assertEqual(tuple(a.polygons[1].vertices[0].normal),
+                             tuple(polygons[1].vertices[0].normal))
+
+    def test_fromPolygons(self):
+        mesh = CSG.cube().toMesh()
+        a = CSG.fromPolygons(mesh)
+        self.assertEqual(len(a.polygons), 6)
+
+    def test_booleanWithMesh(self):
+        a = CSG.cube()
+        b = CSG.cube([0.5, 0.5, 0.0]).toMesh()
+        self.assertEqual(len((a - b).polygons),
+                         len((a - CSG.fromMesh(b)).polygons))
+        c = a.union(b).toMesh()
+        self.assertTrue(isinstance(c, Mesh))
+        self.assertEqual(c.numPolygons(), len(a.union(b).polygons))
+
+    def test_refine(self):
+        mesh = CSG.cube().toMesh()
+        digest = mesh.digest()
+        refined = mesh.refine(2)
+        self.assertEqual(mesh.digest(), digest)
+        self.assertEqual(refined.numPolygons(), 6 * 16)
+        self.assertEqual(refined.numVertices(), 6 * 16 + 2)
+        self.assertEqual(len(refined.planes), 4 * refined.numPolygons())
+        self.assertEqual(list(refined.planes[:4]), list(mesh.planes[:4]))
+        polygons = refined.toPolygons(share=True)
+        self.assertTrue(polygons[0].vertices[1] is polygons[1].vertices[3])
+        self.assertTrue(polygons[0].plane is polygons[1].plane)
+        polygons = refined.toPolygons()
+        self.assertFalse(polygons[0].vertices[1] is polygons[1].vertices[3])
+
+    def test_weld(self):
+        mesh = Mesh([0., 0., 0., 1.e-11, 0., 0., 2.e-10, 0., 0., 1., 1., 1.],
+                    [0.] * 12, [0, 4], [0, 1, 2, 3])
+        self.assertEqual(list(mesh.weld().indices), [0, 0, 1, 2])
+        self.assertEqual(list(mesh.weld(0.).indices), [0, 1, 2, 3])
+        self.assertEqual(list(mesh.weld(1.e-9).indices), [0, 0, 0, 1])
+        welded = mesh.weld(1.e-9)
+        self.assertEqual(welded.numVertices(), 2)
+        self.assertEqual(list(welded.positions), [0., 0., 0., 1., 1., 1.])
+
+    def test_weldCube(self):
+        a = CSG.cube()
+        verts, polys, count = a.toVerticesAndPolygons()
+        self.assertEqual(len(verts), 8)
+        self.assertEqual(len(polys), 6)
+        self.assertEqual(count, 24)
+        mesh = a.toMesh().weld()
+        self.assertEqual(mesh.numVertices(), 8)
+        self.assertEqual([list(mesh.polygonIndices(i)) for i in range(6)], polys)
+
+if __name__ == '__main__':
+    unittest.main()
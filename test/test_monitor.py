@@ -0,0 +1,82 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.getcwd())
+
+from csg import monitor
+from csg.core import CSG
+from csg.monitor import Budget, BudgetExceeded, CancelToken, Cancelled
+
+class TestMonitor(unittest.TestCase):
+    def setUp(self):
+        self.a = CSG.sphere(slices=16, stacks=8)
+        self.b = CSG.cylinder(radius=0.3, slices=16)
+
+    def test_progress(self):
+        reports = []
+        c = self.a.subtract(self.b, progress=reports.append)
+        self.assertEqual(c.digest(), self.a.subtract(self.b).digest())
+        phases = [stats['phase'] for stats in reports]
+        # the operands' trees are built first
+        self.assertEqual(phases[0], 'build')
+        self.assertTrue('clipTo' in phases)
+        self.assertEqual(phases[-1], 'done')
+        stats = reports[-1]
+        self.assertEqual(stats['op'], 'subtract')
+        self.assertTrue(stats['built'] >= len(self.a.polygons) + len(self.b.polygons))
+        self.assertTrue(stats['nodes'] > 0 and stats['clipped'] > 0)
+        self.assertEqual(monitor.current(), None)
+
+    def test_cancel(self):
+        digests = (self.a.digest(), self.b.digest())
+        token = CancelToken()
+        token.cancel()
+        self.assertRaises(Cancelled, self.a.subtract, self.b, token=token)
+        # cancelled from the progress callback
+        token = CancelToken()
+        def progress(stats):
+            if stats['phase'] == 'build':
+                token.cancel()
+        try:
+            self.a.union(self.b, progress=progress, token=token)
+            self.fail('union was not cancelled')
+        except Cancelled as e:
+            self.assertFalse(isinstance(e, BudgetExceeded))
+            self.assertEqual(e.stats['op'], 'union')
+            self.assertEqual(e.stats['phase'], 'build')
+            self.assertTrue(e.stats['built'] > 0)
+        # the operands can be used again
+        self.assertEqual(monitor.current(), None)
+        self.assertEqual((self.a.digest(), self.b.digest()), digests)
+        self.assertEqual(len(self.a.union(self.b).polygons),
+                         len(self.a.union(self.b, token=CancelToken()).polygons))
+
+    def test_budget(self):
+        try:
+            self.a.intersect(self.b, budget=Budget(polygons=100))
+            self.fail('intersect did not run out of polygons')
+        except BudgetExceeded as e:
+            self.assertEqual(e.limit, 'polygons')
+            self.assertTrue(e.stats['built'] + e.stats['clipped'] > 100)
+        try:
+            self.a.intersect(self.b, budget=Budget(seconds=0.))
+            self.fail('intersect did not run out of time')
+        except BudgetExceeded as e:
+            self.assertEqual(e.limit, 'seconds')
+        self.a.intersect(self.b, budget=Budget(seconds=60., polygons=10 ** 6))
+        # the unions of unionAll() share one budget
+        parts = [CSG.cube(center=[0.5 * i, 0., 0.]) for i in range(8)]
+        stats = []
+        CSG.unionAll(parts, progress=stats.append)
+        total = stats[-1]['built'] + stats[-1]['clipped']
+        self.assertEqual(stats[-1]['op'], 'unionAll')
+        CSG.unionAll(parts, budget=Budget(polygons=total))
+        self.assertRaises(BudgetExceeded, CSG.unionAll, parts,
+                          budget=Budget(polygons=total - 1))
+        self.assertRaises(BudgetExceeded, CSG.cube().subtractAll, parts[1:],
+                          budget=Budget(polygons=10))
+        self.assertEqual(monitor.current(), None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.getcwd())
+
+from csg.core import CSG
+from csg import parallel
+
+class TestParallel(unittest.TestCase):
+    def tree(self):
+        return ('subtract',
+                ('union', CSG.cube(), CSG.sphere(center=[1., 0., 0.],
+                                                 slices=8, stacks=4)),
+                ('union', CSG.cylinder(radius=0.3, slices=8),
+                          CSG.cylinder(start=[-2., 0., 0.], end=[2., 0., 0.],
+                                       radius=0.2, slices=8)),
+                CSG.cube([0., 1., 0.], 0.5).toMesh())
+
+    def polygons(self, csg):
+        return [([tuple(v.pos) for v in p.vertices], tuple(p.plane.normal),
+                 p.plane.w) for p in csg.polygons]
+
+    def test_serialMatchesParallel(self):
+        serial = parallel.evaluate(self.tree(), workers=1)
+        a = self.tree()
+        b = a[1][1].union(a[1][2]).subtract(a[2][1].union(a[2][2])).subtract(a[3])
+        self.assertEqual(self.polygons(serial), self.polygons(b))
+        self.assertEqual(self.polygons(parallel.evaluate(self.tree(), workers=2)),
+                         self.polygons(serial))
+
+    def test_unknownOperation(self):
+        self.assertRaises(ValueError, parallel.evaluate,
+                          ('xor', CSG.cube(), CSG.cube()), 1)
+        self.assertRaises(ValueError, parallel.evaluate, (), 1)
+        self.assertRaises(ValueError, parallel.evaluate,
+                          ('union', CSG.cube(), 'cube'), 1)
+
+    def test_bareSolid(self):
+        a = CSG.cube()
+        for workers in (1, 2):
+            b = parallel.evaluate(a, workers)
+            self.assertFalse(b is a)
+            self.assertEqual(self.polygons(b), self.polygons(a))
+        self.assertEqual(self.polygons(parallel.evaluate(a.toMesh(), 1)),
+                         self.polygons(a))
+
+if __name__ == '__main__':
+    unittest.main()
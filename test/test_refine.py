@@ -5,7 +5,23 @@ import unittest
 sys.path.insert(0, os.getcwd())
 
 from csg.core import CSG
-from csg.geom import Vector
+from csg.geom import Polygon, Vector, Vertex
+
+class CVertex(Vertex):
+    # a vertex with a color, which refine() must interpolate
+    __slots__ = ('color',)
+
+    def __init__(self, pos, normal=None, color=0.):
+        Vertex.__init__(self, pos, normal)
+        self.color = color
+
+    def clone(self):
+        return CVertex(self.pos.clone(), self.normal.clone(), self.color)
+
+    def interpolate(self, other, t):
+        return CVertex(self.pos.lerp(other.pos, t),
+                       self.normal.lerp(other.normal, t),
+                       self.color + (other.color - self.color) * t)
 
 class TestCSG(unittest.TestCase):
     def setUp(self):
@@ -28,5 +44,67 @@ class TestCSG(unittest.TestCase):
         d = c.refine().refine()
         d.saveVTK('test_cube_union_refined_2x.vtk')
 
+    def test_levels(self):
+        a = CSG.sphere(slices=8, stacks=4) - CSG.cylinder(radius=0.3, slices=8)
+        b = a.refine().refine()
+        c = a.refine(levels=2)
+        self.assertEqual(len(c.polygons), len(b.polygons))
+        for p, q in zip(b.polygons, c.polygons):
+            self.assertEqual(len(p.vertices), len(q.vertices))
+            for u, v in zip(p.vertices, q.vertices):
+                self.assertAlmostEqual(u.pos.minus(v.pos).length(), 0.)
+                self.assertAlmostEqual(u.normal.minus(v.normal).length(), 0.)
+            self.assertAlmostEqual(p.plane.normal.dot(q.plane.normal), 1.)
+            self.assertAlmostEqual(p.plane.w, q.plane.w)
+        self.assertEqual(len(a.refine(levels=0).polygons), len(a.polygons))
+
+    def test_sharedEdges(self):
+        # the faces of a refined cube are closed grids of n x n quads, which
+        # have 6 * n ** 2 + 2 vertices when every edge has a single midpoint
+        for levels in (1, 2, 3):
+            n = 2 ** levels
+            a = CSG.cube().refine(levels=levels)
+            self.assertEqual(len(a.polygons), 6 * n * n)
+            self.assertEqual(len(set(id(v) for p in a.polygons
+                                     for v in p.vertices)), 6 * n * n + 2)
+        # vertices without a normal give midpoints and centers without one
+        polygons = CSG.cube().clone().polygons
+        for v in polygons[0].vertices:
+            v.normal = None
+        b = CSG.fromPolygons(polygons).refine()
+        self.assertEqual(set(v.normal for p in b.polygons[:4]
+                             for v in p.vertices), set([None]))
+        self.assertTrue(all(v.normal is not None for p in b.polygons[4:]
+                            for v in p.vertices))
+
+    def test_customVertex(self):
+        a = CSG.sphere(slices=8, stacks=4)
+        vertices = {}
+        for poly in a.polygons:
+            for v in poly.vertices:
+                vertices[id(v)] = CVertex(v.pos, v.normal, v.pos.z)
+        polygons = [Polygon([vertices[id(v)] for v in poly.vertices],
+                            poly.shared) for poly in a.polygons]
+        b = CSG.fromPolygons(polygons).refine(levels=2)
+        c = a.refine(levels=2)
+        self.assertEqual(len(b.polygons), len(c.polygons))
+        for p, q in zip(b.polygons, c.polygons):
+            for u, v in zip(p.vertices, q.vertices):
+                self.assertTrue(isinstance(u, CVertex))
+                self.assertAlmostEqual(u.pos.minus(v.pos).length(), 0.)
+                self.assertAlmostEqual(u.normal.minus(v.normal).length(), 0.)
+        # the colors, which start as z, are interpolated like the positions,
+        # and the middle point of an edge is shared by the polygons on both sides
+        for poly in b.polygons:
+            for v in poly.vertices:
+                self.assertAlmostEqual(v.color, v.pos.z)
+        edges = set()
+        for poly in polygons:
+            ids = [id(v) for v in poly.vertices]
+            edges.update(frozenset(e) for e in zip(ids, ids[1:] + ids[:1]))
+        d = CSG.fromPolygons(polygons).refine()
+        self.assertEqual(len(set(id(v) for p in d.polygons for v in p.vertices)),
+                         len(vertices) + len(edges) + len(polygons))
+
 if __name__ == '__main__':
     unittest.main()